@@ -5,28 +5,59 @@ Collects the following from beanstalkd:
     - Server statistics via the 'stats' command
     - Per tube statistics via the 'stats-tube' command
 
-#### Dependencies
-
- * beanstalkc
+The connection is kept open between runs, and the 'stats-tube' commands for
+all tubes are sent together.
 
 """
 
-import diamond.collector
+import socket
 
-try:
-    import beanstalkc
-    beanstalkc  # workaround for pyflakes issue #13
-except ImportError:
-    beanstalkc = None
+import diamond.collector
+from diamond.socketclient import SocketClient
+
+
+def parse_yaml(data):
+    """
+    Parse the YAML dicts and lists of strings beanstalkd answers with
+    """
+    lines = data.splitlines()
+    if lines and lines[0] == '---':
+        lines = lines[1:]
+    if lines and lines[0].startswith('- '):
+        return [line[2:] for line in lines]
+
+    result = {}
+    for line in lines:
+        key, sep, value = line.partition(': ')
+        if not sep:
+            continue
+        if value.startswith('"'):
+            result[key] = value.strip('"')
+            continue
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        result[key] = value
+    return result
 
 
 class BeanstalkdCollector(diamond.collector.Collector):
+    def __init__(self, *args, **kwargs):
+        super(BeanstalkdCollector, self).__init__(*args, **kwargs)
+        self.client = SocketClient(self.config['host'],
+                                   int(self.config['port']),
+                                   self.config['timeout'])
+
     def get_default_config_help(self):
         config_help = super(BeanstalkdCollector,
                             self).get_default_config_help()
         config_help.update({
             'host': 'Hostname',
             'port': 'Port',
+            'timeout': 'Seconds to wait for beanstalkd to answer',
         })
         return config_help
 
@@ -39,41 +70,56 @@ class BeanstalkdCollector(diamond.collector.Collector):
             'path':     'beanstalkd',
             'host':     'localhost',
             'port':     11300,
+            'timeout':  5,
         })
         return config
 
+    def _read_yaml(self, client):
+        """
+        Read an 'OK <bytes>' response, returning the parsed YAML body, or
+        None for any other response
+        """
+        status = client.read_line().split()
+        if status[:1] != ['OK']:
+            return None
+        data = client.read_exactly(int(status[1]) + 2)
+        return parse_yaml(data[:-2])
+
     def _get_stats(self):
         stats = {}
-        try:
-            connection = beanstalkc.Connection(self.config['host'],
-                                               self.config['port'])
-        except beanstalkc.BeanstalkcException, e:
-            self.log.error("Couldn't connect to beanstalkd: %s", e)
-            return {}
+        client = self.client
 
-        stats['instance'] = connection.stats()
-        stats['tubes'] = []
+        def read(count):
+            return lambda client: [self._read_yaml(client)
+                                   for i in range(count)]
 
-        for tube in connection.tubes():
-            tube_stats = connection.stats_tube(tube)
-            stats['tubes'].append(tube_stats)
+        try:
+            stats['instance'], tubes = client.request(
+                'stats\r\nlist-tubes\r\n', read(2))
+            if stats['instance'] is None or tubes is None:
+                raise ValueError('unexpected response')
+            # A tube may be gone by the time it is asked for
+            stats['tubes'] = [tube_stats for tube_stats in client.request(
+                ''.join('stats-tube %s\r\n' % tube for tube in tubes),
+                read(len(tubes))) if tube_stats is not None]
+        except (socket.error, IndexError, ValueError), e:
+            self.log.error("Couldn't get stats from beanstalkd: %s", e)
+            return {}
 
         return stats
 
     def collect(self):
-        if beanstalkc is None:
-            self.log.error('Unable to import beanstalkc')
-            return {}
-
         info = self._get_stats()
+        if not info:
+            return
 
         for stat, value in info['instance'].items():
-            if stat != 'version':
+            if stat != 'version' and not isinstance(value, basestring):
                 self.publish(stat, value)
 
         for tube_stats in info['tubes']:
             tube = tube_stats['name']
             for stat, value in tube_stats.items():
-                if stat != 'name':
+                if stat != 'name' and not isinstance(value, basestring):
                     self.publish('tubes.%s.%s' % (tube, stat), value,
                                  metric_type='GAUGE')
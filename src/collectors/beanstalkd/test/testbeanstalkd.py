@@ -5,26 +5,15 @@
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
-from test import run_only
 from mock import Mock
 from mock import patch
 
 from diamond.collector import Collector
-from beanstalkd import BeanstalkdCollector
+from beanstalkd import BeanstalkdCollector, parse_yaml
 
 ################################################################################
 
 
-def run_only_if_beanstalkc_is_available(func):
-    try:
-        import beanstalkc
-        beanstalkc  # workaround for pyflakes issue #13
-    except ImportError:
-        beanstalkc = None
-    pred = lambda: beanstalkc is not None
-    return run_only(func, pred)
-
-
 class TestBeanstalkdCollector(CollectorTestCase):
     def setUp(self):
         config = get_collector_config('BeanstalkdCollector', {
@@ -37,7 +26,15 @@ class TestBeanstalkdCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(BeanstalkdCollector)
 
-    @run_only_if_beanstalkc_is_available
+    def test_should_parse_yaml(self):
+        self.assertEqual(parse_yaml('---\n- default\n- jobs\n'),
+                         ['default', 'jobs'])
+        self.assertEqual(parse_yaml('---\nname: default\n'
+                                    'current-jobs-ready: 3\n'
+                                    'rusage-utime: 0.5\nversion: "1.10"\n'),
+                         {'name': 'default', 'current-jobs-ready': 3,
+                          'rusage-utime': 0.5, 'version': '1.10'})
+
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
         stats = {
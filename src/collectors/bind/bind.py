@@ -11,8 +11,9 @@ Collects stats from bind 9.5's statistics server
 """
 
 import diamond.collector
+import diamond.httpclient
 import sys
-import urllib2
+from StringIO import StringIO
 
 if sys.version_info >= (2, 5):
     import xml.etree.cElementTree as ElementTree
@@ -23,6 +24,10 @@ else:
 
 class BindCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(BindCollector, self).__init__(config, handlers)
+        self.client = None
+
     def get_default_config_help(self):
         config_help = super(BindCollector, self).get_default_config_help()
         config_help.update({
@@ -74,14 +79,16 @@ class BindCollector(diamond.collector.Collector):
         self.publish(name, value)
 
     def collect(self):
+        if self.client is None:
+            self.client = diamond.httpclient.get_client(self.config)
         try:
-            req = urllib2.urlopen('http://%s:%d/' % (
+            response = self.client.get('http://%s:%d/' % (
                 self.config['host'], int(self.config['port'])))
         except Exception, e:
             self.log.error('Couldnt connect to bind: %s', e)
             return {}
 
-        tree = ElementTree.parse(req)
+        tree = ElementTree.parse(StringIO(response.read()))
 
         if not tree:
             raise ValueError("Corrupt XML file, no statistics found")
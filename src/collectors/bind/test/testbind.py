@@ -27,12 +27,12 @@ class TestBindCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen', Mock(
-            return_value=self.getFixture('bind.xml')))
+        patch_get = patch('diamond.httpclient.HTTPClient.get', Mock(
+            return_value=self.getResponse('bind.xml')))
 
-        patch_urlopen.start()
+        patch_get.start()
         self.collector.collect()
-        patch_urlopen.stop()
+        patch_get.stop()
 
         metrics = {
             'view._default.resstat.Queryv4': 0.000000,
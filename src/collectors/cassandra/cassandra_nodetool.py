@@ -1,23 +1,135 @@
 """
 Collects data from Cassandra through the nodetool command-line interface
 
+Every nodetool run starts a JVM, so with *jolokia_url* set (for example
+http://localhost:8778/jolokia/) the same netstats, tpstats, info and cfstats
+metrics are instead read from the Jolokia agent running inside Cassandra, in
+one bulk request over a kept alive connection. The estimated number of keys
+of each column family is only published by nodetool.
+
 #### Dependencies
 
- * re
- * subprocess
+ * nodetool, or the Jolokia agent
 
 """
 
+try:
+    import json
+    json  # workaround for pyflakes issue #13
+except ImportError:
+    import simplejson as json
+
 import diamond.collector
-import subprocess
+import diamond.httpclient
 import re
 
+KEY_VALUE_RE = re.compile(r"\s*([^:]+\S)\s*:\s+(.*)")
+NUMBER_RE = re.compile(r"(\d+)")
+COLUMN_SEPARATOR_RE = re.compile(r"\s{2,}")
+
+CACHE_REGEXES = {
+    ".size": re.compile(r"size (\d+) \(bytes\)"),
+    ".capacity": re.compile(r"capacity (\d+) \(bytes\)"),
+    ".hits": re.compile(r"(\d+) hits"),
+    ".requests": re.compile(r"(\d+) requests"),
+    ".recent hit rate": re.compile(r"([\d\.]+) recent hit rate"),
+}
+
+INFO_REGEXES = {
+    "Load": {"_GB": re.compile(r"([\d\.]+) GB")},
+    "Heap Memory (MB)": {"": re.compile(r"([\d\.]+) / [\d\.]+")},
+    "Key Cache": CACHE_REGEXES,
+    "Row Cache": CACHE_REGEXES,
+}
+
+TPSTATS_HEADER_RE = re.compile("^(Message type|Pool Name)", re.IGNORECASE)
+
+CFSTATS_KEYS = ["Read Count", "Read Latency", "Write Count",
+                "Write Latency", "SSTable count", "Space used (total)",
+                "Number of Keys (estimate)", "Pending Tasks"]
+
+EXCLUDED_KEYSPACES = ["OpsCenter", "system"]
+
+# MBean attributes read through Jolokia, and the nodetool names they are
+# published under
+TPSTATS_ATTRIBUTES = {
+    "ActiveCount": "Active",
+    "PendingTasks": "Pending",
+    "CompletedTasks": "Completed",
+    "CurrentlyBlockedTasks": "Blocked",
+    "TotalBlockedTasks": "All time blocked",
+}
+
+NETSTATS_ATTRIBUTES = {
+    "CommandPendingTasks": "Commands.Pending",
+    "CommandCompletedTasks": "Commands.Completed",
+    "ResponsePendingTasks": "Responses.Pending",
+    "ResponseCompletedTasks": "Responses.Completed",
+}
+
+CACHE_ATTRIBUTES = {
+    "Size": ".size",
+    "CapacityInBytes": ".capacity",
+    "Hits": ".hits",
+    "Requests": ".requests",
+    "RecentHitRate": ".recent hit rate",
+}
+
+CFSTATS_ATTRIBUTES = {
+    "ReadCount": "Read Count",
+    "WriteCount": "Write Count",
+    "LiveSSTableCount": "SSTable count",
+    "TotalDiskSpaceUsed": "Space used (total)",
+    "PendingTasks": "Pending Tasks",
+}
+
+# Latencies are read in microseconds and published in milliseconds
+CFSTATS_LATENCY_ATTRIBUTES = {
+    "RecentReadLatencyMicros": "Read Latency",
+    "RecentWriteLatencyMicros": "Write Latency",
+}
+
+JOLOKIA_READS = [
+    ("org.apache.cassandra.request:type=*", TPSTATS_ATTRIBUTES.keys()),
+    ("org.apache.cassandra.internal:type=*", TPSTATS_ATTRIBUTES.keys()),
+    ("org.apache.cassandra.net:type=MessagingService",
+     NETSTATS_ATTRIBUTES.keys()),
+    ("org.apache.cassandra.db:type=StorageService", ["Load"]),
+    ("java.lang:type=Memory", ["HeapMemoryUsage"]),
+    ("org.apache.cassandra.db:type=Caches",
+     ["KeyCache" + a for a in CACHE_ATTRIBUTES]
+     + ["RowCache" + a for a in CACHE_ATTRIBUTES]),
+    ("org.apache.cassandra.db:type=ColumnFamilies,keyspace=*,columnfamily=*",
+     CFSTATS_ATTRIBUTES.keys() + CFSTATS_LATENCY_ATTRIBUTES.keys()),
+]
+
+
+def mbean_properties(mbean):
+    """
+    Returns the key properties of an MBean name as a dict
+    """
+    properties = {}
+    for prop in mbean.split(":", 1)[-1].split(","):
+        if "=" in prop:
+            key, value = prop.split("=", 1)
+            properties[key] = value
+    return properties
+
+
 class CassandraNodetoolCollector(diamond.collector.Collector):
+
+    def __init__(self, *args, **kwargs):
+        super(CassandraNodetoolCollector, self).__init__(*args, **kwargs)
+        self.client = None
+
     def get_default_config_help(self):
-        config_help = super(CassandraNodetoolCollector, self).get_default_config_help()
+        config_help = super(CassandraNodetoolCollector,
+                            self).get_default_config_help()
         config_help.update({
-            'nodetool' : 'path to nodetool',
-            'host' : 'host to run nodetool against'
+            'nodetool': 'path to nodetool',
+            'host': 'host to run nodetool against',
+            'jolokia_url': 'URL of the Jolokia agent to read metrics from'
+                           ' instead of running nodetool',
         })
         return config_help
 
@@ -26,103 +138,227 @@ class CassandraNodetoolCollector(diamond.collector.Collector):
         Returns the default collector settings
         """
         config = super(CassandraNodetoolCollector, self).get_default_config()
-        config.update(  {
+        config.update({
             'nodetool': 'nodetool',
-            'host': 'localhost'
-        } )
+            'host': 'localhost',
+            'jolokia_url': '',
+        })
         return config
 
+    def nodetool(self, node_tool_command):
+        """
+        Returns the output lines of a nodetool command
+        """
+        command = [self.config.get("nodetool"), "-h", self.config.get("host"),
+                   node_tool_command]
+        result = self.run_command(command,
+                                  name="nodetool." + node_tool_command)
+        if result.returncode:
+            raise OSError("%s exited with %d: %s" % (" ".join(command),
+                          result.returncode, result.stderr.strip()))
+        return result.stdout.splitlines()
+
     def sanitize(self, key):
         return key.replace(" ", "_").replace("(", "").replace(")", "")
-        
+
     def publish_if_number(self, key, value):
         try:
             number = float(value)
             self.publish(self.sanitize(key), number)
-        except ValueError:
+        except (TypeError, ValueError):
             return
-            
+
     def row_header_is_line(self, line_num):
         return lambda n, line: n == line_num
-            
+
     def row_header_matches(self, regex):
-        return lambda n, line: line is not None and regex.match(line) is not None
-            
+        return lambda n, line: (line is not None
+                                and regex.match(line) is not None)
+
     def parse_space_seperated(self, lines, prefex, row_header_fn, skip_lines):
+        column_headers = []
         for row_index in range(len(lines)):
             if row_index in skip_lines:
                 continue
-            
+
             line = lines[row_index]
-            words = re.split('\s{2,}', line)
+            words = COLUMN_SEPARATOR_RE.split(line)
             if row_header_fn(row_index, line):
                 column_headers = words[1:]
                 continue
-            
+
             if len(words) == (1 + len(column_headers)):
                 row_header = words[0]
                 for i in range(len(column_headers)):
-                    yield ".".join((prefex, row_header, column_headers[i])), words[1 + i]
+                    yield (".".join((prefex, row_header, column_headers[i])),
+                           words[1 + i])
 
-    def publish_tabular_stats(self, node_tool_command, row_header_fn = lambda n, line: n == 0, skip_lines = []):
-        nodetool = self.config.get("nodetool")
-        host = self.config.get("host")
-        lines = subprocess.check_output([nodetool, "-h", host, node_tool_command]).splitlines()
-        for key, value in self.parse_space_seperated(lines, node_tool_command, row_header_fn, skip_lines):
+    def publish_tabular_stats(self, node_tool_command,
+                              row_header_fn=lambda n, line: n == 0,
+                              skip_lines=[]):
+        lines = self.nodetool(node_tool_command)
+        for key, value in self.parse_space_seperated(
+                lines, node_tool_command, row_header_fn, skip_lines):
             self.publish_if_number(key, value)
 
-    def publish_columnar_stats(self, node_tool_command, regex="\s*([^:]+\S)\s*:\s+(.*)", value_regexes_by_key={}):
-        nodetool = self.config.get("nodetool")
-        host = self.config.get("host")
-        lines = subprocess.check_output([nodetool, "-h", host, node_tool_command]).splitlines()
+    def publish_columnar_stats(self, node_tool_command, regex=KEY_VALUE_RE,
+                               value_regexes_by_key={}):
+        lines = self.nodetool(node_tool_command)
         for line in lines:
-            m = re.match(regex, line)
+            m = regex.match(line)
             if m and len(m.groups()) == 2:
-                key = m.groups()[0]
-                value = m.groups()[1]
+                key, value = m.groups()
                 if key in value_regexes_by_key:
-                    for suffix, value_regex in value_regexes_by_key[key].iteritems():
-                        m2 = re.search(value_regex, value)
+                    for suffix, value_regex in \
+                            value_regexes_by_key[key].iteritems():
+                        m2 = value_regex.search(value)
                         if m2:
-                            self.publish_if_number(node_tool_command + "." + key + suffix, m2.groups()[0])
+                            self.publish_if_number(
+                                node_tool_command + "." + key + suffix,
+                                m2.groups()[0])
                 else:
-                    self.publish_if_number(node_tool_command + "." + key, value)
+                    self.publish_if_number(node_tool_command + "." + key,
+                                           value)
 
-    def publish_list_stats(self, node_tool_command, regex="\s*([^:]+\S)\s*:\s+(.*)", numeric_value_regex = "(\d+)", key_prefex_headers=[], key_includes=None, key_excludes=None, prefex_value_excludes=None):
-        nodetool = self.config.get("nodetool")
-        host = self.config.get("host")
-        lines = subprocess.check_output([nodetool, "-h", host, node_tool_command]).splitlines()
+    def publish_list_stats(self, node_tool_command, regex=KEY_VALUE_RE,
+                           numeric_value_regex=NUMBER_RE,
+                           key_prefex_headers=[], key_includes=None,
+                           key_excludes=None, prefex_value_excludes=None):
+        lines = self.nodetool(node_tool_command)
         prefexes = []
         for line in lines:
-            m = re.match(regex, line)
+            m = regex.match(line)
             if m and len(m.groups()) == 2:
-                key = m.groups()[0]
-                value = m.groups()[1]
+                key, value = m.groups()
                 if key in key_prefex_headers:
                     prefex_index = key_prefex_headers.index(key)
                     prefexes = prefexes[:prefex_index] + [value]
                     continue
-                
+
                 if key_includes is not None and key not in key_includes:
                     continue
                 if key_excludes is not None and key in key_excludes:
                     continue
-                
-                if prefex_value_excludes is not None and len(set(prefex_value_excludes).intersection(set(prefexes))) > 0:
+
+                if (prefex_value_excludes is not None
+                        and set(prefex_value_excludes).intersection(
+                            prefexes)):
                     continue
-                
-                m2 = re.search(numeric_value_regex, value)
+
+                m2 = numeric_value_regex.search(value)
                 if m2:
                     value = m2.groups()[0]
-                self.publish_if_number(".".join([node_tool_command] + prefexes + [key]), value)
+                self.publish_if_number(
+                    ".".join([node_tool_command] + prefexes + [key]), value)
+
+    def collect_nodetool(self):
+        self.publish_tabular_stats(
+            "netstats", skip_lines=[0, 1, 2],
+            row_header_fn=self.row_header_is_line(3))
+        self.publish_tabular_stats(
+            "tpstats", row_header_fn=self.row_header_matches(
+                TPSTATS_HEADER_RE))
+        self.publish_columnar_stats("info",
+                                    value_regexes_by_key=INFO_REGEXES)
+        self.publish_list_stats(
+            "cfstats", key_prefex_headers=["Keyspace", "Column Family"],
+            key_includes=CFSTATS_KEYS,
+            prefex_value_excludes=EXCLUDED_KEYSPACES)
+
+    def read_jolokia(self):
+        """
+        Returns {mbean: {attribute: value}} for the MBeans of JOLOKIA_READS,
+        read in one bulk request
+        """
+        if self.client is None:
+            self.client = diamond.httpclient.get_client(self.config)
+        requests = [{"type": "read", "mbean": mbean, "attribute": attributes}
+                    for mbean, attributes in JOLOKIA_READS]
+        response = self.client.request(
+            "POST", self.config['jolokia_url'], body=json.dumps(requests),
+            headers={"Content-Type": "application/json"})
+
+        mbeans = {}
+        for result in response.json():
+            if result.get("status") != 200:
+                self.log.debug("Jolokia could not read %s: %s",
+                               result.get("request", {}).get("mbean"),
+                               result.get("error"))
+                continue
+            mbean = result["request"]["mbean"]
+            if "*" in mbean:
+                mbeans.update(result["value"])
+            else:
+                mbeans[mbean] = result["value"]
+        return mbeans
+
+    def publish_jolokia_stats(self, mbeans):
+        """
+        Publish the MBeans read by read_jolokia() under the names nodetool
+        output is published under
+        """
+        for mbean, values in mbeans.iteritems():
+            domain = mbean.split(":", 1)[0]
+            properties = mbean_properties(mbean)
+            kind = properties.get("type")
+
+            if domain in ("org.apache.cassandra.request",
+                          "org.apache.cassandra.internal"):
+                for attribute, name in TPSTATS_ATTRIBUTES.iteritems():
+                    self.publish_if_number(
+                        "tpstats.%s.%s" % (kind, name), values.get(attribute))
+
+            elif kind == "MessagingService":
+                for attribute, name in NETSTATS_ATTRIBUTES.iteritems():
+                    value = values.get(attribute)
+                    # Per peer in some versions, totalled by nodetool
+                    if isinstance(value, dict):
+                        value = sum(value.values())
+                    self.publish_if_number("netstats." + name, value)
+
+            elif kind == "StorageService":
+                load = values.get("Load")
+                if load is not None:
+                    self.publish_if_number("info.Load_GB",
+                                           float(load) / 1024 ** 3)
+
+            elif mbean == "java.lang:type=Memory":
+                heap = values.get("HeapMemoryUsage") or {}
+                if heap.get("used") is not None:
+                    self.publish_if_number("info.Heap Memory (MB)",
+                                           float(heap["used"]) / 1024 ** 2)
+
+            elif kind == "Caches":
+                for cache, name in (("KeyCache", "Key Cache"),
+                                    ("RowCache", "Row Cache")):
+                    for attribute, suffix in CACHE_ATTRIBUTES.iteritems():
+                        self.publish_if_number(
+                            "info." + name + suffix,
+                            values.get(cache + attribute))
+
+            elif kind == "ColumnFamilies":
+                keyspace = properties.get("keyspace")
+                if keyspace in EXCLUDED_KEYSPACES:
+                    continue
+                prefix = "cfstats.%s.%s." % (keyspace,
+                                             properties.get("columnfamily"))
+                for attribute, name in CFSTATS_ATTRIBUTES.iteritems():
+                    self.publish_if_number(prefix + name,
+                                           values.get(attribute))
+                for attribute, name in \
+                        CFSTATS_LATENCY_ATTRIBUTES.iteritems():
+                    latency = values.get(attribute)
+                    # NaN until the column family has been read from
+                    if isinstance(latency, (int, long, float)):
+                        self.publish_if_number(prefix + name,
+                                               latency / 1000.0)
 
     def collect(self):
         try:
-            self.publish_tabular_stats("netstats", skip_lines = [0,1,2], row_header_fn=self.row_header_is_line(3))
-            self.publish_tabular_stats("tpstats", row_header_fn=self.row_header_matches(re.compile("^(Message type|Pool Name)", re.IGNORECASE)))
-            cache_regexes = { ".size": "size (\d+) \(bytes\)", ".capacity": "capacity (\d+) \(bytes\)", ".hits": "(\d+) hits", ".requests": "(\d+) requests", ".recent hit rate": "([\d\.]+) recent hit rate" }
-            self.publish_columnar_stats("info", value_regexes_by_key={"Load" : { "_GB": "([\d\.]+) GB" }, "Heap Memory (MB)" : { "": "([\d\.]+) / [\d\.]+" }, "Key Cache" : cache_regexes, "Row Cache" : cache_regexes })
-            self.publish_list_stats("cfstats", key_prefex_headers=["Keyspace", "Column Family"], key_includes=["Read Count", "Read Latency", "Write Count", "Write Latency", "SSTable count", "Space used (total)", "Number of Keys (estimate)", "Pending Tasks"], prefex_value_excludes=["OpsCenter", "system"])
+            if self.config['jolokia_url']:
+                self.publish_jolokia_stats(self.read_jolokia())
+            else:
+                self.collect_nodetool()
 
         except Exception, e:
             self.log.error('Couldnt connect to cassandra nodetool %s', e)
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+from test import CollectorTestCase
+from test import get_collector_config
+from test import unittest
+from mock import Mock
+from mock import patch
+
+from diamond.collector import Collector
+from diamond.httpclient import HTTPResponse
+from cassandra_nodetool import CassandraNodetoolCollector
+from cassandra_nodetool import TPSTATS_HEADER_RE
+
+################################################################################
+
+
+class TestCassandraNodetoolCollector(CollectorTestCase):
+
+    def setUp(self):
+        config = get_collector_config('CassandraNodetoolCollector', {})
+        self.collector = CassandraNodetoolCollector(config, None)
+
+    def test_import(self):
+        self.assertTrue(CassandraNodetoolCollector)
+
+    @patch.object(Collector, 'publish')
+    def test_should_work_with_nodetool_output(self, publish_mock):
+        with patch.object(self.collector, 'nodetool',
+                          Mock(return_value=self.getFixture(
+                              'tpstats').getvalue().splitlines())):
+            self.collector.publish_tabular_stats(
+                "tpstats", row_header_fn=self.collector.row_header_matches(
+                    TPSTATS_HEADER_RE))
+
+        self.assertPublishedMany(publish_mock, {
+            'tpstats.ReadStage.Active': 1,
+            'tpstats.ReadStage.Pending': 2,
+            'tpstats.ReadStage.Completed': 1500,
+            'tpstats.ReadStage.All_time_blocked': 0,
+            'tpstats.MutationStage.Completed': 3000,
+            'tpstats.READ.Dropped': 7,
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_work_with_jolokia(self, publish_mock):
+        config = get_collector_config('CassandraNodetoolCollector', {
+            'jolokia_url': 'http://localhost:8778/jolokia/',
+        })
+        collector = CassandraNodetoolCollector(config, None)
+        collector.client = Mock()
+        collector.client.request.return_value = HTTPResponse(
+            200, 'OK', {}, self.getFixture('jolokia.json').getvalue())
+
+        with patch.object(collector, 'nodetool') as nodetool:
+            collector.collect()
+        self.assertFalse(nodetool.called)
+
+        args, kwargs = collector.client.request.call_args
+        self.assertEquals(args, ('POST', 'http://localhost:8778/jolokia/'))
+
+        published = [c[0][0] for c in publish_mock.call_args_list]
+        self.assertFalse('cfstats.app.users.Write_Latency' in published)
+        self.assertFalse('cfstats.system.peers.Read_Count' in published)
+
+        self.assertPublishedMany(publish_mock, {
+            'tpstats.ReadStage.Active': 1,
+            'tpstats.ReadStage.Pending': 2,
+            'tpstats.ReadStage.Completed': 1500,
+            'tpstats.ReadStage.All_time_blocked': 0,
+            'netstats.Commands.Pending': 3,
+            'netstats.Commands.Completed': 42,
+            'info.Load_GB': 1.5,
+            'info.Heap_Memory_MB': 500,
+            'info.Key_Cache.hits': 90,
+            'info.Key_Cache.recent_hit_rate': 0.9,
+            'cfstats.app.users.Read_Count': 10,
+            'cfstats.app.users.Read_Latency': 1.5,
+            'cfstats.app.users.SSTable_count': 3,
+            'cfstats.app.users.Space_used_total': 4096,
+        })
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
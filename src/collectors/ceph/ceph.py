@@ -6,6 +6,11 @@ The CephCollector collects utilization info from the Ceph storage system.
 Documentation for ceph perf counters:
 http://ceph.com/docs/master/dev/perf_counters/
 
+The counters are read from the admin socket of each daemon directly, the way
+`ceph --admin-daemon <socket> perf dump` does, without starting the ceph
+command line tool. Up to *max_threads* daemons are queried at the same time,
+each given *timeout* seconds to answer.
+
 #### Dependencies
 
  * ceph [http://ceph.com/]
@@ -20,13 +25,17 @@ except ImportError:
 
 import glob
 import os
-import subprocess
+import socket
+import struct
 
 import diamond.collector
+from diamond.flatten import PathFilter, flatten
+from diamond.parallel import run_parallel
+from diamond.socketclient import SocketClient
 
 
-def flatten_dictionary(input, sep='.', prefix=None):
-    """Produces iterator of pairs where the first value is
+def flatten_dictionary(input, sep='.', prefix=None, path_filter=None):
+    """Produces a sorted list of pairs where the first value is
     the joined key names and the second value is the value
     associated with the lowest level key. For example::
 
@@ -38,17 +47,16 @@ def flatten_dictionary(input, sep='.', prefix=None):
 
       [('a.b', 10), ('c', 20)]
     """
-    for name, value in sorted(input.items()):
-        fullname = sep.join(filter(None, [prefix, name]))
-        if isinstance(value, dict):
-            for result in flatten_dictionary(value, sep, fullname):
-                yield result
-        else:
-            yield (fullname, value)
+    return sorted(flatten(input, path_filter, prefix, sep))
 
 
 class CephCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(CephCollector, self).__init__(config, handlers)
+        self.path_filter = PathFilter(self.config['include_paths'],
+                                      self.config['exclude_paths'])
+
     def get_default_config_help(self):
         config_help = super(CephCollector, self).get_default_config_help()
         config_help.update({
@@ -58,8 +66,11 @@ class CephCollector(diamond.collector.Collector):
                              ' Defaults to "ceph-"',
             'socket_ext': 'Extension for socket filenames.'
                           ' Defaults to "asok"',
-            'ceph_binary': 'Path to "ceph" executable. '
-                           'Defaults to /usr/bin/ceph.',
+            'timeout': 'Seconds to wait for a daemon to answer',
+            'max_threads': 'Number of daemons queried at the same time',
+            'include_paths': 'Globs of the perf counters to publish, such'
+                             ' as osd.op_* or **.avgcount. Defaults to all.',
+            'exclude_paths': 'Globs of perf counters not to publish',
         })
         return config_help
 
@@ -72,7 +83,10 @@ class CephCollector(diamond.collector.Collector):
             'socket_path': '/var/run/ceph',
             'socket_prefix': 'ceph-',
             'socket_ext': 'asok',
-            'ceph_binary': '/usr/bin/ceph',
+            'timeout': 5,
+            'max_threads': 8,
+            'include_paths': [],
+            'exclude_paths': [],
         })
         return config
 
@@ -94,6 +108,24 @@ class CephCollector(diamond.collector.Collector):
             base = base[len(self.config['socket_prefix']):]
         return 'ceph.' + base
 
+    def _admin_command(self, name, command):
+        """Run a command on the admin socket name and return its output.
+
+        The command is sent as JSON terminated by a NUL byte, and answered
+        with its length as a 32 bit big endian integer followed by the
+        output, after which the daemon closes the connection.
+        """
+        def read(client):
+            length, = struct.unpack('>I', client.read_exactly(4))
+            return client.read_exactly(length)
+
+        client = SocketClient(name, timeout=self.config['timeout'])
+        try:
+            return client.request(json.dumps({'prefix': command}) + '\0',
+                                  read)
+        finally:
+            client.close()
+
     def _get_stats_from_socket(self, name):
         """Return the parsed JSON data returned when ceph is told to
         dump the stats from the named socket.
@@ -102,17 +134,10 @@ class CephCollector(diamond.collector.Collector):
         an empty result set is returned.
         """
         try:
-            json_blob = subprocess.check_output(
-                [self.config['ceph_binary'],
-                 '--admin-daemon',
-                 name,
-                 'perf',
-                 'dump',
-                 ])
-        except subprocess.CalledProcessError, err:
-            self.log.info('Could not get stats from %s: %s',
-                          name, err)
-            self.log.exception('Could not get stats from %s' % name)
+            json_blob = self._admin_command(name, 'perf dump')
+        except (socket.error, struct.error), err:
+            self.log.error('Could not get stats from %s: %s',
+                           name, err)
             return {}
 
         try:
@@ -129,8 +154,9 @@ class CephCollector(diamond.collector.Collector):
         """Given a stats dictionary from _get_stats_from_socket,
         publish the individual values.
         """
-        for stat_name, stat_value in flatten_dictionary(
+        for stat_name, stat_value in flatten(
             stats,
+            self.path_filter,
             prefix=counter_prefix,
         ):
             self.publish(stat_name, stat_value)
@@ -139,9 +165,13 @@ class CephCollector(diamond.collector.Collector):
         """
         Collect stats
         """
-        for path in self._get_socket_paths():
-            self.log.debug('checking %s', path)
+        paths = self._get_socket_paths()
+        results = run_parallel(self._get_stats_from_socket, paths,
+                               int(self.config['max_threads']))
+        for path, stats in zip(paths, results):
+            if isinstance(stats, Exception):
+                self.log.error('Could not get stats from %s: %s',
+                               path, stats)
+                continue
             counter_prefix = self._get_counter_prefix_from_socket_name(path)
-            stats = self._get_stats_from_socket(path)
             self._publish_stats(counter_prefix, stats)
-        return
@@ -7,7 +7,12 @@ try:
 except ImportError:
     import simplejson as json
 
-import subprocess
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
 
 from test import CollectorTestCase
 from test import get_collector_config
@@ -24,11 +29,6 @@ def run_only_if_assertSequenceEqual_is_available(func):
     return run_only(func, pred)
 
 
-def run_only_if_subprocess_check_output_is_available(func):
-    pred = lambda: 'check_output' in dir(subprocess)
-    return run_only(func, pred)
-
-
 class TestCounterIterator(unittest.TestCase):
 
     @run_only_if_assertSequenceEqual_is_available
@@ -136,56 +136,88 @@ class TestCephCollectorGettingStats(CollectorTestCase):
     def test_import(self):
         self.assertTrue(ceph.CephCollector)
 
-    @run_only_if_subprocess_check_output_is_available
-    @patch('subprocess.check_output')
-    def test_load_works(self, check_output):
-        expected = {'a': 1,
-                    'b': 2,
-                    }
-        check_output.return_value = json.dumps(expected)
-        actual = self.collector._get_stats_from_socket('a_socket_name')
-        check_output.assert_called_with(['/usr/bin/ceph',
-                                         '--admin-daemon',
-                                         'a_socket_name',
-                                         'perf',
-                                         'dump',
-                                         ])
-        self.assertEqual(actual, expected)
-
-    @run_only_if_subprocess_check_output_is_available
-    @patch('subprocess.check_output')
-    def test_ceph_command_fails(self, check_output):
-        check_output.side_effect = subprocess.CalledProcessError(
-            255, ['/usr/bin/ceph'], 'error!',
-        )
-        actual = self.collector._get_stats_from_socket('a_socket_name')
-        check_output.assert_called_with(['/usr/bin/ceph',
-                                         '--admin-daemon',
-                                         'a_socket_name',
-                                         'perf',
-                                         'dump',
-                                         ])
+    def serve(self, path, response):
+        """
+        Answer one admin socket command at path with response
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(1)
+        commands = []
+
+        def handle():
+            conn = server.accept()[0]
+            data = ''
+            while not data.endswith('\0'):
+                data += conn.recv(1024)
+            commands.append(json.loads(data[:-1]))
+            if response is not None:
+                conn.sendall(struct.pack('>I', len(response)) + response)
+            conn.close()
+            server.close()
+
+        thread = threading.Thread(target=handle)
+        thread.daemon = True
+        thread.start()
+        return commands
+
+    def test_load_works(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'ceph-osd.0.asok')
+            expected = {'a': 1,
+                        'b': 2,
+                        }
+            commands = self.serve(path, json.dumps(expected))
+            actual = self.collector._get_stats_from_socket(path)
+            self.assertEqual(actual, expected)
+            self.assertEqual(commands, [{'prefix': 'perf dump'}])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_daemon_closes_connection(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'ceph-osd.0.asok')
+            self.serve(path, None)
+            actual = self.collector._get_stats_from_socket(path)
+            self.assertEqual(actual, {})
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_socket_missing(self):
+        actual = self.collector._get_stats_from_socket('/nonexistent.asok')
         self.assertEqual(actual, {})
 
-    @run_only_if_subprocess_check_output_is_available
     @patch('json.loads')
-    @patch('subprocess.check_output')
-    def test_json_decode_fails(self, check_output, loads):
+    @patch.object(ceph.CephCollector, '_admin_command')
+    def test_json_decode_fails(self, admin_command, loads):
         input = {'a': 1,
                  'b': 2,
                  }
-        check_output.return_value = json.dumps(input)
+        admin_command.return_value = json.dumps(input)
         loads.side_effect = ValueError('bad data')
         actual = self.collector._get_stats_from_socket('a_socket_name')
-        check_output.assert_called_with(['/usr/bin/ceph',
-                                         '--admin-daemon',
-                                         'a_socket_name',
-                                         'perf',
-                                         'dump',
-                                         ])
+        admin_command.assert_called_with('a_socket_name', 'perf dump')
         loads.assert_called_with(json.dumps(input))
         self.assertEqual(actual, {})
 
+    @patch.object(Collector, 'publish')
+    @patch.object(ceph.CephCollector, '_get_socket_paths')
+    @patch.object(ceph.CephCollector, '_admin_command')
+    def test_should_collect_all_daemons(self, admin_command, paths,
+                                        publish_mock):
+        paths.return_value = ['/var/run/ceph/ceph-osd.%d.asok' % i
+                              for i in range(3)]
+        admin_command.side_effect = lambda name, command: json.dumps(
+            {'osd': {'op': int(name[-6])}})
+        self.collector.collect()
+        self.assertPublishedMany(publish_mock, {
+            'ceph.osd.0.osd.op': 0,
+            'ceph.osd.1.osd.op': 1,
+            'ceph.osd.2.osd.op': 2,
+        })
+
 
 class TestCephCollectorPublish(CollectorTestCase):
 
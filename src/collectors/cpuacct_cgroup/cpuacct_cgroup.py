@@ -3,22 +3,45 @@
 """
 The CpuAcctCGroupCollector collects CPU Acct metric for cgroups
 
+On a unified (v2) hierarchy user and system are published from the
+user_usec and system_usec entries of cpu.stat, converted to USER_HZ ticks
+like cpuacct.stat.
+
+The list of cgroups is cached and only rediscovered every
+discovery_interval seconds.
+
 #### Dependencies
 
-/sys/fs/cgroup/cpuacct/cpuacct.stat
+/sys/fs/cgroup/cpuacct/cpuacct.stat or /sys/fs/cgroup/**/cpu.stat (v2)
 """
 
 import diamond.collector
+import diamond.cgroup
 import os
 
+# cgroup v2 cpu.stat names of the cpuacct.stat values
+_V2_KEY_MAPPING = {
+    'user_usec': 'user',
+    'system_usec': 'system',
+}
+
 
 class CpuAcctCgroupCollector(diamond.collector.Collector):
     CPUACCT_PATH = '/sys/fs/cgroup/cpuacct/'
+    CGROUP2_PATH = diamond.cgroup.CGROUP2_PATH
+
+    def __init__(self, config, handlers):
+        super(CpuAcctCgroupCollector, self).__init__(config, handlers)
+        self.cgroups = None
 
     def get_default_config_help(self):
         config_help = super(
             CpuAcctCgroupCollector, self).get_default_config_help()
         config_help.update({
+            'discovery_interval': 'Seconds between walks of the cgroup'
+                                  ' hierarchy to find new cgroups',
+            'include': 'Only collect cgroups matching these globs',
+            'exclude': 'Do not collect cgroups matching these globs',
         })
         return config_help
 
@@ -30,32 +53,57 @@ class CpuAcctCgroupCollector(diamond.collector.Collector):
         config.update({
             'path':     'cpuacct',
             'xenfix':   None,
+            'discovery_interval': 300,
+            'include': [],
+            'exclude': [],
         })
         return config
 
+    def get_cgroup_tree(self):
+        """
+        Create the cached cgroup tree, preferring a v1 cpuacct hierarchy
+        """
+        include = self.config['include']
+        if isinstance(include, basestring):
+            include = include.split()
+        exclude = self.config['exclude']
+        if isinstance(exclude, basestring):
+            exclude = exclude.split()
+
+        if (not os.path.exists(self.CPUACCT_PATH)
+                and diamond.cgroup.is_cgroup2(self.CGROUP2_PATH)):
+            root = self.CGROUP2_PATH
+            filenames = ['cpu.stat']
+        else:
+            root = self.CPUACCT_PATH
+            filenames = ['cpuacct.stat']
+
+        return diamond.cgroup.CgroupTree(
+            root, filenames,
+            refresh_interval=self.config['discovery_interval'],
+            include=include, exclude=exclude)
+
     def collect(self):
-        # find all cpuacct.stat files
-        matches = []
-        for root, dirnames, filenames in os.walk(self.CPUACCT_PATH):
-            for filename in filenames:
-                if filename == 'cpuacct.stat':
-                    # matches will contain a tuple contain path to cpuacct.stat
-                    # and the parent of the stat
-                    parent = root.replace(self.CPUACCT_PATH,
-                                          "").replace("/", ".")
-                    if parent == '':
-                        parent = 'system'
-                    matches.append((parent, os.path.join(root, filename)))
+        if self.cgroups is None:
+            self.cgroups = self.get_cgroup_tree()
+        filename = self.cgroups.filenames[0]
 
         # Read utime and stime from cpuacct files
         results = {}
-        for match in matches:
-            results[match[0]] = {}
-            stat_file = open(match[1])
-            elements = [line.split() for line in stat_file]
+        for parent in self.cgroups.get_cgroups().keys():
+            data = self.cgroups.read(parent, filename)
+            if data is None:
+                continue
+            results[parent] = {}
+            elements = [line.split() for line in data.splitlines()]
             for el in elements:
-                results[match[0]][el[0]] = el[1]
-                stat_file.close()
+                if filename == 'cpu.stat':
+                    if el[0] not in _V2_KEY_MAPPING:
+                        continue
+                    results[parent][_V2_KEY_MAPPING[el[0]]] = (
+                        long(el[1]) * os.sysconf('SC_CLK_TCK') / 1000000)
+                else:
+                    results[parent][el[0]] = el[1]
 
         # create metrics from collected utimes and stimes for cgroups
         for parent, cpuacct in results.iteritems():
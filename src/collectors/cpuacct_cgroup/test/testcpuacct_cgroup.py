@@ -60,5 +60,21 @@ class TestCpuAcctCgroupCollector(CollectorTestCase):
             'system.system': 4784004,
         })
 
+    @patch.object(Collector, 'publish')
+    def test_should_work_with_cgroup2_data(self, publish_mock):
+        self.collector.CPUACCT_PATH = fixtures_path + 'missing/'
+        self.collector.CGROUP2_PATH = fixtures_path + 'cgroup2/'
+        with patch('os.sysconf', Mock(return_value=100)):
+            self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'system.user': 2000,
+            'system.system': 1000,
+            'docker.user': 200,
+            'docker.system': 100,
+            'docker.abc.user': 20,
+            'docker.abc.system': 10,
+        })
+
 if __name__ == "__main__":
     unittest.main()
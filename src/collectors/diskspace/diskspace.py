@@ -1,11 +1,11 @@
 # coding=utf-8
 
 """
-Uses /proc/mounts and os.statvfs() to get disk space usage
+Uses /proc/self/mountinfo and os.statvfs() to get disk space usage
 
 #### Dependencies
 
- * /proc/mounts
+ * /proc/self/mountinfo
 
 #### Examples
 
@@ -18,12 +18,22 @@ Uses /proc/mounts and os.statvfs() to get disk space usage
     # exclude everything that includes the letter 'm'
     exclude_filters = m,
 
+The mount table is only read again when the kernel reports a change to
+/proc/self/mountinfo. statvfs() is called on *max_threads* mounts at a time
+and given *timeout* seconds. A mount not answering in time, like a hung NFS
+mount, is quarantined: it is skipped until its pending call returns, and
+published as <mount>.quarantined = 1, with quarantined counting such mounts.
+Mounts still waiting for a thread at the timeout are only skipped.
+
 """
 
 import diamond.collector
 import diamond.convertor
+from diamond.parallel import JobTimeout, WorkerPool
 import os
 import re
+import select
+import time
 
 try:
     import psutil
@@ -32,8 +42,69 @@ except ImportError:
     psutil = None
 
 
+MOUNTINFO = '/proc/self/mountinfo'
+
+
+class MountWatcher(object):
+    """
+    Tells whether the mount table changed since the last call to changed(),
+    polling /proc/self/mountinfo, which the kernel flags on every mount and
+    unmount. Always reports a change where that cannot be done.
+    """
+
+    def __init__(self, path=MOUNTINFO):
+        self.fd = None
+        self.poller = None
+        if not hasattr(select, 'poll'):
+            return
+        try:
+            self.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLERR | select.POLLPRI)
+
+    def changed(self):
+        if self.poller is None:
+            return True
+        if not self.poller.poll(0):
+            return False
+        # Reading the file again resets the flag
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        while os.read(self.fd, 65536):
+            pass
+        return True
+
+
+def compile_filters(filters):
+    """
+    Returns one regex matching any of a list of regexes, or None
+    """
+    if isinstance(filters, basestring):
+        filters = [filters]
+    filters = [f for f in filters if f]
+    if not filters:
+        return None
+    return re.compile('|'.join('(?:%s)' % f for f in filters))
+
+
 class DiskSpaceCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(DiskSpaceCollector, self).__init__(*args, **kwargs)
+        self.exclude_reg = compile_filters(self.config['exclude_filters'])
+        filesystems = self.config['filesystems']
+        if isinstance(filesystems, basestring):
+            filesystems = filesystems.split(',')
+        self.filesystems = frozenset(f.strip() for f in filesystems)
+        self.watcher = None
+        # Mounts to examine, [(name, mount point)], read from the mount
+        # table when it changes
+        self.mounts = None
+        # Mount point -> the statvfs() Job it is quarantined until
+        self.quarantined = {}
+        self.pool = WorkerPool(int(self.config['max_threads']))
+
     def get_default_config_help(self):
         config_help = super(DiskSpaceCollector, self).get_default_config_help()
         config_help.update({
@@ -41,6 +112,9 @@ class DiskSpaceCollector(diamond.collector.Collector):
             'exclude_filters': "A list of regex patterns. Any filesystem"
             + " matching any of these patterns will be excluded from disk"
             + " space metrics collection",
+            'timeout': 'Seconds before a mount not answering statvfs() is'
+                       ' quarantined',
+            'max_threads': 'Number of mounts examined at the same time',
         })
         return config_help
 
@@ -76,7 +150,10 @@ class DiskSpaceCollector(diamond.collector.Collector):
             'method': 'Threaded',
 
             # Default numeric output
-            'byte_unit': ['byte']
+            'byte_unit': ['byte'],
+
+            'timeout': 5,
+            'max_threads': 4,
         })
         return config
 
@@ -99,20 +176,25 @@ class DiskSpaceCollector(diamond.collector.Collector):
         """
         Creates a map of mounted filesystems on the machine.
 
-        iostat(1): Each sector has size of 512 bytes.
+        The device numbers come from /proc/self/mountinfo rather than
+        stat(), which would hang on a hung mount.
 
         Returns:
           (major, minor) -> FileSystem(device, mount_point)
         """
         result = {}
-        if os.access('/proc/mounts', os.R_OK):
-            file = open('/proc/mounts')
+        if os.access(MOUNTINFO, os.R_OK):
+            file = open(MOUNTINFO)
             for line in file:
                 try:
+                    # id parent major:minor root mount_point options
+                    # [optional fields...] - fs_type device super_options
                     mount = line.split()
-                    device = mount[0]
-                    mount_point = mount[1]
-                    fs_type = mount[2]
+                    major, minor = [int(n) for n in mount[2].split(':')]
+                    mount_point = mount[4]
+                    separator = mount.index('-', 6)
+                    fs_type = mount[separator + 1]
+                    device = mount[separator + 2]
                 except (IndexError, ValueError):
                     continue
 
@@ -122,10 +204,6 @@ class DiskSpaceCollector(diamond.collector.Collector):
                     continue
 
                 if '/' in device and mount_point.startswith('/'):
-                    stat = os.stat(mount_point)
-                    major = os.major(stat.st_dev)
-                    minor = os.minor(stat.st_dev)
-
                     if (major, minor) in result:
                         continue
 
@@ -149,21 +227,21 @@ class DiskSpaceCollector(diamond.collector.Collector):
 
         return result
 
-    def collect(self):
-        exclude_reg = re.compile(self.config['exclude_filters'])
-
-        filesystems = []
-        for filesystem in self.config['filesystems'].split(','):
-            filesystems.append(filesystem.strip())
-
+    def get_mounts(self):
+        """
+        Returns [(name, mount point)] of the filesystems to examine
+        """
+        mounts = []
         labels = self.get_disk_labels()
         for key, info in self.get_file_systems().iteritems():
-        # Skip the filesystem if it is not in the list of valid filesystems
-            if info['fs_type'] not in filesystems:
+            # Skip the filesystem if it is not in the list of valid
+            # filesystems
+            if info['fs_type'] not in self.filesystems:
                 continue
 
-        # Process the filters
-            if exclude_reg.match(info['mount_point']):
+            # Process the filters
+            if (self.exclude_reg is not None
+                    and self.exclude_reg.match(info['mount_point'])):
                 continue
 
             if info['device'] in labels:
@@ -173,41 +251,93 @@ class DiskSpaceCollector(diamond.collector.Collector):
                 name = name.replace('.', '_')
                 if name == '_':
                     name = 'root'
+            mounts.append((name, info['mount_point']))
+        return mounts
+
+    def collect(self):
+        if self.watcher is None:
+            self.watcher = MountWatcher()
+        if self.watcher.changed() or self.mounts is None:
+            self.mounts = self.get_mounts()
+
+        for mount_point, job in self.quarantined.items():
+            if job.done():
+                self.log.info('%s answers again', mount_point)
+                del self.quarantined[mount_point]
+
+        jobs = []
+        for name, mount_point in self.mounts:
+            if mount_point in self.quarantined:
+                self.publish('%s.quarantined' % name, 1, metric_type='GAUGE')
+                continue
+            jobs.append((name, mount_point,
+                         self.pool.submit(os.statvfs, mount_point)))
 
-            data = os.statvfs(info['mount_point'])
-            block_size = data.f_bsize
-
-            blocks_total = data.f_blocks
-            blocks_free = data.f_bfree
-            blocks_avail = data.f_bavail
-            inodes_total = data.f_files
-            inodes_free = data.f_ffree
-            inodes_avail = data.f_favail
-
-            for unit in self.config['byte_unit']:
-
-                metric_name = '%s.%s_used' % (name, unit)
-                metric_value = float(block_size) * float(
-                    blocks_total - blocks_free)
-                metric_value = diamond.convertor.binary.convert(
-                    value=metric_value, oldUnit='byte', newUnit=unit)
-                self.publish(metric_name, metric_value, 2, 'GAUGE')
-
-                metric_name = '%s.%s_free' % (name, unit)
-                metric_value = float(block_size) * float(blocks_free)
-                metric_value = diamond.convertor.binary.convert(
-                    value=metric_value, oldUnit='byte', newUnit=unit)
-                self.publish(metric_name, metric_value, 2, 'GAUGE')
-
-                metric_name = '%s.%s_avail' % (name, unit)
-                metric_value = float(block_size) * float(blocks_avail)
-                metric_value = diamond.convertor.binary.convert(
-                    value=metric_value, oldUnit='byte', newUnit=unit)
-                self.publish(metric_name, metric_value, 2, 'GAUGE')
-
-            self.publish('%s.inodes_used' % name, inodes_total - inodes_free,
-                         metric_type='GAUGE')
-            self.publish('%s.inodes_free' % name, inodes_free,
-                         metric_type='GAUGE')
-            self.publish('%s.inodes_avail' % name, inodes_avail,
-                         metric_type='GAUGE')
+        deadline = time.time() + float(self.config['timeout'])
+        for name, mount_point, job in jobs:
+            try:
+                try:
+                    data = job.wait(max(deadline - time.time(), 0))
+                except JobTimeout:
+                    abandoned = self.pool.abandon(job)
+                    if abandoned and not job.started:
+                        # Queued behind slower mounts; tried again next time
+                        self.log.warning('statvfs(%s) did not start in %s'
+                                         ' seconds; skipped', mount_point,
+                                         self.config['timeout'])
+                        continue
+                    if abandoned:
+                        self.log.error('statvfs(%s) did not return in %s'
+                                       ' seconds; quarantined', mount_point,
+                                       self.config['timeout'])
+                        self.quarantined[mount_point] = job
+                        self.publish('%s.quarantined' % name, 1,
+                                     metric_type='GAUGE')
+                        continue
+                    # It returned after all
+                    data = job.wait(0)
+            except OSError, e:
+                self.log.error('Cannot examine %s: %s', mount_point, e)
+                continue
+            self.publish_usage(name, data)
+
+        self.publish('quarantined', len(self.quarantined),
+                     metric_type='GAUGE')
+
+    def publish_usage(self, name, data):
+        block_size = data.f_bsize
+
+        blocks_total = data.f_blocks
+        blocks_free = data.f_bfree
+        blocks_avail = data.f_bavail
+        inodes_total = data.f_files
+        inodes_free = data.f_ffree
+        inodes_avail = data.f_favail
+
+        for unit in self.config['byte_unit']:
+
+            metric_name = '%s.%s_used' % (name, unit)
+            metric_value = float(block_size) * float(
+                blocks_total - blocks_free)
+            metric_value = diamond.convertor.binary.convert(
+                value=metric_value, oldUnit='byte', newUnit=unit)
+            self.publish(metric_name, metric_value, 2, 'GAUGE')
+
+            metric_name = '%s.%s_free' % (name, unit)
+            metric_value = float(block_size) * float(blocks_free)
+            metric_value = diamond.convertor.binary.convert(
+                value=metric_value, oldUnit='byte', newUnit=unit)
+            self.publish(metric_name, metric_value, 2, 'GAUGE')
+
+            metric_name = '%s.%s_avail' % (name, unit)
+            metric_value = float(block_size) * float(blocks_avail)
+            metric_value = diamond.convertor.binary.convert(
+                value=metric_value, oldUnit='byte', newUnit=unit)
+            self.publish(metric_name, metric_value, 2, 'GAUGE')
+
+        self.publish('%s.inodes_used' % name, inodes_total - inodes_free,
+                     metric_type='GAUGE')
+        self.publish('%s.inodes_free' % name, inodes_free,
+                     metric_type='GAUGE')
+        self.publish('%s.inodes_avail' % name, inodes_avail,
+                     metric_type='GAUGE')
@@ -5,9 +5,9 @@
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
-from test import run_only
 from mock import Mock
 from mock import patch
+import threading
 
 from diamond.collector import Collector
 from diskspace import DiskSpaceCollector
@@ -15,17 +15,6 @@ from diskspace import DiskSpaceCollector
 ################################################################################
 
 
-def run_only_if_major_is_available(func):
-    try:
-        import os
-        os.major
-        major = True
-    except AttributeError:
-        major = None
-    pred = lambda: major is not None
-    return run_only(func, pred)
-
-
 class TestDiskSpaceCollector(CollectorTestCase):
     def setUp(self):
         config = get_collector_config('DiskSpaceCollector', {
@@ -38,37 +27,15 @@ class TestDiskSpaceCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(DiskSpaceCollector)
 
-    @run_only_if_major_is_available
     @patch('os.access', Mock(return_value=True))
     def test_get_file_systems(self):
-        result = None
-
-        os_stat_mock = patch('os.stat')
-        os_major_mock = patch('os.major')
-        os_minor_mock = patch('os.minor')
-        open_mock = patch('__builtin__.open',
-                          Mock(return_value=self.getFixture('proc_mounts')))
-
-        stat_mock = os_stat_mock.start()
-        stat_mock.return_value.st_dev = 42
+        with patch('__builtin__.open', Mock(
+                return_value=self.getFixture('proc_self_mountinfo'))) as omock:
+            with patch('os.stat') as stat_mock:
+                result = self.collector.get_file_systems()
 
-        major_mock = os_major_mock.start()
-        major_mock.return_value = 9
-
-        minor_mock = os_minor_mock.start()
-        minor_mock.return_value = 0
-
-        omock = open_mock.start()
-
-        result = self.collector.get_file_systems()
-        os_stat_mock.stop()
-        os_major_mock.stop()
-        os_minor_mock.stop()
-        open_mock.stop()
-
-        stat_mock.assert_called_once_with('/')
-        major_mock.assert_called_once_with(42)
-        minor_mock.assert_called_once_with(42)
+        # A hung mount would hang stat()
+        self.assertFalse(stat_mock.called)
 
         self.assertEqual(result, {
             (9, 0): {
@@ -78,10 +45,9 @@ class TestDiskSpaceCollector(CollectorTestCase):
                 'mount_point': '/'}
         })
 
-        omock.assert_called_once_with('/proc/mounts')
+        omock.assert_called_once_with('/proc/self/mountinfo')
         return result
 
-    @run_only_if_major_is_available
     @patch('os.access', Mock(return_value=True))
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
@@ -97,24 +63,15 @@ class TestDiskSpaceCollector(CollectorTestCase):
         statvfs_mock.f_flag = 4096
         statvfs_mock.f_namemax = 255
 
-        os_stat_mock = patch('os.stat')
-        os_major_mock = patch('os.major', Mock(return_value=9))
-        os_minor_mock = patch('os.minor', Mock(return_value=0))
         os_path_isdir_mock = patch('os.path.isdir', Mock(return_value=False))
-        open_mock = patch('__builtin__.open',
-                          Mock(return_value=self.getFixture('proc_mounts')))
+        open_mock = patch('__builtin__.open', Mock(
+            return_value=self.getFixture('proc_self_mountinfo')))
         os_statvfs_mock = patch('os.statvfs', Mock(return_value=statvfs_mock))
 
-        os_stat_mock.start()
-        os_major_mock.start()
-        os_minor_mock.start()
         os_path_isdir_mock.start()
         open_mock.start()
         os_statvfs_mock.start()
         self.collector.collect()
-        os_stat_mock.stop()
-        os_major_mock.stop()
-        os_minor_mock.stop()
         os_path_isdir_mock.stop()
         open_mock.stop()
         os_statvfs_mock.stop()
@@ -133,6 +90,106 @@ class TestDiskSpaceCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_should_quarantine_hung_mounts(self, publish_mock):
+        config = get_collector_config('DiskSpaceCollector', {
+            'interval': 10,
+            'byte_unit': ['byte'],
+            'timeout': 0.1,
+        })
+        collector = DiskSpaceCollector(config, None)
+        collector.watcher = Mock()
+        collector.watcher.changed.return_value = False
+        collector.mounts = [('root', '/'), ('_mnt_nfs', '/mnt/nfs')]
+
+        statvfs_mock = Mock()
+        statvfs_mock.f_bsize = 4096
+        statvfs_mock.f_blocks = 100
+        statvfs_mock.f_bfree = 50
+        statvfs_mock.f_bavail = 40
+        statvfs_mock.f_files = 10
+        statvfs_mock.f_ffree = 5
+        statvfs_mock.f_favail = 5
+        hung = threading.Event()
+        calls = []
+
+        def statvfs(path):
+            calls.append(path)
+            if path == '/mnt/nfs':
+                hung.wait(5)
+            return statvfs_mock
+
+        with patch('os.statvfs', statvfs):
+            collector.collect()
+            self.assertPublishedMany(publish_mock, {
+                'root.byte_used': 204800,
+                '_mnt_nfs.quarantined': 1,
+                'quarantined': 1,
+            })
+
+            # Not asked again while the first call hangs
+            collector.collect()
+            self.assertEquals(calls.count('/mnt/nfs'), 1)
+            self.assertPublishedMany(publish_mock, {
+                'root.byte_used': 204800,
+                '_mnt_nfs.quarantined': 1,
+            })
+
+            hung.set()
+            collector.quarantined['/mnt/nfs'].wait(5)
+            collector.collect()
+            self.assertPublishedMany(publish_mock, {
+                '_mnt_nfs.byte_used': 204800,
+                'quarantined': 0,
+            })
+
+    @patch.object(Collector, 'publish')
+    def test_should_not_quarantine_mounts_queued_behind_hung_ones(
+            self, publish_mock):
+        config = get_collector_config('DiskSpaceCollector', {
+            'interval': 10,
+            'byte_unit': ['byte'],
+            'timeout': 0.1,
+            'max_threads': 1,
+        })
+        collector = DiskSpaceCollector(config, None)
+        collector.watcher = Mock()
+        collector.watcher.changed.return_value = False
+        collector.mounts = [('_mnt_nfs', '/mnt/nfs'), ('root', '/')]
+
+        statvfs_mock = Mock()
+        statvfs_mock.f_bsize = 4096
+        statvfs_mock.f_blocks = 100
+        statvfs_mock.f_bfree = 50
+        statvfs_mock.f_bavail = 40
+        statvfs_mock.f_files = 10
+        statvfs_mock.f_ffree = 5
+        statvfs_mock.f_favail = 5
+        hung = threading.Event()
+
+        def statvfs(path):
+            if path == '/mnt/nfs':
+                hung.wait(5)
+            return statvfs_mock
+
+        with patch('os.statvfs', statvfs):
+            # No worker replaces the hung one, so / stays queued
+            collector.pool._start_workers()
+            with patch.object(collector.pool, '_start_workers'):
+                collector.collect()
+            self.assertEquals(collector.quarantined.keys(), ['/mnt/nfs'])
+            self.assertPublishedMany(publish_mock, {
+                '_mnt_nfs.quarantined': 1,
+                'quarantined': 1,
+            })
+
+            collector.collect()
+            self.assertPublishedMany(publish_mock, {
+                'root.byte_used': 204800,
+                '_mnt_nfs.quarantined': 1,
+            })
+            hung.set()
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
@@ -26,6 +26,49 @@ try:
 except ImportError:
     psutil = None
 
+# The columns of /proc/diskstats after the device numbers and name
+FIELDS = ('reads', 'reads_merged', 'reads_sectors', 'reads_milliseconds',
+          'writes', 'writes_merged', 'writes_sectors', 'writes_milliseconds',
+          'io_in_progress', 'io_milliseconds', 'io_milliseconds_weighted')
+
+(READS, READS_MERGED, READS_SECTORS, READS_MILLISECONDS,
+ WRITES, WRITES_MERGED, WRITES_SECTORS, WRITES_MILLISECONDS,
+ IO_IN_PROGRESS, IO_MILLISECONDS, IO_MILLISECONDS_WEIGHTED) = range(11)
+
+# Metrics published for every device, in the order collect() computes them
+COUNTER_NAMES = ('reads', 'reads_merged', 'reads_milliseconds', 'writes',
+                 'writes_merged', 'writes_milliseconds', 'io_in_progress',
+                 'io_milliseconds', 'io_milliseconds_weighted')
+UNIT_NAMES = ('reads_%s', 'writes_%s', 'read_%s_per_second',
+              'write_%s_per_second', 'average_request_size_%s')
+DERIVED_NAMES = ('read_requests_merged_per_second',
+                 'write_requests_merged_per_second', 'reads_per_second',
+                 'writes_per_second', 'average_queue_length', 'await',
+                 'read_await', 'write_await', 'service_time', 'iops', 'io',
+                 'util_percentage', 'concurrent_io')
+
+
+def parse_diskstats(lines):
+    """
+    Yields (major, minor, device, [the FIELDS values]) for each line of
+    /proc/diskstats
+    """
+    for line in lines:
+        columns = line.split()
+        # On early linux v2.6 versions, partitions have only 4
+        # output fields not 11. From linux 2.6.25 partitions have
+        # the full stats set.
+        if len(columns) < 14:
+            continue
+        device = columns[2]
+        if device.startswith('ram') or device.startswith('loop'):
+            continue
+        try:
+            yield (int(columns[0]), int(columns[1]), device,
+                   [float(v) for v in columns[3:14]])
+        except ValueError:
+            continue
+
 
 class DiskUsageCollector(diamond.collector.Collector):
 
@@ -42,11 +85,38 @@ class DiskUsageCollector(diamond.collector.Collector):
 
     LastCollectTime = None
 
+    def __init__(self, *args, **kwargs):
+        super(DiskUsageCollector, self).__init__(*args, **kwargs)
+        self.devices_reg = re.compile(self.config['devices'])
+        sector_size = int(self.config['sector_size'])
+        self.units = list(self.config['byte_unit'])
+        # The size of a sector in each byte_unit
+        self.unit_factors = [diamond.convertor.binary.convert(
+            value=sector_size, oldUnit='byte', newUnit=unit)
+            for unit in self.units]
+
+        # Wrap around value of each field, None for io_in_progress which
+        # is not a counter
+        self.max_values = []
+        for field in FIELDS:
+            if field.endswith('sectors'):
+                self.max_values.append(
+                    float(diamond.collector.MAX_COUNTER) / sector_size)
+            else:
+                self.max_values.append(self.MAX_VALUES.get(field))
+
+        # Device -> the names of its metrics, or None if it is not
+        # collected
+        self.names = {}
+        # Device -> its FIELDS values at the last collection
+        self.device_values = {}
+
     def get_default_config_help(self):
         config_help = super(DiskUsageCollector, self).get_default_config_help()
         config_help.update({
             'devices': "A regex of which devices to gather metrics for."
-                       + " Defaults to md, sd, xvd, disk, and dm devices",
+                       + " Defaults to md, sd, xvd, disk, dm and nvme"
+                       + " devices",
             'sector_size': 'The size to use to calculate sector usage'
         })
         return config_help
@@ -63,7 +133,8 @@ class DiskUsageCollector(diamond.collector.Collector):
                          + '|sd[a-z]+[0-9]*$'
                          + '|x?vd[a-z]+[0-9]*$'
                          + '|disk[0-9]+$'
-                         + '|dm\-[0-9]+$'),
+                         + '|dm\-[0-9]+$'
+                         + '|nvme[0-9]+n[0-9]+(p[0-9]+)?$'),
             'sector_size': 512
         })
         return config
@@ -81,39 +152,10 @@ class DiskUsageCollector(diamond.collector.Collector):
 
         if os.access('/proc/diskstats', os.R_OK):
             file = open('/proc/diskstats')
-
-            for line in file:
-                try:
-                    columns = line.split()
-                    # On early linux v2.6 versions, partitions have only 4
-                    # output fields not 11. From linux 2.6.25 partitions have
-                    # the full stats set.
-                    if len(columns) < 14:
-                        continue
-                    major = int(columns[0])
-                    minor = int(columns[1])
-                    device = columns[2]
-
-                    if device.startswith('ram') or device.startswith('loop'):
-                        continue
-
-                    result[(major, minor)] = {
-                        'device': device,
-                        'reads': float(columns[3]),
-                        'reads_merged': float(columns[4]),
-                        'reads_sectors': float(columns[5]),
-                        'reads_milliseconds': float(columns[6]),
-                        'writes': float(columns[7]),
-                        'writes_merged': float(columns[8]),
-                        'writes_sectors': float(columns[9]),
-                        'writes_milliseconds': float(columns[10]),
-                        'io_in_progress': float(columns[11]),
-                        'io_milliseconds': float(columns[12]),
-                        'io_milliseconds_weighted': float(columns[13])
-                    }
-                except ValueError:
-                    continue
-
+            for major, minor, device, values in parse_diskstats(file):
+                info = dict(zip(FIELDS, values))
+                info['device'] = device
+                result[(major, minor)] = info
             file.close()
         elif psutil:
             disks = psutil.disk_io_counters(True)
@@ -139,6 +181,32 @@ class DiskUsageCollector(diamond.collector.Collector):
 
         return result
 
+    def read_statistics(self):
+        """
+        Returns [(device, [the FIELDS values])]
+        """
+        if os.access('/proc/diskstats', os.R_OK):
+            file = open('/proc/diskstats')
+            try:
+                return [(device, values) for major, minor, device, values
+                        in parse_diskstats(file)]
+            finally:
+                file.close()
+        return [(info['device'], [float(info[field]) for field in FIELDS])
+                for info in self.get_disk_statistics().itervalues()]
+
+    def get_metric_names(self, device):
+        """
+        Returns the names of the metrics of a device, in the order collect()
+        computes their values
+        """
+        names = list(COUNTER_NAMES)
+        for name in UNIT_NAMES:
+            names.extend(name % unit for unit in self.units)
+        names.extend(DERIVED_NAMES)
+        return [('%s.%s' % (device, name)).replace('/', '_')
+                for name in names]
+
     def collect(self):
 
         # Handle collection time intervals correctly
@@ -150,112 +218,79 @@ class DiskUsageCollector(diamond.collector.Collector):
             time_delta = float(self.config['interval'])
         self.LastCollectTime = CollectTime
 
-        exp = self.config['devices']
-        reg = re.compile(exp)
-
-        for key, info in self.get_disk_statistics().iteritems():
-            metrics = {}
+        device_values = self.device_values
+        self.device_values = {}
+        max_values = self.max_values
+        for device, values in self.read_statistics():
+            try:
+                names = self.names[device]
+            except KeyError:
+                names = None
+                if self.devices_reg.match(device):
+                    names = self.get_metric_names(device)
+                self.names[device] = names
+            if names is None:
+                continue
 
-            name = info['device']
-            if not reg.match(name):
+            self.device_values[device] = values
+            old_values = device_values.get(device)
+            if old_values is None:
                 continue
 
-            for key, value in info.iteritems():
-                if key == 'device':
+            # The change in each counter, allowing for it wrapping around
+            deltas = []
+            for new, old, max_value in zip(values, old_values, max_values):
+                if max_value is None:
+                    deltas.append(new)
                     continue
-                oldkey = key
-
-                for unit in self.config['byte_unit']:
-                    key = oldkey
-
-                    if key.endswith('sectors'):
-                        key = key.replace('sectors', unit)
-                        value /= (1024 / int(self.config['sector_size']))
-                        value = diamond.convertor.binary.convert(value=value,
-                                                                 oldUnit='kB',
-                                                                 newUnit=unit)
-                        self.MAX_VALUES[key] = diamond.convertor.binary.convert(
-                            value=diamond.collector.MAX_COUNTER,
-                            oldUnit='byte',
-                            newUnit=unit)
-
-                    metric_name = '.'.join([info['device'], key])
-                    # io_in_progress is a point in time counter, !derivative
-                    if key != 'io_in_progress':
-                        metric_value = self.derivative(
-                            metric_name,
-                            value,
-                            self.MAX_VALUES[key],
-                            time_delta=False)
-                    else:
-                        metric_value = value
-
-                    metrics[key] = metric_value
-
-            metrics['read_requests_merged_per_second'] = (
-                metrics['reads_merged'] / time_delta)
-            metrics['write_requests_merged_per_second'] = (
-                metrics['writes_merged'] / time_delta)
-            metrics['reads_per_second'] = metrics['reads'] / time_delta
-            metrics['writes_per_second'] = metrics['writes'] / time_delta
-
-            for unit in self.config['byte_unit']:
-                metric_name = 'read_%s_per_second' % unit
-                key = 'reads_%s' % unit
-                metrics[metric_name] = metrics[key] / time_delta
-
-                metric_name = 'write_%s_per_second' % unit
-                key = 'writes_%s' % unit
-                metrics[metric_name] = metrics[key] / time_delta
-
-                # Set to zero so the nodes are valid even if we have 0 io for
-                # the metric duration
-                metric_name = 'average_request_size_%s' % unit
-                metrics[metric_name] = 0
-
-            metrics['average_queue_length'] = (metrics['io_milliseconds']
-                                               / time_delta * 1000.0)
-            metrics['await'] = 0
-            metrics['read_await'] = 0
-            metrics['write_await'] = 0
-            metrics['service_time'] = 0
-            metrics['iops'] = (metrics['reads']
-                               + metrics['writes']) / time_delta
-            metrics['io'] = metrics['reads'] + metrics['writes']
-            metrics['util_percentage'] = 0
-            metrics['concurrent_io'] = 0
-
-            if metrics['io'] > 0:
-
-                for unit in self.config['byte_unit']:
-                    rkey = 'reads_%s' % unit
-                    wkey = 'writes_%s' % unit
-                    metric_name = 'average_request_size_%s' % unit
-                    metrics[metric_name] = (metrics[rkey]
-                                            + metrics[wkey]) / metrics['io']
-
-                metrics['service_time'] = (metrics['io_milliseconds']
-                                           / metrics['io'])
-                metrics['await'] = (metrics['io_milliseconds_weighted']
-                                    / metrics['io'])
-                if metrics['reads'] > 0:
-                    metrics['read_await'] = (metrics['reads_milliseconds']
-                                             / metrics['reads'])
-                if metrics['writes'] > 0:
-                    metrics['write_await'] = (metrics['writes_milliseconds']
-                                              / metrics['writes'])
-                metrics['util_percentage'] = (metrics['io']
-                                              * metrics['service_time']
-                                              / 1000.0) * 100.0
+                if new < old:
+                    old = old - max_value
+                deltas.append(max(new - old, 0))
+
+            reads = deltas[READS]
+            writes = deltas[WRITES]
+            io = reads + writes
+            # Only publish when we have io figures
+            if io <= 0:
+                continue
 
+            io_milliseconds = deltas[IO_MILLISECONDS]
+            reads_per_second = reads / time_delta
+            writes_per_second = writes / time_delta
+            service_time = io_milliseconds / io
+
+            metrics = [deltas[READS], deltas[READS_MERGED],
+                       deltas[READS_MILLISECONDS], deltas[WRITES],
+                       deltas[WRITES_MERGED], deltas[WRITES_MILLISECONDS],
+                       deltas[IO_IN_PROGRESS], io_milliseconds,
+                       deltas[IO_MILLISECONDS_WEIGHTED]]
+            reads_bytes = [deltas[READS_SECTORS] * f
+                           for f in self.unit_factors]
+            writes_bytes = [deltas[WRITES_SECTORS] * f
+                            for f in self.unit_factors]
+            metrics.extend(reads_bytes)
+            metrics.extend(writes_bytes)
+            metrics.extend(v / time_delta for v in reads_bytes)
+            metrics.extend(v / time_delta for v in writes_bytes)
+            metrics.extend((r + w) / io
+                           for r, w in zip(reads_bytes, writes_bytes))
+            metrics.extend((
+                deltas[READS_MERGED] / time_delta,
+                deltas[WRITES_MERGED] / time_delta,
+                reads_per_second,
+                writes_per_second,
+                io_milliseconds / time_delta * 1000.0,
+                deltas[IO_MILLISECONDS_WEIGHTED] / io,
+                reads and deltas[READS_MILLISECONDS] / reads,
+                writes and deltas[WRITES_MILLISECONDS] / writes,
+                service_time,
+                io / time_delta,
+                io,
+                (io * service_time / 1000.0) * 100.0,
                 # http://scr.bi/OnsGg4 Page 28
-                metrics['concurrent_io'] = (metrics['reads_per_second']
-                                            + metrics['writes_per_second']
-                                            ) * (metrics['service_time']
-                                                 / 1000.0)
-
-                # Only publish when we have io figures
-                for key in metrics:
-                    metric_name = '.'.join([info['device'],
-                                            key]).replace('/', '_')
-                    self.publish(metric_name, metrics[key])
+                (reads_per_second + writes_per_second) * (service_time
+                                                          / 1000.0),
+            ))
+
+            for name, value in zip(names, metrics):
+                self.publish(name, value)
@@ -291,6 +291,52 @@ class TestDiskUsageCollector(CollectorTestCase):
         }
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch('os.access', Mock(return_value=True))
+    @patch.object(Collector, 'publish')
+    def test_verify_supporting_nvme(self, publish_mock):
+        for fixture, now in (('proc_diskstats_1_nvme', 10),
+                             ('proc_diskstats_2_nvme', 20)):
+            with patch('__builtin__.open',
+                       Mock(return_value=self.getFixture(fixture))):
+                with patch('time.time', Mock(return_value=now)):
+                    self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'nvme0n1.reads': 100,
+            'nvme0n1.writes': 300,
+            'nvme0n1.reads_kilobyte': 4000,
+            'nvme0n1.write_kilobyte_per_second': 1200,
+            'nvme0n1.io_in_progress': 2,
+            'nvme0n1.await': 1,
+            'nvme0n1.read_await': 1,
+            'nvme0n1.util_percentage': 30,
+            'nvme0n1p1.iops': 15,
+        })
+
+    @patch('os.access', Mock(return_value=True))
+    @patch.object(Collector, 'publish')
+    def test_should_keep_counter_store_through_run(self, publish_mock):
+        config = get_collector_config('DiskUsageCollector', {
+            'interval': 10,
+            'sector_size': '512',
+            'byte_unit': 'kilobyte',
+            'publish_counter_evictions': True,
+        })
+        collector = DiskUsageCollector(config, [])
+        with patch('__builtin__.open',
+                   Mock(return_value=self.getFixture('proc_diskstats_1_nvme'))):
+            with patch('time.time', Mock(return_value=10)):
+                collector._run()
+        self.assertPublishedMany(publish_mock, {'counter_evictions': 0})
+
+        with patch('__builtin__.open',
+                   Mock(return_value=self.getFixture('proc_diskstats_2_nvme'))):
+            with patch('time.time', Mock(return_value=20)):
+                collector._run()
+        self.assertPublishedMany(publish_mock, {
+            'nvme0n1.reads': 100,
+            'counter_evictions': 0,
+        })
 
 ################################################################################
 if __name__ == "__main__":
@@ -5,12 +5,10 @@ Collect [dropwizard](http://dropwizard.codahale.com/) stats for the local node
 
 #### Dependencies
 
- * urlib2
+ * httplib
 
 """
 
-import urllib2
-
 try:
     import json
     json  # workaround for pyflakes issue #13
@@ -18,10 +16,15 @@ except ImportError:
     import simplejson as json
 
 import diamond.collector
+import diamond.httpclient
 
 
 class DropwizardCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(DropwizardCollector, self).__init__(config, handlers)
+        self.client = None
+
     def get_default_config_help(self):
         config_help = super(DropwizardCollector,
                             self).get_default_config_help()
@@ -49,14 +52,16 @@ class DropwizardCollector(diamond.collector.Collector):
             return {}
         url = 'http://%s:%i/metrics' % (
             self.config['host'], int(self.config['port']))
+        if self.client is None:
+            self.client = diamond.httpclient.get_client(self.config)
         try:
-            response = urllib2.urlopen(url)
-        except urllib2.HTTPError, err:
+            response = self.client.get(url)
+        except IOError, err:
             self.log.error("%s: %s", url, err)
             return
 
         try:
-            result = json.load(response)
+            result = response.json()
         except (TypeError, ValueError):
             self.log.error("Unable to parse response from elasticsearch as a"
                            + " json object")
@@ -26,12 +26,12 @@ class TestDropwizardCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen',
-                              Mock(return_value=self.getFixture('stats')))
+        patch_get = patch('diamond.httpclient.HTTPClient.get',
+                          Mock(return_value=self.getResponse('stats')))
 
-        patch_urlopen.start()
+        patch_get.start()
         self.collector.collect()
-        patch_urlopen.stop()
+        patch_get.stop()
 
         metrics = {
             'jvm.memory.totalInit': 9.142272E7,
@@ -67,13 +67,12 @@ class TestDropwizardCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_fail_gracefully(self, publish_mock):
-        patch_urlopen = patch('urllib2.urlopen',
-                              Mock(
-                                return_value=self.getFixture('stats_blank')))
+        patch_get = patch('diamond.httpclient.HTTPClient.get',
+                          Mock(return_value=self.getResponse('stats_blank')))
 
-        patch_urlopen.start()
+        patch_get.start()
         self.collector.collect()
-        patch_urlopen.stop()
+        patch_get.stop()
 
         self.assertPublishedMany(publish_mock, {})
 
@@ -5,12 +5,10 @@ Collect the elasticsearch stats for the local node
 
 #### Dependencies
 
- * urlib2
+ * httplib
 
 """
 
-import urllib2
-
 try:
     import json
     json  # workaround for pyflakes issue #13
@@ -18,16 +16,30 @@ except ImportError:
     import simplejson as json
 
 import diamond.collector
+import diamond.httpclient
+from diamond.flatten import PathFilter, flatten
 
 
 class ElasticSearchCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(ElasticSearchCollector, self).__init__(config, handlers)
+        self.client = None
+        self.path_filter = None
+        if self.config['include_paths']:
+            self.path_filter = PathFilter(self.config['include_paths'],
+                                          self.config['exclude_paths'])
+
     def get_default_config_help(self):
         config_help = super(ElasticSearchCollector,
                             self).get_default_config_help()
         config_help.update({
             'host': "",
             'port': "",
+            'include_paths': "Globs of further node stats to publish, such"
+                             " as thread_pool.*.queue or jvm.gc",
+            'exclude_paths': "Globs of node stats not to publish from"
+                             " include_paths",
         })
         return config_help
 
@@ -40,6 +52,8 @@ class ElasticSearchCollector(diamond.collector.Collector):
             'host':     '127.0.0.1',
             'port':     9200,
             'path':     'elasticsearch',
+            'include_paths': [],
+            'exclude_paths': [],
         })
         return config
 
@@ -49,14 +63,16 @@ class ElasticSearchCollector(diamond.collector.Collector):
             return {}
         url = 'http://%s:%i/_cluster/nodes/_local/stats?all=true' % (
             self.config['host'], int(self.config['port']))
+        if self.client is None:
+            self.client = diamond.httpclient.get_client(self.config)
         try:
-            response = urllib2.urlopen(url)
-        except urllib2.HTTPError, err:
+            response = self.client.get(url)
+        except IOError, err:
             self.log.error("%s: %s", url, err)
             return
 
         try:
-            result = json.load(response)
+            result = response.json()
         except (TypeError, ValueError):
             self.log.error("Unable to parse response from elasticsearch as a"
                            + " json object")
@@ -112,5 +128,11 @@ class ElasticSearchCollector(diamond.collector.Collector):
         metrics['disk.writes.count'] = fs_data['disk_writes']
         metrics['disk.writes.size'] = fs_data['disk_write_size_in_bytes']
 
+        #
+        # any other node stats asked for
+        if self.path_filter is not None:
+            for key, value in flatten(data, self.path_filter):
+                metrics.setdefault(key, value)
+
         for key in metrics:
             self.publish(key, metrics[key])
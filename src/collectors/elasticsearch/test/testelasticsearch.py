@@ -26,12 +26,12 @@ class TestElasticSearchCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish')
     def test_should_work_with_real_data(self, publish_mock):
-        urlopen_mock = patch('urllib2.urlopen', Mock(
-            return_value=self.getFixture('stats')))
+        get_mock = patch('diamond.httpclient.HTTPClient.get', Mock(
+            return_value=self.getResponse('stats')))
 
-        urlopen_mock.start()
+        get_mock.start()
         self.collector.collect()
-        urlopen_mock.stop()
+        get_mock.stop()
 
         metrics = {
             'http.current': 1,
@@ -57,14 +57,41 @@ class TestElasticSearchCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_should_publish_included_paths(self, publish_mock):
+        config = get_collector_config('ElasticSearchCollector', {
+            'include_paths': ['thread_pool.*.queue', 'jvm.gc'],
+            'exclude_paths': ['jvm.gc.collectors'],
+        })
+        self.collector = ElasticSearchCollector(config, None)
+
+        get_mock = patch('diamond.httpclient.HTTPClient.get', Mock(
+            return_value=self.getResponse('stats')))
+
+        get_mock.start()
+        self.collector.collect()
+        get_mock.stop()
+
+        published = [c[0][0] for c in publish_mock.call_args_list]
+        self.assertFalse('jvm.gc.collectors.ParNew.collection_count'
+                         in published)
+        self.assertFalse('thread_pool.search.threads' in published)
+        self.assertPublishedMany(publish_mock, {
+            'http.current': 1,
+            'thread_pool.search.queue': 0,
+            'thread_pool.management.queue': 0,
+            'jvm.gc.collection_count': 62175,
+            'jvm.gc.collection_time_in_millis': 693156,
+        })
+
     @patch.object(Collector, 'publish')
     def test_should_fail_gracefully(self, publish_mock):
-        urlopen_mock = patch('urllib2.urlopen', Mock(
-                return_value=self.getFixture('stats_blank')))
+        get_mock = patch('diamond.httpclient.HTTPClient.get', Mock(
+                return_value=self.getResponse('stats_blank')))
 
-        urlopen_mock.start()
+        get_mock.start()
         self.collector.collect()
-        urlopen_mock.stop()
+        get_mock.stop()
 
         self.assertPublishedMany(publish_mock, {})
 
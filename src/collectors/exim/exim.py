@@ -10,7 +10,6 @@ Shells out to get the exim queue length
 """
 
 import diamond.collector
-import subprocess
 import os
 
 
@@ -43,13 +42,8 @@ class EximCollector(diamond.collector.Collector):
         if not os.access(self.config['bin'], os.X_OK):
             return
 
-        command = [self.config['bin'], '-bpc']
-
-        if self.config['use_sudo']:
-            command.insert(0, self.config['sudo_cmd'])
-
-        queuesize = subprocess.Popen(
-            command, stdout=subprocess.PIPE).communicate()[0].split()
+        queuesize = self.run_command([self.config['bin'], '-bpc']
+                                     ).stdout.split()
 
         if not len(queuesize):
             return
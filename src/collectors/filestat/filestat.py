@@ -1,7 +1,13 @@
 # coding=utf-8
 
 """
-Uses lsof to collect data on number of open files per user per type
+Collects data on number of open files per user per type. Per user data is
+gathered in a single pass over /proc, classifying each file the way lsof
+reports its TYPE column. Like lsof, this counts the open descriptors in
+/proc/<pid>/fd, the cwd and root directories (DIR) and executable (REG) of
+each process, and each file it maps into memory once, as REG, or DEL once
+deleted. Unlike lsof, mapped files are not stat()ed, so a mapped device
+counts as REG rather than CHR.
 
 #### Config Options
 
@@ -43,20 +49,42 @@ Uses lsof to collect data on number of open files per user per type
 #### Dependencies
 
  * /proc/sys/fs/file-nr
- * /usr/sbin/lsof
+ * /proc/<pid>/fd, cwd, root, exe and maps (for collect_user_data)
 
 """
 
 import diamond.collector
 import re
 import os
+import pwd
+import grp
+import stat
 
 _RE = re.compile(r'(\d+)\s+(\d+)\s+(\d+)')
 
+# /proc/net tables mapping socket inodes to the lsof TYPE of the socket, and
+# the column holding the inode in each table
+_SOCKET_TABLES = (
+    ('tcp', 'IPv4', 9),
+    ('udp', 'IPv4', 9),
+    ('raw', 'IPv4', 9),
+    ('tcp6', 'IPv6', 9),
+    ('udp6', 'IPv6', 9),
+    ('raw6', 'IPv6', 9),
+    ('unix', 'unix', 6),
+    ('netlink', 'netlink', 9),
+)
+
 
 class FilestatCollector(diamond.collector.Collector):
 
     PROC = '/proc/sys/fs/file-nr'
+    PROC_ROOT = '/proc'
+
+    def __init__(self, config, handlers):
+        super(FilestatCollector, self).__init__(config, handlers)
+        self._usernames = {}
+        self._user_groups = None
 
     def get_default_config_help(self):
         config_help = super(FilestatCollector, self).get_default_config_help()
@@ -84,10 +112,52 @@ class FilestatCollector(diamond.collector.Collector):
         })
         return config
 
-    def get_userlist(self):
+    def get_username(self, uid):
+        """
+        Resolve a uid to a user name, caching the result
+        """
+        if uid not in self._usernames:
+            try:
+                self._usernames[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                self._usernames[uid] = str(uid)
+        return self._usernames[uid]
+
+    def get_user_groups(self, user):
+        """
+        Return the names of the groups a user belongs to, like id -Gn
         """
-        This collects all the users with open files on the system, and filters
-        based on the variables user_include and user_exclude
+        if self._user_groups is None:
+            self._user_groups = {}
+            for group in grp.getgrall():
+                for member in group.gr_mem:
+                    self._user_groups.setdefault(member, []).append(
+                        group.gr_name)
+
+        groups = list(self._user_groups.get(user, []))
+        try:
+            primary = grp.getgrgid(pwd.getpwnam(user).pw_gid).gr_name
+            if primary not in groups:
+                groups.insert(0, primary)
+        except KeyError:
+            pass
+        return groups
+
+    def get_user_uid(self, user):
+        """
+        Return the uid of a user name
+        """
+        try:
+            return pwd.getpwnam(user).pw_uid
+        except KeyError:
+            if user.isdigit():
+                return int(user)
+            raise
+
+    def get_userlist(self, rawusers):
+        """
+        Filters all the users with open files on the system based on the
+        variables user_include and user_exclude
         """
     # convert user/group  lists to arrays if strings
         if isinstance(self.config['user_include'], str):
@@ -99,8 +169,6 @@ class FilestatCollector(diamond.collector.Collector):
         if isinstance(self.config['group_exclude'], str):
             self.config['group_exclude'] = self.config['group_exclude'].split()
 
-        rawusers = os.popen("lsof | awk '{ print $3 }' | sort | uniq -d"
-                            ).read().split()
         userlist = []
 
         # remove any not on the user include list
@@ -118,7 +186,7 @@ class FilestatCollector(diamond.collector.Collector):
             for u in rawusers:
                 self.log.info(u)
                 # get list of groups of user
-                user_groups = os.popen("id -Gn %s" % (u)).read().split()
+                user_groups = self.get_user_groups(u)
                 for gi in self.config['group_include']:
                     if gi in user_groups and u not in userlist:
                         userlist.append(u)
@@ -132,7 +200,7 @@ class FilestatCollector(diamond.collector.Collector):
             tmplist = userlist[:]
             for u in tmplist:
                 # get list of groups of user
-                groups = os.popen("id -Gn %s" % (u)).read().split()
+                groups = self.get_user_groups(u)
                 for gi in self.config['group_exclude']:
                     if gi in groups:
                         userlist.remove(u)
@@ -140,20 +208,22 @@ class FilestatCollector(diamond.collector.Collector):
 
         # remove any that aren't within the uid limits
         # make sure uid_min/max are ints
-        self.config['uid_min'] = int(self.config['uid_min'])
-        self.config['uid_max'] = int(self.config['uid_max'])
+        if self.config['uid_min'] is not None:
+            self.config['uid_min'] = int(self.config['uid_min'])
+        if self.config['uid_max'] is not None:
+            self.config['uid_max'] = int(self.config['uid_max'])
         tmplist = userlist[:]
         for u in tmplist:
             if (self.config['user_include'] is None
                 or u not in self.config['user_include']):
                 if u not in addedByGroup:
-                    uid = int(os.popen("id -u %s" % (u)).read())
-                    if (uid < self.config['uid_min']
-                        and self.config['uid_min'] != None
+                    uid = self.get_user_uid(u)
+                    if (self.config['uid_min'] is not None
+                        and uid < self.config['uid_min']
                         and u in userlist):
                         userlist.remove(u)
-                    if (uid > self.config['uid_max']
-                        and self.config['uid_max'] != None
+                    if (self.config['uid_max'] is not None
+                        and uid > self.config['uid_max']
                         and u in userlist):
                         userlist.remove(u)
 
@@ -173,9 +243,9 @@ class FilestatCollector(diamond.collector.Collector):
 
         return userlist
 
-    def get_typelist(self):
+    def get_typelist(self, rawtypes):
         """
-        This collects all avaliable types and applies include/exclude filters
+        This applies include/exclude filters to all avaliable types
         """
         typelist = []
 
@@ -188,32 +258,153 @@ class FilestatCollector(diamond.collector.Collector):
         # remove any not in include list
         if self.config['type_include'] is None or len(
             self.config['type_include']) == 0:
-            typelist = os.popen("lsof | awk '{ print $5 }' | sort | uniq -d"
-                                ).read().split()
+            typelist = list(rawtypes)
         else:
-            typelist = self.config['type_include']
+            typelist = list(self.config['type_include'])
 
         # remove any in the exclude list
         if self.config['type_exclude'] is not None and len(
-            self.config['type_include']) > 0:
+            self.config['type_exclude']) > 0:
             for t in self.config['type_exclude']:
                 if t in typelist:
                     typelist.remove(t)
 
         return typelist
 
-    def process_lsof(self, users, types):
+    def get_socket_types(self):
+        """
+        Map socket inodes to their lsof type from the /proc/net tables
+        """
+        sockets = {}
+        for table, sock_type, column in _SOCKET_TABLES:
+            try:
+                fp = open(os.path.join(self.PROC_ROOT, 'net', table))
+            except IOError:
+                continue
+            try:
+                fp.readline()
+                for line in fp:
+                    fields = line.split()
+                    if len(fields) > column:
+                        sockets[fields[column]] = sock_type
+            finally:
+                fp.close()
+        return sockets
+
+    def get_fd_type(self, fd_path, sockets):
+        """
+        Classify an open file descriptor from its link target
+        """
+        try:
+            target = os.readlink(fd_path)
+        except OSError:
+            return None
+
+        if target.startswith('socket:['):
+            return sockets.get(target[8:-1], 'sock')
+        if target.startswith('pipe:['):
+            return 'FIFO'
+        if target.startswith('anon_inode:'):
+            return 'a_inode'
+
+        try:
+            mode = os.stat(fd_path).st_mode
+        except OSError:
+            return 'unknown'
+        if stat.S_ISREG(mode):
+            return 'REG'
+        if stat.S_ISDIR(mode):
+            return 'DIR'
+        if stat.S_ISCHR(mode):
+            return 'CHR'
+        if stat.S_ISBLK(mode):
+            return 'BLK'
+        if stat.S_ISFIFO(mode):
+            return 'FIFO'
+        if stat.S_ISSOCK(mode):
+            return 'sock'
+        return 'unknown'
+
+    def get_pid_uid(self, pid):
+        """
+        Return the real uid of a process from /proc/<pid>/status
+        """
+        try:
+            fp = open(os.path.join(self.PROC_ROOT, pid, 'status'))
+        except IOError:
+            return None
+        try:
+            for line in fp:
+                if line.startswith('Uid:'):
+                    return int(line.split()[1])
+        finally:
+            fp.close()
+        return None
+
+    def get_mapped_types(self, pid):
+        """
+        Return the lsof types of the distinct files a process maps, other
+        than its executable
+        """
+        try:
+            exe = os.readlink(os.path.join(self.PROC_ROOT, pid, 'exe'))
+        except OSError:
+            exe = None
+        try:
+            fp = open(os.path.join(self.PROC_ROOT, pid, 'maps'))
+        except IOError:
+            return []
+        types = []
+        seen = set()
+        try:
+            for line in fp:
+                # address perms offset dev inode path
+                fields = line.split(None, 5)
+                if len(fields) < 6 or fields[4] == '0':
+                    continue
+                path = fields[5].rstrip('\n')
+                if not path.startswith('/') or path == exe:
+                    continue
+                key = (fields[3], fields[4])
+                if key in seen:
+                    continue
+                seen.add(key)
+                if path.endswith(' (deleted)'):
+                    types.append('DEL')
+                else:
+                    types.append('REG')
+        finally:
+            fp.close()
+        return types
+
+    def process_proc(self):
         """
-        Get the list of users and file types to collect for and collect the
-        data from lsof
+        Walk /proc once and count the open files per user per type
         """
+        sockets = self.get_socket_types()
         d = {}
-        for u in users:
-            d[u] = {}
-            tmp = os.popen("lsof -bu %s | awk '{ print $5 }'" % (
-                u)).read().split()
-            for t in types:
-                d[u][t] = tmp.count(t)
+        for pid in os.listdir(self.PROC_ROOT):
+            if not pid.isdigit():
+                continue
+            fd_dir = os.path.join(self.PROC_ROOT, pid, 'fd')
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                # Process exited or is not ours to look at
+                continue
+            uid = self.get_pid_uid(pid)
+            if uid is None:
+                continue
+            counts = d.setdefault(self.get_username(uid), {})
+            paths = [os.path.join(fd_dir, fd) for fd in fds]
+            paths.extend(os.path.join(self.PROC_ROOT, pid, name)
+                         for name in ('cwd', 'root', 'exe'))
+            for path in paths:
+                t = self.get_fd_type(path, sockets)
+                if t is not None:
+                    counts[t] = counts.get(t, 0) + 1
+            for t in self.get_mapped_types(pid):
+                counts[t] = counts.get(t, 0) + 1
         return d
 
     def collect(self):
@@ -231,11 +422,19 @@ class FilestatCollector(diamond.collector.Collector):
         file.close()
 
         # collect open files per user per type
-        if self.config['collect_user_data']:
-            data = self.process_lsof(self.get_userlist(), self.get_typelist())
-            for ukey in data.iterkeys():
-                for tkey in data[ukey].iterkeys():
-                    self.log.info('files.user.%s.%s %s' % (
-                        ukey, tkey, int(data[ukey][tkey])))
-                    self.publish('user.%s.%s' % (ukey, tkey),
-                                 int(data[ukey][tkey]))
+        if diamond.collector.str_to_bool(self.config['collect_user_data']):
+            # Group membership may have changed since the last run
+            self._user_groups = None
+
+            data = self.process_proc()
+            rawtypes = set()
+            for counts in data.itervalues():
+                rawtypes.update(counts.iterkeys())
+
+            users = self.get_userlist(data.keys())
+            types = self.get_typelist(sorted(rawtypes))
+            for ukey in users:
+                for tkey in types:
+                    value = data[ukey].get(tkey, 0)
+                    self.log.debug('files.user.%s.%s %s' % (ukey, tkey, value))
+                    self.publish('user.%s.%s' % (ukey, tkey), value)
@@ -8,6 +8,11 @@ from test import unittest
 from mock import Mock
 from mock import patch
 
+import os
+import pwd
+import shutil
+import tempfile
+
 try:
     from cStringIO import StringIO
     StringIO  # workaround for pyflakes issue #13
@@ -55,6 +60,64 @@ class TestFilestatCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_should_count_proc_fds_per_user_per_type(self, publish_mock):
+        self.collector.PROC = self.getFixturePath('proc_sys_fs_file-nr')
+        root = tempfile.mkdtemp()
+        try:
+            user = pwd.getpwuid(os.getuid()).pw_name
+            os.makedirs(os.path.join(root, 'net'))
+            f = open(os.path.join(root, 'net', 'tcp'), 'w')
+            f.write('  sl  local_address rem_address   st tx_queue rx_queue '
+                    'tr tm->when retrnsmt   uid  timeout inode\n'
+                    '   0: 00000000:0016 00000000:0000 0A 00000000:00000000 '
+                    '00:00000000 00000000     0        0 4242 1\n')
+            f.close()
+
+            fd_dir = os.path.join(root, '123', 'fd')
+            os.makedirs(fd_dir)
+            f = open(os.path.join(root, '123', 'status'), 'w')
+            f.write('Name:\tfoo\nUid:\t%d\t0\t0\t0\n' % os.getuid())
+            f.close()
+            os.symlink(os.path.join(root, '123', 'status'),
+                       os.path.join(fd_dir, '0'))
+            os.symlink(root, os.path.join(fd_dir, '1'))
+            os.symlink('socket:[4242]', os.path.join(fd_dir, '2'))
+            os.symlink('socket:[9999]', os.path.join(fd_dir, '3'))
+            os.symlink('pipe:[1]', os.path.join(fd_dir, '4'))
+            os.symlink('pipe:[2]', os.path.join(fd_dir, '5'))
+            os.symlink(root, os.path.join(root, '123', 'cwd'))
+            os.symlink(root, os.path.join(root, '123', 'root'))
+            os.symlink(os.path.join(root, '123', 'status'),
+                       os.path.join(root, '123', 'exe'))
+            f = open(os.path.join(root, '123', 'maps'), 'w')
+            for inode, path in ((11, os.path.join(root, '123', 'status')),
+                                (12, '/lib/libc.so.6'),
+                                (12, '/lib/libc.so.6'),
+                                (13, '/usr/lib/locale/locale-archive'),
+                                (14, '/tmp/old.so (deleted)'),
+                                (0, '[heap]'),
+                                (0, '')):
+                f.write('7f0000000000-7f0000001000 r--p 00000000 08:01 '
+                        '%-26d %s\n' % (inode, path))
+            f.close()
+            os.makedirs(os.path.join(root, 'self'))
+
+            self.collector.PROC_ROOT = root
+            self.collector.config['collect_user_data'] = 'True'
+            self.collector.collect()
+        finally:
+            shutil.rmtree(root)
+
+        self.assertPublishedMany(publish_mock, {
+            'user.%s.REG' % user: 4,
+            'user.%s.DIR' % user: 3,
+            'user.%s.DEL' % user: 1,
+            'user.%s.IPv4' % user: 1,
+            'user.%s.sock' % user: 1,
+            'user.%s.FIFO' % user: 2,
+        })
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
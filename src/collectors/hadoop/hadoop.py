@@ -5,6 +5,14 @@ Diamond collector for Hadoop metrics, see:
 
  * [http://www.cloudera.com/blog/2009/03/hadoop-metrics/](http://bit.ly/NKBcFm)
 
+Metrics files are read with diamond.tailer.LogTailer, so each run only
+reads the records appended since the last one, finishing a rotated file
+and starting again at the top of a truncated one. Records are published
+with the timestamp they were written with. With a checkpoint_file the
+position in each file is saved after every run, so a restarted diamond does
+not publish the same records again. Files without a saved position are read
+from their start, unless from_start is disabled.
+
 #### Dependencies
 
  * hadoop
@@ -12,6 +20,9 @@ Diamond collector for Hadoop metrics, see:
 """
 
 from diamond.metric import Metric
+from diamond.tailer import LogTailer
+from diamond.tailer import load_checkpoints
+from diamond.tailer import save_checkpoints
 import diamond.collector
 import glob
 import re
@@ -22,10 +33,21 @@ class HadoopCollector(diamond.collector.Collector):
 
     re_log = re.compile(r'^(?P<timestamp>\d+) (?P<name>\S+): (?P<metrics>.*)$')
 
+    def __init__(self, *args, **kwargs):
+        super(HadoopCollector, self).__init__(*args, **kwargs)
+        # Metrics file -> LogTailer
+        self.tailers = {}
+        self.positions = None
+
     def get_default_config_help(self):
         config_help = super(HadoopCollector, self).get_default_config_help()
         config_help.update({
             'metrics': "List of paths to process metrics from",
+            'checkpoint_file': 'File to save the position in each metrics'
+                               ' file to between runs and restarts',
+            'from_start': 'Read files without a saved position from their'
+                          ' start instead of their end',
+            'previous_log_suffix': 'suffix of a rotated metrics file',
         })
         return config_help
 
@@ -38,21 +60,52 @@ class HadoopCollector(diamond.collector.Collector):
             'path':     'hadoop',
             'method':   'Threaded',
             'metrics':  ['/var/log/hadoop/*-metrics.out'],
+            'checkpoint_file': '',
+            'from_start': True,
+            'previous_log_suffix': '.1',
         })
         return config
 
     def collect(self):
+        if self.positions is None:
+            self.positions = {}
+            if self.config['checkpoint_file']:
+                self.positions = load_checkpoints(
+                    self.config['checkpoint_file'])
+
         for pattern in self.config['metrics']:
             for filename in glob.glob(pattern):
                 self.collect_from(filename)
 
+        if self.config['checkpoint_file']:
+            positions = {}
+            for filename, tailer in self.tailers.iteritems():
+                if tailer.position is not None:
+                    positions[filename] = tailer.position
+            try:
+                save_checkpoints(self.config['checkpoint_file'], positions)
+            except (IOError, OSError), e:
+                self.log.error('Cannot save checkpoints to %s: %s',
+                               self.config['checkpoint_file'], e)
+
+    def get_tailer(self, filename):
+        tailer = self.tailers.get(filename)
+        if tailer is None:
+            tailer = LogTailer(
+                filename, self.config['previous_log_suffix'],
+                position=self.positions.get(filename),
+                from_start=diamond.collector.str_to_bool(
+                    self.config['from_start']),
+                log=self.log)
+            self.tailers[filename] = tailer
+        return tailer
+
     def collect_from(self, filename):
         if not os.access(filename, os.R_OK):
             self.log.error('HadoopCollector unable to read "%s"', filename)
             return False
 
-        fd = open(filename, 'r')
-        for line in fd:
+        for line in self.get_tailer(filename).read_lines():
             match = self.re_log.match(line)
             if not match:
                 continue
@@ -108,4 +161,3 @@ class HadoopCollector(diamond.collector.Collector):
 
                 except ValueError:
                     pass
-        fd.close()
@@ -11,6 +11,8 @@ from diamond.collector import Collector
 from hadoop import HadoopCollector
 
 import os
+import shutil
+import tempfile
 
 ################################################################################
 
@@ -37,6 +39,54 @@ class TestHadoopCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMetricMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish_metric')
+    def test_should_only_read_new_records(self, publish_mock):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'dfs-metrics.out')
+            config = get_collector_config('HadoopCollector', {
+                'metrics': [os.path.join(tmpdir, '*-metrics.out')],
+                'checkpoint_file': os.path.join(tmpdir, 'checkpoint'),
+            })
+            collector = HadoopCollector(config, {})
+
+            metrics = open(filename, 'w')
+            metrics.write('100 dfs.datanode: bytes_read=1\n'
+                          '200 dfs.datanode: bytes_read=2\n'
+                          '300 dfs.datanode: bytes_read=')
+            metrics.close()
+            collector.collect()
+            self.assertEquals(
+                [(m.value, m.timestamp) for ((m,), _)
+                 in publish_mock.call_args_list], [(1, 100), (2, 200)])
+
+            # The partly written record is finished
+            metrics = open(filename, 'a')
+            metrics.write('3\n')
+            metrics.close()
+            publish_mock.reset_mock()
+            collector.collect()
+            self.assertEquals(
+                [(m.value, m.timestamp) for ((m,), _)
+                 in publish_mock.call_args_list], [(3, 300)])
+
+            # A new collector stands in for a restarted diamond
+            collector = HadoopCollector(config, {})
+            publish_mock.reset_mock()
+            collector.collect()
+            self.assertEquals(publish_mock.call_count, 0)
+
+            # Truncated by logrotate's copytruncate
+            metrics = open(filename, 'w')
+            metrics.write('400 dfs.datanode: bytes_read=4\n')
+            metrics.close()
+            collector.collect()
+            self.assertEquals(
+                [(m.value, m.timestamp) for ((m,), _)
+                 in publish_mock.call_args_list], [(4, 400)])
+        finally:
+            shutil.rmtree(tmpdir)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
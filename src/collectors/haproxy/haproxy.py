@@ -5,20 +5,21 @@ Collect HAProxy Stats
 
 #### Dependencies
 
- * urlparse
- * urllib2
+ * httplib
 
 """
 
-import re
-import urllib2
-import base64
 import csv
 import diamond.collector
+import diamond.httpclient
 
 
 class HAProxyCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(HAProxyCollector, self).__init__(config, handlers)
+        self.client = None
+
     def get_default_config_help(self):
         config_help = super(HAProxyCollector, self).get_default_config_help()
         config_help.update({
@@ -48,51 +49,23 @@ class HAProxyCollector(diamond.collector.Collector):
         """
         Request stats from HAProxy Server
         """
-        metrics = []
-        req = urllib2.Request(self.config['url'])
+        if self.client is None:
+            # Send the credentials with the first request, rather than
+            # waiting to be refused without them
+            self.client = diamond.httpclient.get_client(
+                self.config, username=self.config['user'],
+                password=self.config['pass'])
         try:
-            handle = urllib2.urlopen(req)
-            return handle.readlines()
-        except Exception, e:
-            if not hasattr(e, 'code') or e.code != 401:
+            return self.client.get(self.config['url']).readlines()
+        except diamond.httpclient.HTTPError, e:
+            if e.code == 401:
+                self.log.error("Error retrieving HAProxy stats. (Invalid "
+                               + "username or password?) %s", e)
+            else:
                 self.log.error("Error retrieving HAProxy stats. %s", e)
-                return metrics
-
-        # get the www-authenticate line from the headers
-        # which has the authentication scheme and realm in it
-        authline = e.headers['www-authenticate']
-
-        # this regular expression is used to extract scheme and realm
-        authre = (r'''(?:\s*www-authenticate\s*:)?\s*'''
-                  + '''(\w*)\s+realm=['"]([^'"]+)['"]''')
-        authobj = re.compile(authre, re.IGNORECASE)
-        matchobj = authobj.match(authline)
-        if not matchobj:
-            # if the authline isn't matched by the regular expression
-            # then something is wrong
-            self.log.error('The authentication header is malformed.')
-            return metrics
-
-        scheme = matchobj.group(1)
-        # here we've extracted the scheme
-        # and the realm from the header
-        if scheme.lower() != 'basic':
-            self.log.error('Invalid authentication scheme.')
-            return metrics
-
-        base64string = base64.encodestring(
-            '%s:%s' % (self.config['user'], self.config['pass']))[:-1]
-        authheader = 'Basic %s' % base64string
-        req.add_header("Authorization", authheader)
-        try:
-            handle = urllib2.urlopen(req)
-            metrics = handle.readlines()
-            return metrics
         except IOError, e:
-            # here we shouldn't fail if the USER/PASS is right
-            self.log.error("Error retrieving HAProxy stats. (Invalid username "
-                           + "or password?) %s", e)
-            return metrics
+            self.log.error("Error retrieving HAProxy stats. %s", e)
+        return []
 
     def _generate_headings(self, row):
         headings = {}
@@ -106,6 +79,8 @@ class HAProxyCollector(diamond.collector.Collector):
         """
         csv_data = self.get_csv_data()
         data = list(csv.reader(csv_data))
+        if not data:
+            return
         headings = self._generate_headings(data[0])
 
         for row in data:
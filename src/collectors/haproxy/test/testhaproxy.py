@@ -29,12 +29,12 @@ class TestHAProxyCollector(CollectorTestCase):
     def test_should_work_with_real_data(self, publish_mock):
         self.collector.config['ignore_servers'] = False
 
-        patch_urlopen = patch('urllib2.urlopen',
-                              Mock(return_value=self.getFixture('stats.csv')))
+        patch_get = patch('diamond.httpclient.HTTPClient.get',
+                          Mock(return_value=self.getResponse('stats.csv')))
 
-        patch_urlopen.start()
+        patch_get.start()
         self.collector.collect()
-        patch_urlopen.stop()
+        patch_get.stop()
 
         metrics = self.getPickledResults('real_data.pkl')
 
@@ -47,12 +47,12 @@ class TestHAProxyCollector(CollectorTestCase):
     def test_should_work_with_real_data_and_ignore_servers(self, publish_mock):
         self.collector.config['ignore_servers'] = True
 
-        patch_urlopen = patch('urllib2.urlopen',
-                              Mock(return_value=self.getFixture('stats.csv')))
+        patch_get = patch('diamond.httpclient.HTTPClient.get',
+                          Mock(return_value=self.getResponse('stats.csv')))
 
-        patch_urlopen.start()
+        patch_get.start()
         self.collector.collect()
-        patch_urlopen.stop()
+        patch_get.stop()
 
         metrics = self.getPickledResults('real_data_ignore_servers.pkl')
 
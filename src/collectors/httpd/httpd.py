@@ -7,20 +7,19 @@ Collect stats from Apache HTTPD server using mod_status
 
  * mod_status
  * httplib
- * urlparse
 
 """
 
 import re
-import httplib
-import urlparse
 import diamond.collector
+import diamond.httpclient
 
 
 class HttpdCollector(diamond.collector.Collector):
 
     def __init__(self, *args, **kwargs):
         super(HttpdCollector, self).__init__(*args, **kwargs)
+        self.client = None
         if 'url' in self.config:
             self.config['urls'].append(self.config['url'])
 
@@ -53,48 +52,24 @@ class HttpdCollector(diamond.collector.Collector):
         return config
 
     def collect(self):
+        if self.client is None:
+            self.client = diamond.httpclient.get_client(self.config)
+
+        # Fetch all the servers at once
+        responses = self.client.fetch_many(set(self.urls.values()))
+
         for nickname in self.urls.keys():
             url = self.urls[nickname]
 
             metrics = ['ReqPerSec', 'BytesPerSec', 'BytesPerReq',
                        'BusyWorkers', 'IdleWorkers', 'Total Accesses']
 
-            try:
-                while True:
-
-                    # Parse Url
-                    parts = urlparse.urlparse(url)
-
-                    # Parse host and port
-                    endpoint = parts[1].split(':')
-                    if len(endpoint) > 1:
-                        service_host = endpoint[0]
-                        service_port = int(endpoint[1])
-                    else:
-                        service_host = endpoint[0]
-                        service_port = 80
-
-                    # Setup Connection
-                    connection = httplib.HTTPConnection(service_host,
-                                                        service_port)
-
-                    url = "%s?%s" % (parts[2], parts[4])
-
-                    connection.request("GET", url)
-                    response = connection.getresponse()
-                    data = response.read()
-                    headers = dict(response.getheaders())
-                    if ('location' not in headers
-                        or headers['location'] == url):
-                        connection.close()
-                        break
-                    url = headers['location']
-                    connection.close()
-            except Exception, e:
-                self.log.error(
-                    "Error retrieving HTTPD stats for host %s:%s, url '%s': %s",
-                    service_host, str(service_port), url, e)
+            response = responses[url]
+            if isinstance(response, Exception):
+                self.log.error("Error retrieving HTTPD stats for url '%s': %s",
+                               url, response)
                 continue
+            data = response.read()
 
             exp = re.compile('^([A-Za-z ]+):\s+(.+)$')
             for line in data.split('\n'):
@@ -16,6 +16,10 @@ import httplib
 
 
 class TestHTTPResponse(httplib.HTTPResponse):
+    status = 200
+    reason = 'OK'
+    will_close = False
+
     def __init__(self):
         pass
 
@@ -28,7 +32,7 @@ class TestHttpdCollector(CollectorTestCase):
         if config is None:
             config = get_collector_config('HttpdCollector', {
                 'interval': '10',
-                'url':      ''
+                'url':      'http://localhost:8080/server-status?auto'
             })
         else:
             config = get_collector_config('HttpdCollector', config)
@@ -37,9 +41,13 @@ class TestHttpdCollector(CollectorTestCase):
 
         self.HTTPResponse = TestHTTPResponse()
 
-        httplib.HTTPConnection.request = Mock(return_value=True)
-        httplib.HTTPConnection.getresponse = Mock(
-            return_value=self.HTTPResponse)
+        for patcher in (
+                patch.object(httplib.HTTPConnection, 'request',
+                             Mock(return_value=True)),
+                patch.object(httplib.HTTPConnection, 'getresponse',
+                             Mock(return_value=self.HTTPResponse))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def test_import(self):
         self.assertTrue(HttpdCollector)
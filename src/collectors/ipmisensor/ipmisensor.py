@@ -6,6 +6,10 @@ hardware sensors from servers
 using the Intelligent Platform Management Interface (IPMI). IPMI is very common
 with server hardware but usually not available in consumer hardware.
 
+Asking the BMC for its sensors can take seconds, so it is only asked every
+*probe_intervals* intervals, and the values read last are published in
+between.
+
 #### Dependencies
 
  * [ipmitool](http://openipmi.sourceforge.net/)
@@ -13,20 +17,28 @@ with server hardware but usually not available in consumer hardware.
 """
 
 import diamond.collector
-import subprocess
+from diamond.collector import str_to_bool
 import os
 import re
-import getpass
 
 
 class IPMISensorCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(IPMISensorCollector, self).__init__(*args, **kwargs)
+        # Sensor values read at the last probe
+        self.sensors = None
+        # Intervals until the next probe
+        self.countdown = 0
+
     def get_default_config_help(self):
         config_help = super(IPMISensorCollector, self).get_default_config_help()
         config_help.update({
             'bin': 'Path to the ipmitool binary',
             'use_sudo': 'Use sudo?',
             'sudo_cmd': 'Path to sudo',
+            'probe_intervals': 'Read the sensors every this many intervals,'
+                               ' publishing the last values in between',
         })
         return config_help
 
@@ -39,26 +51,19 @@ class IPMISensorCollector(diamond.collector.Collector):
             'bin':              '/usr/bin/ipmitool',
             'use_sudo':         False,
             'sudo_cmd':         '/usr/bin/sudo',
-            'path':             'ipmi.sensors'
+            'path':             'ipmi.sensors',
+            'probe_intervals':  3,
         })
         return config
 
-    def collect(self):
-        if (not os.access(self.config['bin'], os.X_OK)
-            or (self.config['use_sudo']
-                and not os.access(self.config['sudo_cmd'], os.X_OK))):
-            return False
-
-        command = [self.config['bin'], 'sensor']
-
-        if self.config['use_sudo'] and getpass.getuser() != 'root':
-            command.insert(0, self.config['sudo_cmd'])
-
-        p = subprocess.Popen(command,
-                             stdout=subprocess.PIPE).communicate()[0][:-1]
-
-        for i, v in enumerate(p.split("\n")):
-            data = v.split("|")
+    def parse_sensors(self, output):
+        """
+        Returns [(name, value)] for the sensors in the output of ipmitool
+        sensor
+        """
+        sensors = []
+        for line in output.splitlines():
+            data = line.split("|")
             try:
                 # Complex keys are fun!
                 metric_name = data[0].strip().replace(".",
@@ -73,13 +78,32 @@ class IPMISensorCollector(diamond.collector.Collector):
                 vmatch = re.search("([0-9.]+)", value)
                 if not vmatch:
                     continue
-                metric_value = float(vmatch.group(1))
-
-                # Publish
-                self.publish(metric_name, metric_value)
+                sensors.append((metric_name, float(vmatch.group(1))))
             except ValueError:
                 continue
             except IndexError:
                 continue
+        return sensors
+
+    def collect(self):
+        if (not os.access(self.config['bin'], os.X_OK)
+            or (str_to_bool(self.config['use_sudo'])
+                and not os.access(self.config['sudo_cmd'], os.X_OK))):
+            return False
+
+        if self.countdown <= 0 or self.sensors is None:
+            try:
+                output = self.run_command([self.config['bin'],
+                                           'sensor']).stdout
+            except OSError, e:
+                self.log.error("Cannot run %s: %s", self.config['bin'], e)
+                self.sensors = None
+                return False
+            self.sensors = self.parse_sensors(output)
+            self.countdown = int(self.config['probe_intervals'])
+        self.countdown -= 1
+
+        for metric_name, metric_value in self.sensors:
+            self.publish(metric_name, metric_value)
 
         return True
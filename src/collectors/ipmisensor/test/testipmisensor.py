@@ -81,6 +81,21 @@ class TestIPMISensorCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch('os.access', Mock(return_value=True))
+    @patch.object(Collector, 'publish')
+    def test_should_republish_between_probes(self, publish_mock):
+        with patch.object(self.collector, 'run_command') as run_command:
+            run_command.return_value.stdout = self.getFixture(
+                'ipmitool.out').getvalue()
+            for i in range(4):
+                self.collector.collect()
+
+        # Probed on the first and fourth runs, published on every one
+        self.assertEquals(run_command.call_count, 2)
+        self.assertEquals(
+            [c[0] for c in publish_mock.call_args_list].count(
+                ('System.Temp', 32.0)), 4)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
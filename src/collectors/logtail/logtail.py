@@ -0,0 +1,208 @@
+# coding=utf-8
+
+"""
+Collects metrics from the lines appended to log files since the last run.
+
+Each log is described by a subsection of `logs`, naming a parser and the
+fields to aggregate. Fields come from the named groups of a regex, the
+positions or names of split fields, or the top level keys of JSON lines.
+
+Example config file LogTailCollector.conf
+
+```
+enabled = True
+checkpoint_file = /var/lib/diamond/logtail.json
+[logs]
+[[nginx]]
+# in nginx.conf: log_format diamond '$remote_addr $request_method $status '
+#                                   '$body_bytes_sent $request_time';
+path = /var/log/nginx/diamond.log
+parser = split
+fields = client method status bytes request_time
+counters = status, method
+histograms = request_time
+sums = bytes
+uniques = client
+
+[[sshd]]
+path = /var/log/auth.log
+parser = regex
+regex = .* sshd\[\d+\]: (?P<result>Accepted|Failed) \S+ for (?P<user>\S+)
+counters = result
+uniques = user
+
+[[app]]
+path = /var/log/app/events.log
+parser = json
+counters = level
+```
+
+For each log this publishes:
+
+ * lines and unparsed - the number of lines parsed and not parsed
+ * <field>.<value> - the number of lines per value of each counters field
+ * <field>.sum - the total of each sums field
+ * <field>.avg, <field>.p50, <field>.p95, <field>.p99 - for each histograms
+   field
+ * <field>.unique - estimated distinct values of each uniques field
+
+With a checkpoint_file the position in each log is saved after every run,
+so a restarted diamond carries on where it stopped. Logs without a saved
+position are read from their end, unless from_start is set.
+
+"""
+
+import diamond.collector
+from diamond.sketch import HyperLogLog, QuantileSketch
+from diamond.tailer import LogTailer
+from diamond.tailer import get_parser
+from diamond.tailer import load_checkpoints
+from diamond.tailer import save_checkpoints
+
+
+def split_list(value):
+    if isinstance(value, basestring):
+        value = value.replace(',', ' ').split()
+    return list(value)
+
+
+class LogTailCollector(diamond.collector.Collector):
+
+    def __init__(self, config, handlers):
+        super(LogTailCollector, self).__init__(config, handlers)
+        self.logs = None
+
+    def get_default_config_help(self):
+        config_help = super(LogTailCollector, self).get_default_config_help()
+        config_help.update({
+            'checkpoint_file': 'File to save the position in each log to'
+                               ' between runs and restarts',
+            'from_start': 'Read logs without a saved position from their'
+                          ' start instead of their end',
+            'previous_log_suffix': 'suffix of a rotated log (for rollovers)',
+            'logs': ("A subcategory of settings inside of which each log"
+                     " has its configuration"),
+        })
+        return config_help
+
+    def get_default_config(self):
+        """
+        Returns the default collector settings
+        """
+        config = super(LogTailCollector, self).get_default_config()
+        config.update({
+            'path': 'logtail',
+            'checkpoint_file': '',
+            'from_start': False,
+            'previous_log_suffix': '.1',
+            'logs': {},
+        })
+        return config
+
+    def setup_logs(self):
+        """
+        prepare self.logs, which is a descriptor dictionary in
+        log name --> {
+            tailer: LogTailer,
+            parser: parser,
+            counters, histograms, sums, uniques: [field]
+        }
+        """
+        positions = {}
+        if self.config['checkpoint_file']:
+            positions = load_checkpoints(self.config['checkpoint_file'])
+        from_start = diamond.collector.str_to_bool(self.config['from_start'])
+
+        self.logs = {}
+        for name, cfg in self.config['logs'].items():
+            log = {
+                'tailer': LogTailer(cfg['path'],
+                                    self.config['previous_log_suffix'],
+                                    position=positions.get(cfg['path']),
+                                    from_start=from_start,
+                                    log=self.log),
+                'parser': get_parser(cfg),
+            }
+            for key in ('counters', 'histograms', 'sums', 'uniques'):
+                log[key] = split_list(cfg.get(key, []))
+            self.logs[name] = log
+
+    def collect_log(self, name, log):
+        lines = 0
+        unparsed = 0
+        counters = dict((f, {}) for f in log['counters'])
+        histograms = dict((f, QuantileSketch()) for f in log['histograms'])
+        sums = dict((f, 0.0) for f in log['sums'])
+        uniques = dict((f, HyperLogLog()) for f in log['uniques'])
+        parse = log['parser'].parse
+
+        for line in log['tailer'].read_lines():
+            fields = parse(line)
+            if fields is None:
+                unparsed += 1
+                continue
+            lines += 1
+
+            for field, counts in counters.iteritems():
+                value = fields.get(field)
+                if value is not None:
+                    if not isinstance(value, basestring):
+                        value = str(value)
+                    counts[value] = counts.get(value, 0) + 1
+            for field, sketch in histograms.iteritems():
+                try:
+                    sketch.add(float(fields[field]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            for field in sums:
+                try:
+                    sums[field] += float(fields[field])
+                except (KeyError, TypeError, ValueError):
+                    pass
+            for field, sketch in uniques.iteritems():
+                value = fields.get(field)
+                if value:
+                    if not isinstance(value, basestring):
+                        value = str(value)
+                    sketch.add(value)
+
+        self.publish('%s.lines' % name, lines)
+        self.publish('%s.unparsed' % name, unparsed)
+        for field, counts in counters.iteritems():
+            for value, count in counts.iteritems():
+                value = value.replace('.', '_').replace(' ', '_').replace(
+                    '/', '_')
+                self.publish('%s.%s.%s' % (name, field, value), count)
+        for field, sketch in histograms.iteritems():
+            if sketch.count == 0:
+                continue
+            self.publish('%s.%s.avg' % (name, field),
+                         sketch.total / sketch.count, precision=3)
+            for label, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                self.publish('%s.%s.%s' % (name, field, label),
+                             sketch.quantile(q), precision=3)
+        for field, total in sums.iteritems():
+            self.publish('%s.%s.sum' % (name, field), total)
+        for field, sketch in uniques.iteritems():
+            self.publish('%s.%s.unique' % (name, field), sketch.count())
+
+    def collect(self):
+        if self.logs is None:
+            self.setup_logs()
+
+        for name, log in self.logs.iteritems():
+            try:
+                self.collect_log(name, log)
+            except Exception, e:
+                self.log.error('Error reading log %s: %s', name, e)
+
+        if self.config['checkpoint_file']:
+            positions = {}
+            for log in self.logs.itervalues():
+                if log['tailer'].position is not None:
+                    positions[log['tailer'].path] = log['tailer'].position
+            try:
+                save_checkpoints(self.config['checkpoint_file'], positions)
+            except (IOError, OSError), e:
+                self.log.error('Cannot save log checkpoints to %s: %s',
+                               self.config['checkpoint_file'], e)
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import os
+import shutil
+import tempfile
+from test import CollectorTestCase
+from test import get_collector_config
+from test import unittest
+from mock import patch
+
+from diamond.collector import Collector
+from logtail import LogTailCollector
+
+################################################################################
+
+
+class TestLogTailCollector(CollectorTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.access_log = os.path.join(self.tmpdir, 'access.log')
+        self.events_log = os.path.join(self.tmpdir, 'events.log')
+        shutil.copy(self.getFixturePath('access.log'), self.access_log)
+        shutil.copy(self.getFixturePath('events.log'), self.events_log)
+
+        config = get_collector_config('LogTailCollector', {
+            'interval': 10,
+            'from_start': 'True',
+            'checkpoint_file': os.path.join(self.tmpdir, 'checkpoint'),
+            'logs': {
+                'nginx': {
+                    'path': self.access_log,
+                    'parser': 'regex',
+                    'regex': (r'^(?P<client>\S+) \S+ \S+ \[[^]]+\] '
+                              r'"(?P<method>\S+) [^"]*" (?P<status>\d+) '
+                              r'(?P<bytes>\d+) (?P<request_time>\S+)'),
+                    'counters': 'status, method',
+                    'histograms': 'request_time',
+                    'sums': 'bytes',
+                    'uniques': 'client',
+                },
+                'app': {
+                    'path': self.events_log,
+                    'parser': 'json',
+                    'counters': 'level',
+                    'histograms': 'duration',
+                },
+            },
+        })
+
+        self.collector = LogTailCollector(config, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_import(self):
+        self.assertTrue(LogTailCollector)
+
+    @patch.object(Collector, 'publish')
+    def test_should_work_with_real_data(self, publish_mock):
+        self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'nginx.lines': 4,
+            'nginx.unparsed': 1,
+            'nginx.status.200': 3,
+            'nginx.status.404': 1,
+            'nginx.method.GET': 3,
+            'nginx.method.POST': 1,
+            'nginx.bytes.sum': 5292,
+            'nginx.client.unique': 3,
+            'nginx.request_time.avg': (0.056, 3),
+            'app.lines': 3,
+            'app.unparsed': 1,
+            'app.level.info': 2,
+            'app.level.error': 1,
+            'app.duration.avg': (2.25, 2),
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_resume_from_checkpoint(self, publish_mock):
+        self.collector.collect()
+
+        log = open(self.access_log, 'a')
+        log.write('10.0.0.4 - - [10/Oct/2013:13:56:00 -0700] '
+                  '"GET / HTTP/1.1" 500 0 1.000\n')
+        log.close()
+
+        # A new collector stands in for a restarted diamond
+        collector = LogTailCollector(
+            get_collector_config('LogTailCollector', self.collector.config),
+            None)
+        publish_mock.reset_mock()
+        collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'nginx.lines': 1,
+            'nginx.status.500': 1,
+            'app.lines': 0,
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_finish_rotated_log(self, publish_mock):
+        self.collector.collect()
+
+        log = open(self.access_log, 'a')
+        log.write('10.0.0.4 - - [10/Oct/2013:13:56:00 -0700] '
+                  '"GET / HTTP/1.1" 500 0 1.000\n')
+        log.close()
+        os.rename(self.access_log, self.access_log + '.1')
+        log = open(self.access_log, 'w')
+        log.write('10.0.0.5 - - [10/Oct/2013:13:56:01 -0700] '
+                  '"GET / HTTP/1.1" 503 0 1.000\n'
+                  '10.0.0.6 - - [10/Oct/2013:13:56:02 -0700] "GET')
+        log.close()
+        publish_mock.reset_mock()
+        self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'nginx.lines': 2,
+            'nginx.status.500': 1,
+            'nginx.status.503': 1,
+        })
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,10 @@
 """
 Collect memcached stats
 
-#### Dependencies
-
- * subprocess
+Hosts are polled in parallel, over connections kept open between runs. With
+*slabs* enabled the per slab class results of 'stats slabs' and
+'stats items' are published too, as slabs.<class>.<stat> and
+items.<class>.<stat>.
 
 #### Example Configuration
 
@@ -19,12 +20,24 @@ MemcachedCollector.conf
 """
 
 import diamond.collector
+from diamond.collector import str_to_bool
+from diamond.parallel import run_parallel
+from diamond.socketclient import SocketClient
 import socket
 import re
 
+# Stats that are always ignored, as they aren't numbers
+IGNORED = ('libevent', 'pid', 'pointer_size', 'time', 'version',
+           'repcached_version', 'replication')
+
 
 class MemcachedCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(MemcachedCollector, self).__init__(*args, **kwargs)
+        # Clients per (host, port), kept between runs
+        self.clients = {}
+
     def get_default_config_help(self):
         config_help = super(MemcachedCollector, self).get_default_config_help()
         config_help.update({
@@ -33,6 +46,9 @@ class MemcachedCollector(diamond.collector.Collector):
             + " of possibilities. Leave unset to publish all.",
             'hosts': "List of hosts, and ports to collect. Set an alias by "
             + " prefixing the host:port with alias@",
+            'timeout': 'Seconds to wait for a host to answer',
+            'slabs': "Publish the results of 'stats slabs' and 'stats items'",
+            'max_threads': 'Number of hosts polled at the same time',
         })
         return config_help
 
@@ -51,41 +67,75 @@ class MemcachedCollector(diamond.collector.Collector):
             #'publish': ''
 
             # Connection settings
-            'hosts': ['localhost:11211']
+            'hosts': ['localhost:11211'],
+            'timeout': 5,
+
+            'slabs': False,
+            'max_threads': 8,
         })
         return config
 
     def get_raw_stats(self, host, port):
-        data = ''
-        # connect
+        """
+        Returns the lines of the responses to the stats commands, or '' if
+        the host cannot be reached
+        """
+        commands = ['stats']
+        if str_to_bool(self.config['slabs']):
+            commands.extend(['stats slabs', 'stats items'])
+
+        def read(client):
+            lines = []
+            for command in commands:
+                while True:
+                    line = client.read_line()
+                    if line == 'END':
+                        break
+                    if line.endswith('ERROR') or line.startswith(
+                            ('CLIENT_ERROR', 'SERVER_ERROR')):
+                        raise IOError("'%s' failed: %s" % (command, line))
+                    lines.append(line)
+            return lines
+
+        client = self.clients.get((host, port))
+        if client is None:
+            client = SocketClient(host, port, self.config['timeout'])
+            self.clients[(host, port)] = client
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect((host, int(port)))
-            # request stats
-            sock.send('stats\n')
-            # something big enough to get whatever is sent back
-            data = sock.recv(4096)
-        except socket.error:
-            self.log.exception('Failed to get stats from %s:%s',
-                               host, port)
-        return data
+            # The commands are sent together and answered in order
+            lines = client.request(
+                ''.join('%s\r\n' % command for command in commands), read)
+        except (socket.error, IOError), e:
+            self.log.error('Failed to get stats from %s:%s: %s',
+                           host, port, e)
+            return ''
+        return '\n'.join(lines)
 
     def get_stats(self, host, port):
-        # stuff that's always ignored, aren't 'stats'
-        ignored = ('libevent', 'pid', 'pointer_size', 'time', 'version',
-                   'repcached_version', 'replication')
-
+        """
+        Returns (stats, per slab class stats)
+        """
         stats = {}
+        slabs = {}
         data = self.get_raw_stats(host, int(port))
 
         # parse stats
         for line in data.splitlines():
             pieces = line.split(' ')
-            if pieces[0] != 'STAT' or pieces[1] in ignored:
+            if pieces[0] != 'STAT' or len(pieces) < 3:
                 continue
-            stats[pieces[1]] = pieces[2]
-
-        return stats
+            name = pieces[1]
+            if ':' in name:
+                # 1:chunk_size from stats slabs, items:1:number from stats
+                # items
+                parts = name.split(':')
+                if len(parts) == 2:
+                    parts.insert(0, 'slabs')
+                slabs['.'.join(parts)] = pieces[2]
+            elif name not in IGNORED:
+                stats[name] = pieces[2]
+
+        return stats, slabs
 
     def collect(self):
         hosts = self.config.get('hosts')
@@ -94,16 +144,30 @@ class MemcachedCollector(diamond.collector.Collector):
         if isinstance(hosts, basestring):
             hosts = [hosts]
 
+        servers = []
         for host in hosts:
             matches = re.search('((.+)\@)?([^:]+):(\d+)', host)
             alias = matches.group(2)
             hostname = matches.group(3)
-            port = matches.group(4)
+            port = int(matches.group(4))
 
             if alias is None:
                 alias = hostname
+            servers.append((alias, hostname, port))
+
+        results = run_parallel(
+            lambda server: self.get_stats(server[1], server[2]),
+            servers, int(self.config['max_threads']))
+
+        for (alias, hostname, port), result in zip(servers, results):
+            if isinstance(result, Exception):
+                self.log.error('Failed to get stats from %s:%s: %s',
+                               hostname, port, result)
+                continue
+            stats, slabs = result
 
-            stats = self.get_stats(hostname, port)
+            for stat, value in slabs.iteritems():
+                self.publish(alias + "." + stat, value)
 
             # figure out what we're configured to get, defaulting to everything
             desired = self.config.get('publish', stats.keys())
@@ -89,6 +89,29 @@ class TestMemcachedCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_should_publish_slab_stats(self, publish_mock):
+        data = '\n'.join([
+            'STAT uptime 25763',
+            'STAT 1:chunk_size 96',
+            'STAT 1:used_chunks 10',
+            'STAT active_slabs 1',
+            'STAT items:1:number 10',
+            'STAT items:1:evicted 2',
+        ])
+        with patch.object(MemcachedCollector, 'get_raw_stats',
+                          Mock(return_value=data)):
+            self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'localhost.uptime': 25763,
+            'localhost.active_slabs': 1,
+            'localhost.slabs.1.chunk_size': 96,
+            'localhost.slabs.1.used_chunks': 10,
+            'localhost.items.1.number': 10,
+            'localhost.items.1.evicted': 2,
+        })
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
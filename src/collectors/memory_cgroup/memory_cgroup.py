@@ -8,12 +8,20 @@ cache - # of bytes of page cache memory.
 rss   - # of bytes of anonymous and swap cache memory.
 swap  - # of bytes of swap usage
 
+On a unified (v2) hierarchy the same names are published from the anon and
+file entries of memory.stat and from memory.swap.current.
+
+The list of cgroups is cached and only rediscovered every
+discovery_interval seconds.
+
 #### Dependencies
 
-/sys/fs/cgroup/memory/memory.stat
+/sys/fs/cgroup/memory/memory.stat or /sys/fs/cgroup/**/memory.stat (v2)
 """
 
 import diamond.collector
+import diamond.convertor
+import diamond.cgroup
 import os
 
 _KEY_MAPPING = [
@@ -22,14 +30,29 @@ _KEY_MAPPING = [
     'swap'
 ]
 
+# cgroup v2 memory.stat names of the values above
+_V2_KEY_MAPPING = {
+    'anon': 'rss',
+    'file': 'cache',
+}
+
 
 class MemoryCgroupCollector(diamond.collector.Collector):
     MEMORY_PATH = '/sys/fs/cgroup/memory/'
+    CGROUP2_PATH = diamond.cgroup.CGROUP2_PATH
+
+    def __init__(self, config, handlers):
+        super(MemoryCgroupCollector, self).__init__(config, handlers)
+        self.cgroups = None
 
     def get_default_config_help(self):
         config_help = super(
             MemoryCgroupCollector, self).get_default_config_help()
         config_help.update({
+            'discovery_interval': 'Seconds between walks of the cgroup'
+                                  ' hierarchy to find new cgroups',
+            'include': 'Only collect cgroups matching these globs',
+            'exclude': 'Do not collect cgroups matching these globs',
         })
         return config_help
 
@@ -41,45 +64,71 @@ class MemoryCgroupCollector(diamond.collector.Collector):
         config.update({
             'path':     'memory_cgroup',
             'method':   'Threaded',
+            'discovery_interval': 300,
+            'include': [],
+            'exclude': [],
         })
         return config
 
+    def get_cgroup_tree(self):
+        """
+        Create the cached cgroup tree, preferring a v1 memory hierarchy
+        """
+        include = self.config['include']
+        if isinstance(include, basestring):
+            include = include.split()
+        exclude = self.config['exclude']
+        if isinstance(exclude, basestring):
+            exclude = exclude.split()
+
+        if (not os.path.exists(self.MEMORY_PATH)
+                and diamond.cgroup.is_cgroup2(self.CGROUP2_PATH)):
+            root = self.CGROUP2_PATH
+            filenames = ['memory.stat', 'memory.swap.current']
+        else:
+            root = self.MEMORY_PATH
+            filenames = ['memory.stat']
+
+        return diamond.cgroup.CgroupTree(
+            root, filenames,
+            refresh_interval=self.config['discovery_interval'],
+            include=include, exclude=exclude)
+
     def collect(self):
-        # find all memory.stat files
-        matches = []
-        for root, dirnames, filenames in os.walk(self.MEMORY_PATH):
-            for filename in filenames:
-                if filename == 'memory.stat':
-                    # matches will contain a tuple contain path to cpuacct.stat
-                    # and the parent of the stat
-                    parent = root.replace(self.MEMORY_PATH,
-                                          "").replace("/", ".")
-                    if parent == '':
-                        parent = 'system'
-                    matches.append((parent, os.path.join(root, filename)))
-
-        # Read metrics from cpuacct files
+        if self.cgroups is None:
+            self.cgroups = self.get_cgroup_tree()
+        cgroup2 = 'memory.swap.current' in self.cgroups.filenames
+
+        # Read metrics from memory.stat files
         results = {}
-        for match in matches:
-            results[match[0]] = {}
-            stat_file = open(match[1])
-            elements = [line.split() for line in stat_file]
-            stat_file.close()
+        for parent in self.cgroups.get_cgroups().keys():
+            data = self.cgroups.read(parent, 'memory.stat')
+            if data is None:
+                continue
+            results[parent] = {}
+            elements = [line.split() for line in data.splitlines()]
+
+            if cgroup2:
+                swap = self.cgroups.read(parent, 'memory.swap.current')
+                if swap:
+                    elements.append(['swap', swap.strip()])
 
             for el in elements:
                 name, value = el
+                if cgroup2 and name in _V2_KEY_MAPPING:
+                    name = _V2_KEY_MAPPING[name]
                 if name not in _KEY_MAPPING:
                     continue
                 for unit in self.config['byte_unit']:
                     value = diamond.convertor.binary.convert(
                         value=value, oldUnit='B', newUnit=unit)
-                    results[match[0]][name] = value
+                    results[parent][name] = value
                     # TODO: We only support one unit node here. Fix it!
                     break
 
-        # create metrics from collected utimes and stimes for cgroups
-        for parent, cpuacct in results.iteritems():
-            for key, value in cpuacct.iteritems():
+        # create metrics from collected memory stats for cgroups
+        for parent, memory in results.iteritems():
+            for key, value in memory.iteritems():
                 metric_name = '.'.join([parent, key])
                 self.publish(metric_name, value, metric_type='GAUGE')
         return True
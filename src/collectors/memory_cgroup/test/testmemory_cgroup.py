@@ -64,5 +64,39 @@ class TestMemoryCgroupCollector(CollectorTestCase):
             'system.swap': 1,
         })
 
+    @patch.object(Collector, 'publish')
+    def test_should_cache_discovered_cgroups(self, publish_mock):
+        MemoryCgroupCollector.MEMORY_PATH = fixtures_path
+        with patch('os.walk', Mock(return_value=iter(fixtures))) as walk:
+            self.collector.collect()
+            self.collector.collect()
+            self.assertEqual(walk.call_count, 1)
+
+    @patch.object(Collector, 'publish')
+    def test_should_exclude_cgroups(self, publish_mock):
+        MemoryCgroupCollector.MEMORY_PATH = fixtures_path
+        self.collector.config['exclude'] = 'lxc.*'
+        self.collector.collect()
+
+        published = [c[0][0] for c in publish_mock.call_args_list]
+        self.assertTrue('lxc.cache' in published)
+        self.assertTrue('system.cache' in published)
+        self.assertFalse('lxc.testcontainer.cache' in published)
+
+    @patch.object(Collector, 'publish')
+    def test_should_work_with_cgroup2_data(self, publish_mock):
+        self.collector.MEMORY_PATH = fixtures_path + 'missing/'
+        self.collector.CGROUP2_PATH = fixtures_path + 'cgroup2/'
+        self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'docker.cache': 4,
+            'docker.rss': 2,
+            'docker.swap': 1,
+            'docker.abc.cache': 1,
+            'docker.abc.rss': 1,
+            'docker.abc.swap': 0,
+        })
+
 if __name__ == "__main__":
     unittest.main()
@@ -11,6 +11,7 @@ values are ignored.
 """
 
 import diamond.collector
+from diamond.flatten import PathFilter, flatten
 import re
 
 try:
@@ -28,12 +29,21 @@ except ImportError:
 
 class MongoDBCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(MongoDBCollector, self).__init__(config, handlers)
+        self.path_filter = PathFilter(self.config['include_paths'],
+                                      self.config['exclude_paths'])
+
     def get_default_config_help(self):
         config_help = super(MongoDBCollector, self).get_default_config_help()
         config_help.update({
             'host': 'Hostname',
             'databases': 'A regex of which databases to gather metrics for.'
-                        ' Defaults to all databases.'
+                        ' Defaults to all databases.',
+            'include_paths': 'Globs of the serverStatus, dbStats and'
+                             ' collstats values to publish, such as'
+                             ' opcounters or **.count. Defaults to all.',
+            'exclude_paths': 'Globs of values not to publish',
         })
         return config_help
 
@@ -45,7 +55,9 @@ class MongoDBCollector(diamond.collector.Collector):
         config.update({
             'path':      'mongo',
             'host':      'localhost',
-            'databases': '.*'
+            'databases': '.*',
+            'include_paths': [],
+            'exclude_paths': [],
         })
         return config
 
@@ -83,17 +95,8 @@ class MongoDBCollector(diamond.collector.Collector):
                                                 collection_name])
 
     def _publish_dict_with_prefix(self, dict, prefix):
-        for key in dict:
-            self._publish_metrics(prefix, key, dict)
-
-    def _publish_metrics(self, prev_keys, key, data):
-        """Recursively publish keys"""
-        value = data[key]
-        keys = prev_keys + [key]
-        if isinstance(value, dict):
-            for new_key in value:
-                self._publish_metrics(keys, new_key, value)
-        elif isinstance(value, int) or isinstance(value, float):
-            self.publish('.'.join(keys), value)
-        elif isinstance(value, long):
-            self.publish('.'.join(keys), float(value))
+        for name, value in flatten(dict, self.path_filter,
+                                   '.'.join(prefix)):
+            if isinstance(value, long):
+                value = float(value)
+            self.publish(name, value)
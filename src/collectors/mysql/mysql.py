@@ -29,14 +29,18 @@ GRANT PROCESS ON *.* TO 'user'@'hostname' IDENTIFIED BY
 """
 
 import diamond.collector
+from diamond.collector import str_to_bool
+from diamond.parallel import run_parallel
 import re
 import time
 
 try:
     import MySQLdb
     from MySQLdb import MySQLError
+    from MySQLdb.constants import CLIENT
     MySQLdb  # workaround for pyflakes issue #13
     MySQLError  # workaround for pyflakes issue #13
+    CLIENT  # workaround for pyflakes issue #13
 except ImportError:
     MySQLdb = None
     MySQLError = ValueError
@@ -218,9 +222,19 @@ class MySQLCollector(diamond.collector.Collector):
 
     def __init__(self, *args, **kwargs):
         super(MySQLCollector, self).__init__(*args, **kwargs)
-        for key in self.innodb_status_keys:
-            self.innodb_status_keys[key] = re.compile(
-                self.innodb_status_keys[key])
+        self.gauge_keys = frozenset(self._GAUGE_KEYS)
+        self.ignore_keys = frozenset(self._IGNORE_KEYS)
+
+        # The innodb status patterns indexed by the first character of the
+        # lines they can match. Patterns starting with a group match lines
+        # starting with a number, indexed under None.
+        self.innodb_status_index = {}
+        for key, pattern in self.innodb_status_keys.items():
+            first = pattern[0]
+            if first == '(':
+                first = None
+            self.innodb_status_index.setdefault(first, []).append(
+                (key, key.split(','), re.compile(pattern)))
 
         if self.config['hosts'].__class__.__name__ != 'list':
             self.config['hosts'] = [self.config['hosts']]
@@ -236,7 +250,12 @@ class MySQLCollector(diamond.collector.Collector):
             )
             self.config['hosts'].append(hoststr)
 
-        self.db = None
+        self.publish_keys = None
+        if self.config.get('publish'):
+            self.publish_keys = frozenset(self.config['publish'].split())
+
+        # Connection state per host string, kept between runs
+        self.connections = {}
 
     def get_default_config_help(self):
         config_help = super(MySQLCollector, self).get_default_config_help()
@@ -248,7 +267,13 @@ class MySQLCollector(diamond.collector.Collector):
             'master': 'Collect SHOW MASTER STATUS',
             'innodb': 'Collect SHOW ENGINE INNODB STATUS',
             'hosts': 'List of hosts to collect from. Format is '
-            + 'yourusername:yourpassword@host:port/db[/nickname]'
+            + 'yourusername:yourpassword@host:port/db[/nickname]',
+            'pipeline': 'Send the status queries for a host in one round trip',
+            'max_threads': 'Number of hosts polled at the same time',
+            'reconnect_delay': 'Seconds to wait before reconnecting after a'
+                               ' failed connection. Doubles with each failure',
+            'reconnect_max_delay': 'Maximum seconds to wait before'
+                                   ' reconnecting',
         })
         return config_help
 
@@ -270,132 +295,239 @@ class MySQLCollector(diamond.collector.Collector):
             'slave':    False,
             'master':   False,
             'innodb':   False,
+
+            'pipeline':             True,
+            'max_threads':          4,
+            'reconnect_delay':      10,
+            'reconnect_max_delay':  300,
         })
         return config
 
-    def get_db_stats(self, query):
-        cursor = self.db.cursor(cursorclass=MySQLdb.cursors.DictCursor)
-
-        cursor.execute(query)
-
-        return cursor.fetchall()
+    def get_db_stats(self, db, queries, pipeline=False):
+        """
+        Run queries on a connection. Returns a list with (column names, rows)
+        for each query, or the MySQLError it raised. With pipeline the
+        queries are sent in one round trip, and any after a failed query are
+        run again on their own.
+        """
+        results = []
+        cursor = db.cursor()
+        try:
+            if pipeline and len(queries) > 1:
+                try:
+                    cursor.execute('; '.join(queries))
+                    while True:
+                        results.append(self._fetch(cursor))
+                        if not cursor.nextset():
+                            break
+                except MySQLError, e:
+                    results.append(e)
+
+            for query in queries[len(results):]:
+                try:
+                    cursor.execute(query)
+                    results.append(self._fetch(cursor))
+                except MySQLError, e:
+                    results.append(e)
+        finally:
+            cursor.close()
+        return results
+
+    def _fetch(self, cursor):
+        columns = [column[0] for column in cursor.description or ()]
+        return columns, cursor.fetchall()
 
     def connect(self, params):
+        """
+        Returns a new connection, allowing several statements per query
+        """
+        return MySQLdb.connect(
+            client_flag=CLIENT.MULTI_STATEMENTS | CLIENT.MULTI_RESULTS,
+            **params)
+
+    def disconnect(self, host):
+        state = self.connections.get(host)
+        if state is None or state['db'] is None:
+            return
         try:
-            self.db = MySQLdb.connect(**params)
-            self.log.info('MySQLCollector: Connected to database.')
-        except MySQLError, e:
-            self.log.error('MySQLCollector couldnt connect to database %s', e)
-            return False
-        return True
-
-    def disconnect(self):
-        self.db.close()
+            state['db'].close()
+        except MySQLError:
+            pass
+        state['db'] = None
 
-    def get_db_global_status(self):
-        return self.get_db_stats('SHOW GLOBAL STATUS')
-
-    def get_db_master_status(self):
-        return self.get_db_stats('SHOW MASTER STATUS')
+    def get_connection(self, host, params):
+        """
+        Returns the connection to a host, checking that an open one is still
+        alive. Returns None while waiting to reconnect after a failure.
+        """
+        state = self.connections.setdefault(host, {
+            'db': None,
+            'failures': 0,
+            'retry_at': 0,
+            'pipeline': str_to_bool(self.config['pipeline']),
+        })
 
-    def get_db_slave_status(self):
-        return self.get_db_stats('SHOW SLAVE STATUS')
+        if state['db'] is not None:
+            try:
+                state['db'].ping()
+                return state['db']
+            except MySQLError, e:
+                self.log.info('MySQLCollector: Lost connection to %s:%s,'
+                              ' reconnecting: %s', params['host'],
+                              params['port'], e)
+                self.disconnect(host)
+
+        now = time.time()
+        if now < state['retry_at']:
+            self.log.debug('MySQLCollector: Not reconnecting to %s:%s for'
+                           ' %d seconds', params['host'], params['port'],
+                           state['retry_at'] - now)
+            return None
 
-    def get_db_innodb_status(self):
-        return self.get_db_stats('SHOW ENGINE INNODB STATUS')
+        try:
+            state['db'] = self.connect(params)
+        except MySQLError, e:
+            delay = min(float(self.config['reconnect_delay'])
+                        * 2 ** state['failures'],
+                        float(self.config['reconnect_max_delay']))
+            state['failures'] += 1
+            state['retry_at'] = now + delay
+            self.log.error('MySQLCollector couldnt connect to database %s,'
+                           ' retrying in %d seconds', e, delay)
+            return None
+
+        self.log.info('MySQLCollector: Connected to database.')
+        state['failures'] = 0
+        state['retry_at'] = 0
+        return state['db']
+
+    def get_queries(self):
+        """
+        Returns a list of (metrics key, query) to run for each host
+        """
+        queries = [('status', 'SHOW GLOBAL STATUS')]
+        if self.config['master'] == 'True':
+            queries.append(('master', 'SHOW MASTER STATUS'))
+        if self.config['slave'] == 'True':
+            queries.append(('slave', 'SHOW SLAVE STATUS'))
+        if self.config['innodb'] == 'True':
+            queries.append(('innodb', 'SHOW ENGINE INNODB STATUS'))
+        return queries
 
-    def get_stats(self, params):
+    def get_stats(self, host, params):
         metrics = {}
 
-        if not self.connect(params):
+        db = self.get_connection(host, params)
+        if db is None:
             return metrics
 
-        metrics['status'] = {}
-        rows = self.get_db_global_status()
-        for row in rows:
-            try:
-                metrics['status'][row['Variable_name']] = float(row['Value'])
-            except:
-                pass
+        state = self.connections[host]
+        queries = self.get_queries()
+        results = dict(zip(
+            [key for key, query in queries],
+            self.get_db_stats(db, [query for key, query in queries],
+                              pipeline=state['pipeline'])))
 
-        if self.config['master'] == 'True':
-            metrics['master'] = {}
-            try:
-                rows = self.get_db_master_status()
-                for row_master in rows:
-                    for key, value in row_master.items():
-                        if key in self._IGNORE_KEYS:
-                            continue
-                        try:
-                            metrics['master'][key] = float(row_master[key])
-                        except:
-                            pass
-            except:
-                self.log.error('MySQLCollector: Couldnt get master status')
-                pass
+        if any(isinstance(result, Exception)
+               for result in results.itervalues()):
+            # Failures are usually missing grants, which would fail the
+            # pipeline every run
+            state['pipeline'] = False
 
-        if self.config['slave'] == 'True':
-            metrics['slave'] = {}
+        if isinstance(results['status'], Exception):
+            self.disconnect(host)
+            raise results['status']
+
+        metrics['status'] = {}
+        publish_keys = self.publish_keys
+        for name, value in results['status'][1]:
+            if publish_keys is not None and name not in publish_keys:
+                continue
             try:
-                rows = self.get_db_slave_status()
-                for row_slave in rows:
-                    for key, value in row_slave.items():
-                        if key in self._IGNORE_KEYS:
-                            continue
-                        try:
-                            metrics['slave'][key] = float(row_slave[key])
-                        except:
-                            pass
-            except:
-                self.log.error('MySQLCollector: Couldnt get slave status')
+                metrics['status'][name] = float(value)
+            except (TypeError, ValueError):
                 pass
 
-        if self.config['innodb'] == 'True':
-            metrics['innodb'] = {}
+        for key in ('master', 'slave'):
+            if key not in results:
+                continue
+            metrics[key] = {}
+            if isinstance(results[key], Exception):
+                self.log.error('MySQLCollector: Couldnt get %s status: %s',
+                               key, results[key])
+                continue
+            columns, rows = results[key]
+            for row in rows:
+                for name, value in zip(columns, row):
+                    if name in self.ignore_keys:
+                        continue
+                    try:
+                        metrics[key][name] = float(value)
+                    except (TypeError, ValueError):
+                        pass
+
+        if 'innodb' in results:
             innodb_status_timer = time.time()
-            try:
-                rows = self.get_db_innodb_status()
-
-                innodb_status_output = rows[0]
-
-                todo = self.innodb_status_keys.keys()
-                for line in innodb_status_output['Status'].split('\n'):
-                    for key in todo:
-                        match = self.innodb_status_keys[key].match(line)
-                        if match is not None:
-                            todo.remove(key)
-                            match_index = 1
-                            for key_index in key.split(','):
-                                try:
-                                    value = float(match.group(match_index))
-                                    # store value
-                                    if key_index in metrics:
-                                        self.log.debug("MySQLCollector: %s"
-                                                       + " already defined, "
-                                                       + " ignoring new value",
-                                                       key_index)
-                                    else:
-                                        metrics['innodb'][key_index] = value
-                                    match_index += 1
-                                except IndexError:
-                                    self.log.debug("MySQLCollector: Cannot find"
-                                                   + " value in innodb status "
-                                                   + "for %s", key_index)
-                for key in todo:
-                    self.log.error("MySQLCollector: %s regexp not matched in"
-                                   + " innodb status", key)
-            except Exception, innodb_status_error:
+            metrics['innodb'] = {}
+            if isinstance(results['innodb'], Exception):
                 self.log.error('MySQLCollector: Couldnt get engine innodb'
                                + ' status, check user permissions: %s',
-                               innodb_status_error)
+                               results['innodb'])
+            else:
+                columns, rows = results['innodb']
+                if rows and 'Status' in columns:
+                    metrics['innodb'] = self.parse_innodb_status(
+                        rows[0][columns.index('Status')])
+                else:
+                    self.log.error('MySQLCollector: engine innodb status'
+                                   + ' returned no Status column')
             Innodb_status_process_time = time.time() - innodb_status_timer
             self.log.debug("MySQLCollector: innodb status process time: %f",
                            Innodb_status_process_time)
             subkey = "Innodb_status_process_time"
             metrics['innodb'][subkey] = Innodb_status_process_time
 
-        self.disconnect()
+        return metrics
+
+    def parse_innodb_status(self, status):
+        """
+        Returns the values matched by innodb_status_keys in the output of
+        SHOW ENGINE INNODB STATUS. Each line is only tried against the
+        patterns that can match its first character.
+        """
+        metrics = {}
+        matched = set()
+        index = self.innodb_status_index
+        for line in status.split('\n'):
+            if not line:
+                continue
+            first = line[0]
+            if first.isdigit():
+                first = None
+            for key, names, regex in index.get(first, ()):
+                if key in matched:
+                    continue
+                match = regex.match(line)
+                if match is None:
+                    continue
+                matched.add(key)
+                for i, name in enumerate(names):
+                    try:
+                        value = float(match.group(i + 1))
+                    except IndexError:
+                        self.log.debug("MySQLCollector: Cannot find value in"
+                                       + " innodb status for %s", name)
+                        continue
+                    if name in metrics:
+                        self.log.debug("MySQLCollector: %s already defined,"
+                                       + " ignoring new value", name)
+                    else:
+                        metrics[name] = value
 
+        for key in self.innodb_status_keys:
+            if key not in matched:
+                self.log.error("MySQLCollector: %s regexp not matched in"
+                               + " innodb status", key)
         return metrics
 
     def _publish_stats(self, nickname, metrics):
@@ -407,15 +539,34 @@ class MySQLCollector(diamond.collector.Collector):
                 if type(metric_value) is not float:
                     continue
 
-                if metric_name not in self._GAUGE_KEYS:
-                    metric_value = self.derivative(metric_name,
+                if metric_name not in self.gauge_keys:
+                    metric_value = self.derivative(nickname + metric_name,
                                                    metric_value)
-                if key == 'status':
-                    if ('publish' not in self.config
-                             or metric_name in self.config['publish']):
-                        self.publish(nickname + metric_name, metric_value)
-                else:
-                    self.publish(nickname + metric_name, metric_value)
+                self.publish(nickname + metric_name, metric_value)
+
+    def parse_host(self, host):
+        """
+        Returns (connection params, nickname) for a host string, or None if
+        it is not valid
+        """
+        matches = re.search(
+            '^([^:]*):([^@]*)@([^:]*):([^/]*)/([^/]*)/?(.*)', host)
+
+        if not matches:
+            return None
+
+        params = {}
+
+        params['host'] = matches.group(3)
+        params['port'] = int(matches.group(4))
+        params['db'] = matches.group(5)
+        params['user'] = matches.group(1)
+        params['passwd'] = matches.group(2)
+
+        nickname = matches.group(6)
+        if len(nickname):
+            nickname += '.'
+        return params, nickname
 
     def collect(self):
 
@@ -423,34 +574,27 @@ class MySQLCollector(diamond.collector.Collector):
             self.log.error('Unable to import MySQLdb')
             return False
 
+        hosts = []
         for host in self.config['hosts']:
-            matches = re.search(
-                '^([^:]*):([^@]*)@([^:]*):([^/]*)/([^/]*)/?(.*)', host)
-
-            if not matches:
+            parsed = self.parse_host(host)
+            if parsed is not None:
+                hosts.append((host, parsed[0], parsed[1]))
+
+        # Each host's connection is only used by one thread at a time
+        results = run_parallel(lambda host: self.get_stats(host[0], host[1]),
+                               hosts, int(self.config['max_threads']))
+
+        for (host, params, nickname), metrics in zip(hosts, results):
+            if isinstance(metrics, Exception):
+                self.log.error('Collection failed for %s %s', nickname,
+                               metrics)
                 continue
-
-            params = {}
-
-            params['host'] = matches.group(3)
-            params['port'] = int(matches.group(4))
-            params['db'] = matches.group(5)
-            params['user'] = matches.group(1)
-            params['passwd'] = matches.group(2)
-
-            nickname = matches.group(6)
-            if len(nickname):
-                nickname += '.'
-
-            try:
-                metrics = self.get_stats(params=params)
-            except Exception, e:
-                self.log.error('Collection failed for %s %s', nickname, e)
+            if not metrics:
                 continue
 
             # Warn if publish contains an unknown variable
-            if 'publish' in self.config:
-                    for k in self.config['publish'].split():
+            if self.publish_keys is not None:
+                    for k in self.publish_keys:
                         if k not in metrics['status']:
                             self.log.error("No such key '%s' available, issue"
                                            + " 'show global status' for a full"
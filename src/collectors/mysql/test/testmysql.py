@@ -10,7 +10,7 @@ from mock import Mock
 from mock import patch
 
 from diamond.collector import Collector
-from mysql import MySQLCollector
+from mysql import MySQLCollector, MySQLError
 
 ################################################################################
 
@@ -40,65 +40,42 @@ class TestMySQLCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(MySQLCollector)
 
+    def get_db_stats(self, global_status, master_status, slave_status):
+        """
+        Returns a get_db_stats mock answering from pickled DictCursor rows
+        """
+        def to_columns(rows):
+            columns = sorted(rows[0].keys())
+            return columns, [tuple(row[c] for c in columns) for row in rows]
+
+        results = [
+            (['Variable_name', 'Value'],
+             [(row['Variable_name'], row['Value'])
+              for row in self.getPickledResults(global_status)]),
+            to_columns(self.getPickledResults(master_status)),
+            to_columns(self.getPickledResults(slave_status)),
+            MySQLError('Access denied'),
+        ]
+        return Mock(return_value=results)
+
     @run_only_if_MySQLdb_is_available
-    @patch.object(MySQLCollector, 'connect', Mock(return_value=True))
-    @patch.object(MySQLCollector, 'disconnect', Mock(return_value=True))
+    @patch.object(MySQLCollector, 'connect', Mock())
     @patch.object(Collector, 'publish')
     def test_real_data(self, publish_mock):
 
-        p_global_status = patch.object(MySQLCollector,
-                                       'get_db_global_status',
-                                       Mock(return_value=self.getPickledResults(
-                                        'mysql_get_db_global_status_1.pkl')))
-        p_master_status = patch.object(MySQLCollector,
-                                       'get_db_master_status',
-                                       Mock(return_value=self.getPickledResults(
-                                        'get_db_master_status_1.pkl')))
-        p_slave_status = patch.object(MySQLCollector,
-                                      'get_db_slave_status',
-                                      Mock(return_value=self.getPickledResults(
-                                        'get_db_slave_status_1.pkl')))
-        p_innodb_status = patch.object(MySQLCollector,
-                                       'get_db_innodb_status',
-                                       Mock(return_value=[{}]))
-
-        p_global_status.start()
-        p_master_status.start()
-        p_slave_status.start()
-        p_innodb_status.start()
-        self.collector.collect()
-        p_global_status.stop()
-        p_master_status.stop()
-        p_slave_status.stop()
-        p_innodb_status.stop()
+        with patch.object(MySQLCollector, 'get_db_stats', self.get_db_stats(
+                'mysql_get_db_global_status_1.pkl',
+                'get_db_master_status_1.pkl',
+                'get_db_slave_status_1.pkl')):
+            self.collector.collect()
 
         self.assertPublishedMany(publish_mock, {})
 
-        p_global_status = patch.object(MySQLCollector,
-                                       'get_db_global_status',
-                                       Mock(return_value=self.getPickledResults(
-                                        'mysql_get_db_global_status_2.pkl')))
-        p_master_status = patch.object(MySQLCollector,
-                                       'get_db_master_status',
-                                       Mock(return_value=self.getPickledResults(
-                                        'get_db_master_status_2.pkl')))
-        p_slave_status = patch.object(MySQLCollector,
-                                      'get_db_slave_status',
-                                      Mock(return_value=self.getPickledResults(
-                                        'get_db_slave_status_2.pkl')))
-        p_innodb_status = patch.object(MySQLCollector,
-                                       'get_db_innodb_status',
-                                       Mock(return_value=[{}]))
-
-        p_global_status.start()
-        p_master_status.start()
-        p_slave_status.start()
-        p_innodb_status.start()
-        self.collector.collect()
-        p_global_status.stop()
-        p_master_status.stop()
-        p_slave_status.stop()
-        p_innodb_status.stop()
+        with patch.object(MySQLCollector, 'get_db_stats', self.get_db_stats(
+                'mysql_get_db_global_status_2.pkl',
+                'get_db_master_status_2.pkl',
+                'get_db_slave_status_2.pkl')):
+            self.collector.collect()
 
         metrics = {}
         metrics.update(self.getPickledResults(
@@ -114,6 +91,51 @@ class TestMySQLCollector(CollectorTestCase):
                            metrics=metrics,
                            defaultpath=self.collector.config['path'])
 
+    def test_should_parse_innodb_status(self):
+        status = self.getFixture('innodb_5.5.17').getvalue()
+        metrics = self.collector.parse_innodb_status(status)
+        self.assertEquals(metrics['Innodb_bp_size'], 7864290)
+        self.assertEquals(metrics['Innodb_trx_history_list_length'], 399)
+        self.assertEquals(metrics['Innodb_sem_mutex_spin_waits'], 254562)
+        self.assertEquals(metrics['Innodb_sem_spins_per_wait_rw_excl'], 12.5)
+        self.assertEquals(metrics['Innodb_main_thd_loops_one_sec'], 4513)
+
+    def test_should_skip_empty_innodb_status(self):
+        self.collector.connections['db'] = {'pipeline': True}
+        status = (['Variable_name', 'Value'], [('Threads_connected', '3')])
+        for innodb in ((['Type', 'Name', 'Status'], []),
+                       (['Type', 'Name'], [('InnoDB', '')])):
+            with patch.object(MySQLCollector, 'get_connection', Mock()):
+                with patch.object(MySQLCollector, 'get_db_stats', Mock(
+                        return_value=[status, MySQLError('Access denied'),
+                                      MySQLError('Access denied'),
+                                      innodb])):
+                    metrics = self.collector.get_stats('db', {})
+            self.assertEquals(metrics['status'], {'Threads_connected': 3})
+            self.assertEquals(metrics['innodb'].keys(),
+                              ['Innodb_status_process_time'])
+
+    @patch('time.time', Mock(return_value=1000))
+    def test_should_back_off_reconnecting(self):
+        params = {'host': 'localhost', 'port': 3306}
+        with patch.object(MySQLCollector, 'connect',
+                          Mock(side_effect=MySQLError('refused'))) as connect:
+            for i in range(3):
+                self.assertEquals(
+                    self.collector.get_connection('db', params), None)
+            self.assertEquals(connect.call_count, 1)
+
+        state = self.collector.connections['db']
+        self.assertEquals(state['retry_at'], 1010)
+
+        state['retry_at'] = 0
+        db = Mock()
+        with patch.object(MySQLCollector, 'connect', Mock(return_value=db)):
+            self.assertTrue(self.collector.get_connection('db', params) is db)
+        self.assertEquals(state['failures'], 0)
+        self.assertTrue(self.collector.get_connection('db', params) is db)
+        self.assertEquals(db.ping.call_count, 1)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
@@ -10,7 +10,7 @@ Shells out to get nagios statistics, which may or may not require sudo access
 """
 
 import diamond.collector
-import subprocess
+from diamond.collector import str_to_bool
 import os
 
 
@@ -69,7 +69,7 @@ class NagiosStatsCollector(diamond.collector.Collector):
 
     def collect(self):
         if (not os.access(self.config['bin'], os.X_OK)
-            or (self.config['use_sudo']
+            or (str_to_bool(self.config['use_sudo'])
                 and not os.access(self.config['sudo_cmd'], os.X_OK))):
             return
 
@@ -77,11 +77,7 @@ class NagiosStatsCollector(diamond.collector.Collector):
                    '--data', ",".join(self.config['vars']),
                    '--mrtg']
 
-        if self.config['use_sudo'] == 'True':
-            command.insert(0, self.config['sudo_cmd'])
-
-        p = subprocess.Popen(command,
-                             stdout=subprocess.PIPE).communicate()[0][:-1]
+        p = self.run_command(command).stdout[:-1]
 
         for i, v in enumerate(p.split("\n")):
             metric_name = self.config['vars'][i]
@@ -29,6 +29,8 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
     SNMPCollector for Netscaler Metrics
     """
 
+    uses_poller = True
+
     """
     EntityProtocolType ::=
     INTEGER{    http(0),
@@ -162,21 +164,35 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
         """Turns a string into a list of byte values"""
         return struct.unpack('%sB' % len(s), s)
 
-    def collect_snmp(self, device, host, port, community):
+    def get_entity_oids(self, name, typeOid, stateOid, gauges):
+        """
+        Returns the type, state and gauge OIDs of a named service or vserver
+        """
+        # Get Name in OID form
+        index = self._convert_from_oid(self.get_string_index_oid(name))
+        return ([".".join([typeOid, index]), ".".join([stateOid, index])]
+                + [".".join([v, index]) for v in gauges.values()])
+
+    def poll_snmp(self, device, host, port, community):
         """
         Collect Netscaler SNMP stats from device
         """
         # Log
         self.log.info("Collecting Netscaler statistics from: %s", device)
 
+        # Collect Netscaler System OIDs in a single request
+        system = yield ('get', self.NETSCALER_SYSTEM_GUAGES.values()
+                        + self.NETSCALER_SYSTEM_COUNTERS.values())
+
         # Set timestamp
         timestamp = time.time()
 
-        # Collect Netscaler System OIDs
         for k, v in self.NETSCALER_SYSTEM_GUAGES.items():
+            if v not in system:
+                continue
             # Get Metric Name and Value
             metricName = '.'.join([k])
-            metricValue = int(self.get(v, host, port, community)[v])
+            metricValue = int(system[v])
             # Get Metric Path
             metricPath = '.'.join(['devices', device, 'system', metricName])
             # Create Metric
@@ -186,122 +202,69 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
 
         # Collect Netscaler System Counter OIDs
         for k, v in self.NETSCALER_SYSTEM_COUNTERS.items():
+            if v not in system:
+                continue
             # Get Metric Name and Value
             metricName = '.'.join([k])
             # Get Metric Path
             metricPath = '.'.join(['devices', device, 'system', metricName])
             # Get Metric Value
-            metricValue = self.derivative(metricPath, long(
-                self.get(v, host, port, community)[v]), self.MAX_VALUE)
+            metricValue = self.derivative(metricPath, long(system[v]),
+                                          self.MAX_VALUE)
             # Create Metric
             metric = Metric(metricPath, metricValue, timestamp, 0)
             # Publish Metric
             self.publish_metric(metric)
 
-        # Collect Netscaler Services
-        serviceNames = [v.strip("\'") for v in self.walk(
-            self.NETSCALER_SERVICE_NAMES, host, port, community).values()]
-
-        for serviceName in serviceNames:
-            # Get Service Name in OID form
-            serviceNameOid = self.get_string_index_oid(serviceName)
-
-            # Get Service Type
-            serviceTypeOid = ".".join([self.NETSCALER_SERVICE_TYPE,
-                                       self._convert_from_oid(serviceNameOid)])
-            serviceType = int(self.get(serviceTypeOid,
-                                       host,
-                                       port,
-                                       community)[serviceTypeOid].strip("\'"))
-
-            # Filter excluded service types
-            if serviceType in map(lambda v: int(v),
-                                  self.config.get('exclude_service_type')):
+        # Collect Netscaler Service and Vserver names
+        serviceNames, vserverNames = yield [
+            ('walk', self.NETSCALER_SERVICE_NAMES),
+            ('walk', self.NETSCALER_VSERVER_NAMES)]
+        serviceNames = [v.strip("\'") for v in serviceNames.values()]
+        vserverNames = [v.strip("\'") for v in vserverNames.values()]
+
+        entities = []
+        for kind, names, typeOid, stateOid, gauges in (
+                ('service', serviceNames, self.NETSCALER_SERVICE_TYPE,
+                 self.NETSCALER_SERVICE_STATE, self.NETSCALER_SERVICE_GUAGES),
+                ('vserver', vserverNames, self.NETSCALER_VSERVER_TYPE,
+                 self.NETSCALER_VSERVER_STATE, self.NETSCALER_VSERVER_GUAGES)):
+            for name in names:
+                entities.append((kind, name, gauges, self.get_entity_oids(
+                    name, typeOid, stateOid, gauges)))
+
+        # Get every service and vserver at once, one request each
+        results = yield [('get', oids) for kind, name, gauges, oids
+                         in entities]
+
+        for (kind, name, gauges, oids), result in zip(entities, results):
+            try:
+                entityType = int(result[oids[0]].strip("\'"))
+                entityState = int(result[oids[1]].strip("\'"))
+            except (KeyError, ValueError):
+                self.log.debug("No type or state for %s %s on %s",
+                               kind, name, device)
                 continue
 
-            # Get Service State
-            serviceStateOid = ".".join([self.NETSCALER_SERVICE_STATE,
-                                        self._convert_from_oid(serviceNameOid)])
-            serviceState = int(self.get(serviceStateOid,
-                                        host,
-                                        port,
-                                        community)[serviceStateOid].strip("\'"))
-
-            # Filter excluded service states
-            if serviceState in map(lambda v: int(v),
-                                   self.config.get('exclude_service_state')):
+            # Filter excluded types and states
+            if entityType in map(lambda v: int(v),
+                                 self.config.get('exclude_%s_type' % kind)):
                 continue
-
-            for k, v in self.NETSCALER_SERVICE_GUAGES.items():
-                serviceGuageOid = ".".join(
-                    [v, self._convert_from_oid(serviceNameOid)])
-                # Get Metric Name
-                metricName = '.'.join([re.sub(r'\.|\\', '_', serviceName), k])
-                # Get Metric Value
-                metricValue = int(self.get(serviceGuageOid,
-                                           host,
-                                           port,
-                                           community
-                                           )[serviceGuageOid].strip("\'"))
-                # Get Metric Path
-                metricPath = '.'.join(['devices',
-                                       device,
-                                       'service',
-                                       metricName])
-                # Create Metric
-                metric = Metric(metricPath, metricValue, timestamp, 0)
-                # Publish Metric
-                self.publish_metric(metric)
-
-        # Collect Netscaler Vservers
-        vserverNames = [v.strip("\'") for v in self.walk(
-            self.NETSCALER_VSERVER_NAMES, host, port, community).values()]
-
-        for vserverName in vserverNames:
-            # Get Vserver Name in OID form
-            vserverNameOid = self.get_string_index_oid(vserverName)
-
-            # Get Vserver Type
-            vserverTypeOid = ".".join([self.NETSCALER_VSERVER_TYPE,
-                                       self._convert_from_oid(vserverNameOid)])
-            vserverType = int(self.get(vserverTypeOid,
-                                       host,
-                                       port,
-                                       community)[vserverTypeOid].strip("\'"))
-
-            # filter excluded vserver types
-            if vserverType in map(lambda v: int(v),
-                                  self.config.get('exclude_vserver_type')):
-                continue
-
-            # Get Service State
-            vserverStateOid = ".".join([self.NETSCALER_VSERVER_STATE,
-                                        self._convert_from_oid(vserverNameOid)])
-            vserverState = int(self.get(vserverStateOid,
-                                        host,
-                                        port,
-                                        community)[vserverStateOid].strip("\'"))
-
-            # Filter excluded vserver state
-            if vserverState in map(lambda v: int(v),
-                                   self.config.get('exclude_vserver_state')):
+            if entityState in map(lambda v: int(v),
+                                  self.config.get('exclude_%s_state' % kind)):
                 continue
 
-            for k, v in self.NETSCALER_VSERVER_GUAGES.items():
-                vserverGuageOid = ".".join(
-                    [v, self._convert_from_oid(vserverNameOid)])
+            for k, oid in zip(gauges.keys(), oids[2:]):
+                if oid not in result:
+                    continue
                 # Get Metric Name
-                metricName = '.'.join([re.sub(r'\.|\\', '_', vserverName), k])
+                metricName = '.'.join([re.sub(r'\.|\\', '_', name), k])
                 # Get Metric Value
-                metricValue = int(self.get(vserverGuageOid,
-                                           host,
-                                           port,
-                                           community
-                                           )[vserverGuageOid].strip("\'"))
+                metricValue = int(result[oid].strip("\'"))
                 # Get Metric Path
                 metricPath = '.'.join(['devices',
                                        device,
-                                       'vserver',
+                                       kind,
                                        metricName])
                 # Create Metric
                 metric = Metric(metricPath, metricValue, timestamp, 0)
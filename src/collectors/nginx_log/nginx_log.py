@@ -1,6 +1,17 @@
 """
 Collects data from nginx access log
 
+Unique sessions over the last 1, 5 and 15 runs are estimated with
+HyperLogLog sketches, and response time quantiles with a quantile sketch,
+so memory use does not grow with traffic.
+
+Access logs are read with diamond.tailer.LogTailer, so a rotated log is
+finished from where the previous run stopped before the new log is read.
+
+If the log format has fields separated by a fixed string, set log_separator
+to it to split lines instead of matching log_regex against them. The
+regex_group_* options are then indexes into the split fields.
+
 #### Dependencies
 
  * re
@@ -8,29 +19,41 @@ Collects data from nginx access log
 """
 
 import diamond.collector
-import os
+from diamond.sketch import HyperLogLog, QuantileSketch
+from diamond.tailer import LogTailer
 import re
 
+
 class NginxLogCollector(diamond.collector.Collector):
-    
+
     def __init__(self, *args, **kwargs):
         super(NginxLogCollector, self).__init__(*args, **kwargs)
-        self.last_log_bytes = {}
+        self.tailers = {}
         self.last_unique_sessions = []
-        for i in range(15):
-            self.last_unique_sessions.append(set())
-    
+
     def get_default_config_help(self):
         config_help = super(NginxLogCollector, self).get_default_config_help()
         config_help.update({
-            'access_logs' : 'nginx access logs (comma separated)',
-            'previous_log_suffix' : 'suffix for finding the previous log (for rollovers)',
-            'log_regex' : 'regular expression for parsing a line from the access log - grouped by field',
-            'regex_group_session' : 'index of the session id in the regular express',
-            'regex_group_response_time' : 'index of the response time in the regular express',
-            'regex_group_response_size' : 'index of the response size in the regular express',
-            'regex_group_response_status' : 'index of the response status code in the regular express',
-            'regex_group_http_method' : 'index of the http method in the regular express'
+            'access_logs': 'nginx access logs (comma separated)',
+            'previous_log_suffix': 'suffix for finding the previous log'
+                                   ' (for rollovers)',
+            'log_regex': 'regular expression for parsing a line from the'
+                         ' access log - grouped by field',
+            'log_separator': 'split lines on this string instead of using'
+                             ' log_regex',
+            'regex_group_session': 'index of the session id in the regular'
+                                   ' express',
+            'regex_group_response_time': 'index of the response time in the'
+                                         ' regular express',
+            'regex_group_response_size': 'index of the response size in the'
+                                         ' regular express',
+            'regex_group_response_status': 'index of the response status'
+                                           ' code in the regular express',
+            'regex_group_http_method': 'index of the http method in the'
+                                       ' regular express',
+            'session_precision': 'HyperLogLog precision of the unique'
+                                 ' session counts (error is about'
+                                 ' 1.04 / sqrt(2 ^ precision))',
         })
         return config_help
 
@@ -39,77 +62,82 @@ class NginxLogCollector(diamond.collector.Collector):
         Returns the default collector settings
         """
         config = super(NginxLogCollector, self).get_default_config()
-        config.update(  {
+        config.update({
             'access_logs': '/var/log/nginx/access.log',
             'previous_log_suffix': '.1',
             'log_regex': '',
-            'regex_group_session': '',
+            'log_separator': '',
+            'regex_group_session': -1,
             'regex_group_response_time': -1,
             'regex_group_response_size': -1,
             'regex_group_response_status': -1,
-            'regex_group_http_method' : -1
-        } )
+            'regex_group_http_method': -1,
+            'session_precision': 12,
+        })
         return config
 
     def sanitize(self, key):
         return key.replace(" ", "_").replace("(", "").replace(")", "")
-        
+
     def publish_if_non_zero(self, key, number):
         if number != 0:
             self.publish(self.sanitize(key), number)
 
-    def parse_number(self, regexMatch, groupIndex):
+    def parse_number(self, fields, index):
         try:
-            return float(regexMatch.groups()[groupIndex])
-        except ValueError:
+            return float(fields[index])
+        except (ValueError, IndexError):
             return 0
-            
+
     def yield_line(self, log_file):
-        previous_log_suffix = self.config.get("previous_log_suffix")
-        try:
-            file_size = os.path.getsize(log_file)
-            if log_file not in self.last_log_bytes:
-                self.log.info("NginxLogCollector: First time with file. Next run will track stats from: " + str(file_size));
-                self.last_log_bytes[log_file] = file_size
-            else:
-                if self.last_log_bytes[log_file] > file_size:
-                    # File rolled over. Read previous file if it exists.
-                    self.log.info("NginxLogCollector: Detected rollover. Reading previous file from: " + str(self.last_log_bytes[log_file]));
-                    if previous_log_suffix:
-                        try:
-                            with open(log_file + previous_log_suffix, "r") as previous_log_file:
-                                previous_log_file.seek(self.last_log_bytes[log_file])
-                                for log_line in previous_log_file:
-                                    yield log_line
-                        except Exception, e:
-                            self.log.error("Cannot find previous nginx access log %s: %s", log_file + previous_log_suffix, e)
-                    self.last_log_bytes[log_file] = 0
-                with open(log_file, "r") as current_log_file:
-                    self.log.info("NginxLogCollector: Reading log file from: " + str(self.last_log_bytes[log_file]));
-                    current_log_file.seek(self.last_log_bytes[log_file])
-                    for log_line in current_log_file:
-                        yield log_line
-                    self.last_log_bytes[log_file] = current_log_file.tell()
-        except Exception, e:
-            self.log.error("Cannot find nginx access log %s: %s", log_file, e)
-    
+        if log_file not in self.tailers:
+            self.tailers[log_file] = LogTailer(
+                log_file, self.config.get("previous_log_suffix"),
+                log=self.log)
+        return self.tailers[log_file].read_lines()
+
     def increment_dict(self, dictionary, key, incr=1):
         if not key in dictionary:
             dictionary[key] = incr
         else:
             dictionary[key] += incr
-    
+
+    def get_line_parser(self):
+        """
+        Returns a function splitting a log line into its fields, or
+        returning None for lines that do not match
+        """
+        separator = self.config.get("log_separator")
+        if separator:
+            def split_line(log_line):
+                return log_line.split(separator)
+            return split_line
+
+        regex = re.compile(self.config.get("log_regex"))
+
+        def match_line(log_line):
+            m = regex.match(log_line)
+            if m is None:
+                return None
+            return m.groups() or None
+        return match_line
+
     def collect(self):
         try:
             access_logs = self.config.get("access_logs").split(",")
-            regex = re.compile(self.config.get("log_regex"))
+            parse_line = self.get_line_parser()
             session_regex_index = int(self.config.get("regex_group_session"))
-            response_time_regex_index = int(self.config.get("regex_group_response_time"))
-            response_size_regex_index = int(self.config.get("regex_group_response_size"))
-            response_status_regex_index = int(self.config.get("regex_group_response_status"))
-            http_method_regex_index = int(self.config.get("regex_group_http_method"))
-            self.last_unique_sessions.pop(0)
-            unique_sessions = set()
+            response_time_regex_index = int(
+                self.config.get("regex_group_response_time"))
+            response_size_regex_index = int(
+                self.config.get("regex_group_response_size"))
+            response_status_regex_index = int(
+                self.config.get("regex_group_response_status"))
+            http_method_regex_index = int(
+                self.config.get("regex_group_http_method"))
+            unique_sessions = HyperLogLog(
+                int(self.config.get("session_precision")))
+            response_times = QuantileSketch()
             count = 0
             response_time_total = 0
             response_size_total = 0
@@ -117,37 +145,63 @@ class NginxLogCollector(diamond.collector.Collector):
             http_methods_counts = {}
             for access_log in access_logs:
                 for log_line in self.yield_line(access_log):
-                    m = regex.match(log_line)
-                    if m is None or len(m.groups()) == 0:
+                    fields = parse_line(log_line)
+                    if fields is None:
                         continue
                     count += 1
-                    if session_regex_index >= 0:
-                        session = m.groups()[session_regex_index]
-                        if len(session) > 0:
-                            unique_sessions.add(session)
-                    if response_time_regex_index >= 0:
-                        response_time_total += self.parse_number(m, response_time_regex_index)
-                    if response_size_regex_index >= 0:
-                        response_size_total += self.parse_number(m, response_size_regex_index)
-                    if response_status_regex_index >= 0:
-                        response_status = m.groups()[response_status_regex_index]
-                        self.increment_dict(response_status_counts, response_status)
-                    if http_method_regex_index >= 0:
-                        http_method = m.groups()[http_method_regex_index]
-                        self.increment_dict(http_methods_counts, http_method)
+                    try:
+                        if session_regex_index >= 0:
+                            session = fields[session_regex_index]
+                            if session:
+                                unique_sessions.add(session)
+                        if response_time_regex_index >= 0:
+                            response_time = self.parse_number(
+                                fields, response_time_regex_index)
+                            response_time_total += response_time
+                            response_times.add(response_time)
+                        if response_size_regex_index >= 0:
+                            response_size_total += self.parse_number(
+                                fields, response_size_regex_index)
+                        if response_status_regex_index >= 0:
+                            self.increment_dict(
+                                response_status_counts,
+                                fields[response_status_regex_index])
+                        if http_method_regex_index >= 0:
+                            self.increment_dict(
+                                http_methods_counts,
+                                fields[http_method_regex_index])
+                    except IndexError:
+                        continue
+
+            # Only the sketches of the last 15 runs are kept
             self.last_unique_sessions.append(unique_sessions)
-            
+            del self.last_unique_sessions[:-15]
+
             self.publish_if_non_zero("requests", count)
-            self.publish_if_non_zero("avg_response_time", response_time_total * 1000 / count if count > 0 else 0)
-            self.publish_if_non_zero("avg_response_size", response_size_total / count if count > 0 else 0)
-            self.publish_if_non_zero("unique_sessions_1", len(set.union(*self.last_unique_sessions[-1:])))
-            self.publish_if_non_zero("unique_sessions_5", len(set.union(*self.last_unique_sessions[-5:])))
-            self.publish_if_non_zero("unique_sessions_15", len(set.union(*self.last_unique_sessions[-15:])))
-            for response_status, response_count in response_status_counts.iteritems():
-                self.publish("response_status." + response_status, response_count)
+            self.publish_if_non_zero(
+                "avg_response_time",
+                response_time_total * 1000 / count if count > 0 else 0)
+            self.publish_if_non_zero(
+                "avg_response_size",
+                response_size_total / count if count > 0 else 0)
+            if response_times.count > 0:
+                for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                    self.publish_if_non_zero(
+                        "response_time_" + name,
+                        response_times.quantile(q) * 1000)
+            for window in (1, 5, 15):
+                sessions = HyperLogLog(unique_sessions.precision)
+                for sketch in self.last_unique_sessions[-window:]:
+                    sessions.merge(sketch)
+                self.publish_if_non_zero("unique_sessions_%d" % window,
+                                         sessions.count())
+            for response_status, response_count in (
+                    response_status_counts.iteritems()):
+                self.publish("response_status." + response_status,
+                             response_count)
             for http_method, count in http_methods_counts.iteritems():
                 self.publish("http_method." + http_method, count)
-            
+
         except Exception, e:
             self.log.error('Error parsing nginx access log: %s', e)
             return {}
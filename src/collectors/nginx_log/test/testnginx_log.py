@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import os
+import shutil
+import tempfile
+from test import CollectorTestCase
+from test import get_collector_config
+from test import unittest
+from mock import patch
+
+from diamond.collector import Collector
+from nginx_log import NginxLogCollector
+
+################################################################################
+
+
+class TestNginxLogCollector(CollectorTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.access_log = os.path.join(self.tmpdir, 'access.log')
+        open(self.access_log, 'w').close()
+
+        config = get_collector_config('NginxLogCollector', {
+            'interval': 10,
+            'access_logs': self.access_log,
+            'log_regex': (r'^(\S+) \S+ \S+ \[[^]]+\] "(\S+) [^"]*" (\d+) '
+                          r'(\d+) (\S+)$'),
+            'regex_group_session': 0,
+            'regex_group_http_method': 1,
+            'regex_group_response_status': 2,
+            'regex_group_response_size': 3,
+            'regex_group_response_time': 4,
+        })
+
+        self.collector = NginxLogCollector(config, None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def append(self, data, path=None):
+        log = open(path or self.access_log, 'a')
+        log.write(data)
+        log.close()
+
+    def test_import(self):
+        self.assertTrue(NginxLogCollector)
+
+    @patch.object(Collector, 'publish')
+    def test_should_only_read_new_lines(self, publish_mock):
+        self.append('10.0.0.9 - - [10/Oct/2013:13:55:00 -0700] '
+                    '"GET / HTTP/1.1" 500 0 1.000\n')
+        # Lines written before the first run are skipped
+        self.collector.collect()
+        self.assertEquals(publish_mock.call_count, 0)
+
+        self.append(self.getFixture('access.log').getvalue())
+        self.collector.collect()
+
+        published = [c[0][0] for c in publish_mock.call_args_list]
+        self.assertFalse('response_status.500' in published)
+        self.assertPublishedMany(publish_mock, {
+            'requests': 4,
+            'avg_response_time': (56, 0),
+            'avg_response_size': 1323,
+            'response_status.200': 3,
+            'response_status.404': 1,
+            'http_method.GET': 3,
+            'http_method.POST': 1,
+            'unique_sessions_1': (3, 0),
+        })
+
+        self.collector.collect()
+        published = [c[0][0] for c in publish_mock.call_args_list]
+        self.assertFalse('requests' in published)
+        self.assertFalse('unique_sessions_1' in published)
+        self.assertPublishedMany(publish_mock, {
+            'unique_sessions_5': (3, 0),
+            'unique_sessions_15': (3, 0),
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_finish_rotated_log(self, publish_mock):
+        self.collector.collect()
+        self.append(self.getFixture('access.log').getvalue())
+        self.collector.collect()
+        publish_mock.reset_mock()
+
+        self.append('10.0.0.4 - - [10/Oct/2013:13:56:00 -0700] '
+                    '"GET / HTTP/1.1" 500 0 1.000\n')
+        os.rename(self.access_log, self.access_log + '.1')
+        self.append('10.0.0.5 - - [10/Oct/2013:13:56:01 -0700] '
+                    '"PUT / HTTP/1.1" 503 0 1.000\n'
+                    '10.0.0.6 - - [10/Oct/2013:13:56:02 -0700] "GET')
+        self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'requests': 2,
+            'response_status.500': 1,
+            'response_status.503': 1,
+            'http_method.GET': 1,
+            'http_method.PUT': 1,
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_start_again_from_truncated_log(self, publish_mock):
+        self.collector.collect()
+        self.append(self.getFixture('access.log').getvalue())
+        self.collector.collect()
+        publish_mock.reset_mock()
+
+        open(self.access_log, 'w').close()
+        self.append('10.0.0.4 - - [10/Oct/2013:13:56:00 -0700] '
+                    '"GET / HTTP/1.1" 500 0 1.000\n')
+        self.collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'requests': 1,
+            'response_status.500': 1,
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_split_lines_on_log_separator(self, publish_mock):
+        config = get_collector_config('NginxLogCollector', {
+            'interval': 10,
+            'access_logs': self.access_log,
+            'log_separator': '|',
+            'regex_group_session': 0,
+            'regex_group_response_status': 1,
+            'regex_group_http_method': 2,
+            'regex_group_response_size': 3,
+            'regex_group_response_time': 4,
+        })
+        collector = NginxLogCollector(config, None)
+        collector.collect()
+        self.append(self.getFixture('access_split.log').getvalue())
+        # Too short: counted as a request, but without a size or time
+        self.append('session1|200\n')
+        collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'requests': 101,
+            'avg_response_time': (50, 1),
+            'avg_response_size': (198.02, 2),
+            'response_status.200': 91,
+            'response_status.500': 10,
+            'http_method.GET': 75,
+            'http_method.POST': 25,
+            'unique_sessions_1': (20, 0),
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_publish_response_time_percentiles(self, publish_mock):
+        config = get_collector_config('NginxLogCollector', {
+            'interval': 10,
+            'access_logs': self.access_log,
+            'log_separator': '|',
+            'regex_group_response_time': 4,
+        })
+        collector = NginxLogCollector(config, None)
+        collector.collect()
+        self.append(self.getFixture('access_split.log').getvalue())
+        collector.collect()
+
+        # Response times are 1 to 100ms, and the sketch is accurate to 1%
+        self.assertPublishedMany(publish_mock, {
+            'requests': 100,
+            'response_time_p50': (50, 0),
+            'response_time_p95': (95, 0),
+            'response_time_p99': (99, 0),
+        })
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -15,7 +15,6 @@ both of these should come installed with swift
 """
 
 import diamond.collector
-from subprocess import Popen, PIPE
 
 try:
     import json
@@ -55,15 +54,16 @@ class OpenstackSwiftCollector(diamond.collector.Collector):
             # don't use the threaded model with this one.
             # for some reason it crashes.
             'interval': 1200,  # by default, every 20 minutes
+            # the dispersion report can take minutes
+            'command_timeout': 600,
         })
         return config
 
     def collect(self):
         # dispersion report.  this can take easily >60s. beware!
         if (self.config['enable_dispersion_report']):
-            p = Popen(['swift-dispersion-report', '-j'],
-                stdout=PIPE, stderr=PIPE)
-            stdout, stderr = p.communicate()
+            result = self.run_command(['swift-dispersion-report', '-j'])
+            stdout, stderr = result.stdout, result.stderr
             self.publish('dispersion.errors', len(stderr.split('\n')) - 1)
             data = json.loads(stdout)
             for t in ('object', 'container'):
@@ -78,8 +78,8 @@ class OpenstackSwiftCollector(diamond.collector.Collector):
                        '-U', account,
                        '-K', self.config['password'],
                        'stat', container]
-                p = Popen(cmd, stdout=PIPE, stderr=PIPE)
-                stdout, stderr = p.communicate()
+                result = self.run_command(cmd, name='swift_stat')
+                stdout, stderr = result.stdout, result.stderr
                 stats = {}
                 # stdout is some lines in 'key   : val' format
                 for line in stdout.split('\n'):
@@ -4,9 +4,14 @@
 Collect icmp round trip times
 Only valid for ipv4 hosts currently
 
+All targets are probed at the same time, *count* times each. Where the
+kernel permits unprivileged ICMP sockets (see net.ipv4.ping_group_range on
+Linux) the probes are sent from a single socket, otherwise up to
+*max_processes* ping subprocesses are run in parallel.
+
 #### Dependencies
 
- * ping
+ * ping (unless ICMP sockets are permitted)
 
 #### Configuration
 
@@ -18,21 +23,102 @@ Configuration is done by adding in extra keys like this
 
 We extract out the key after target_ and use it in the graphite node we push.
 
+For each target this publishes the average round trip time in ms (10000 if
+no probe was answered), and below it min, avg, max and stddev of the round
+trip times and the percentage of probes lost.
+
 """
 
+import os
+import re
+import math
+import time
+import errno
+import select
+import signal
+import socket
+import struct
 import subprocess
 import diamond.collector
-import os
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Summary lines of the Linux and OS X ping utilities
+PING_TRANSMITTED = re.compile(r'(\d+) packets transmitted, (\d+)')
+PING_RTT = re.compile(r'^(?:rtt|round-trip) \S+ = ([\d.]+)/([\d.]+)/([\d.]+)'
+                      r'/([\d.]+)', re.M)
+
+
+def icmp_checksum(data):
+    """
+    The internet checksum (RFC 1071) of data
+    """
+    if len(data) % 2:
+        data += '\0'
+    total = sum(struct.unpack('!%dH' % (len(data) / 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def icmp_echo_request(sequence, payload):
+    """
+    Build an ICMP echo request. The identifier is left to the kernel, which
+    sets it to the local port of the socket.
+    """
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, 0,
+                       sequence) + payload
+
+
+def parse_icmp_echo_reply(data):
+    """
+    Returns the sequence number of an ICMP echo reply, or None for any other
+    message. Some systems include the IP header in what an ICMP socket
+    receives.
+    """
+    if len(data) >= 20 and ord(data[0]) >> 4 == 4:
+        data = data[(ord(data[0]) & 0x0f) * 4:]
+    if len(data) < 8:
+        return None
+    icmp_type, code, checksum, ident, sequence = struct.unpack(
+        '!BBHHH', data[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return sequence
+
+
+def rtt_stats(rtts):
+    """
+    Returns (min, avg, max, stddev) of a list of round trip times
+    """
+    avg = sum(rtts) / len(rtts)
+    stddev = math.sqrt(sum((r - avg) ** 2 for r in rtts) / len(rtts))
+    return min(rtts), avg, max(rtts), stddev
 
 
 class PingCollector(diamond.collector.Collector):
 
+    def __init__(self, config, handlers):
+        super(PingCollector, self).__init__(config, handlers)
+        self.sequence = 0
+        self.use_socket = None
+
     def get_default_config_help(self):
         config_help = super(PingCollector, self).get_default_config_help()
         config_help.update({
             'bin':         'The path to the ping binary',
             'use_sudo':    'Use sudo?',
             'sudo_cmd':    'Path to sudo',
+            'method':      'auto, socket or subprocess. auto uses an ICMP'
+                           ' socket when permitted, else subprocesses',
+            'count':       'Number of probes sent to each target per run',
+            'probe_interval': 'Seconds between the probes to a target',
+            'timeout':     'Seconds to wait for the reply to the last probe',
+            'max_processes': 'Maximum number of ping subprocesses run at'
+                             ' the same time',
         })
         return config_help
 
@@ -46,39 +132,208 @@ class PingCollector(diamond.collector.Collector):
             'bin':              '/bin/ping',
             'use_sudo':         False,
             'sudo_cmd':         '/usr/bin/sudo',
+            'method':           'auto',
+            'count':            5,
+            'probe_interval':   0.2,
+            'timeout':          2,
+            'max_processes':    16,
         })
         return config
 
-    def collect(self):
+    def get_targets(self):
+        targets = []
         for key in self.config.keys():
             if key[:7] == "target_":
-                host = self.config[key]
-                metric_name = host.replace('.', '_')
+                targets.append(self.config[key])
+        return targets
 
-                if not os.access(self.config['bin'], os.X_OK):
-                    self.log.error("Path %s does not exist or is not executable"
-                                   % self.config['bin'])
-                    return
+    def open_socket(self):
+        """
+        Returns an unprivileged ICMP socket, or None if they are not
+        permitted
+        """
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                                 socket.IPPROTO_ICMP)
+        except (socket.error, AttributeError), e:
+            self.log.debug("ICMP sockets are not permitted, using %s: %s",
+                           self.config['bin'], e)
+            return None
+
+    def ping_socket(self, sock, targets):
+        """
+        Probe all targets from one ICMP socket. Returns a dict of target to
+        (probes sent, [round trip times in ms]).
+        """
+        count = int(self.config['count'])
+        interval = float(self.config['probe_interval'])
+        timeout = float(self.config['timeout'])
+        payload = 'diamond' * 8
 
-                command = [self.config['bin'], '-nq', '-c 1', host]
+        results = {}
+        addresses = []
+        for target in targets:
+            results[target] = (count, [])
+            try:
+                addresses.append((target, socket.gethostbyname(target)))
+            except socket.error, e:
+                self.log.error("Cannot resolve %s: %s", target, e)
 
-                if self.config['use_sudo']:
+        # (offset from start, target, address) for every probe
+        probes = [(i * interval, target, address)
+                  for i in range(count) for target, address in addresses]
+        probes.reverse()
+        # (address, sequence) -> (target, time sent)
+        pending = {}
+
+        sock.setblocking(0)
+        start = time.time()
+        last_sent = start
+        while probes or pending:
+            now = time.time()
+            while probes and start + probes[-1][0] <= now:
+                offset, target, address = probes.pop()
+                self.sequence = (self.sequence + 1) & 0xffff
+                try:
+                    sock.sendto(icmp_echo_request(self.sequence, payload),
+                                (address, 0))
+                except socket.error, e:
+                    self.log.debug("Cannot ping %s: %s", target, e)
+                    continue
+                pending[(address, self.sequence)] = (target, now)
+                last_sent = now
+
+            if probes:
+                wait = start + probes[-1][0] - now
+            else:
+                wait = last_sent + timeout - now
+                if wait <= 0:
+                    break
+            readable = select.select([sock], [], [], max(wait, 0))[0]
+            if not readable:
+                continue
+
+            while True:
+                try:
+                    data, (address, port) = sock.recvfrom(1024)
+                except socket.error, e:
+                    if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        break
+                    raise
+                received = time.time()
+                probe = pending.pop(
+                    (address, parse_icmp_echo_reply(data)), None)
+                if probe is not None:
+                    results[probe[0]][1].append(
+                        (received - probe[1]) * 1000.0)
+        return results
+
+    def ping_subprocess(self, targets):
+        """
+        Probe all targets with ping subprocesses, at most max_processes at a
+        time. Returns a dict of target to the result of parse_ping().
+        """
+        count = int(self.config['count'])
+        interval = float(self.config['probe_interval'])
+        # How long a ping should take, plus some slack
+        deadline = count * interval + float(self.config['timeout']) + 1
+        max_processes = max(int(self.config['max_processes']), 1)
+
+        results = {}
+        queue = list(targets)
+        running = {}
+        while queue or running:
+            while queue and len(running) < max_processes:
+                target = queue.pop(0)
+                command = [self.config['bin'], '-nq', '-c', str(count),
+                           '-i', str(interval), target]
+                if diamond.collector.str_to_bool(self.config['use_sudo']):
                     command.insert(0, self.config['sudo_cmd'])
+                try:
+                    # In a session of its own, so sudo and its children are
+                    # killed together
+                    running[target] = (subprocess.Popen(
+                        command, stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE, preexec_fn=os.setsid),
+                        time.time())
+                except OSError, e:
+                    self.log.error("Cannot run %s: %s", command[0], e)
+                    results[target] = (count, 0, None)
+
+            for target, (process, started) in running.items():
+                if process.poll() is None:
+                    if time.time() - started < deadline:
+                        continue
+                    try:
+                        os.killpg(process.pid, signal.SIGTERM)
+                    except OSError:
+                        pass
+                output = process.communicate()[0]
+                results[target] = self.parse_ping(output, count)
+                del running[target]
+
+            if running:
+                time.sleep(0.01)
+        return results
+
+    def parse_ping(self, output, count):
+        """
+        Returns (probes sent, replies received, (min, avg, max, stddev) or
+        None) from the output of ping
+        """
+        sent, received = count, 0
+        match = PING_TRANSMITTED.search(output)
+        if match:
+            sent, received = int(match.group(1)), int(match.group(2))
+        match = PING_RTT.search(output)
+        if not match or not received:
+            return sent, 0, None
+        return sent, received, tuple(float(v) for v in match.groups())
+
+    def collect(self):
+        targets = self.get_targets()
+        if not targets:
+            return
+
+        method = self.config['method']
+        sock = None
+        if method == 'socket' or (method == 'auto'
+                                  and self.use_socket is not False):
+            sock = self.open_socket()
+            self.use_socket = sock is not None
+
+        if sock is not None:
+            try:
+                for target, (sent, rtts) in self.ping_socket(
+                        sock, targets).iteritems():
+                    stats = None
+                    if rtts:
+                        stats = rtt_stats(rtts)
+                    self.publish_target(target, sent, len(rtts), stats)
+            finally:
+                sock.close()
+            return
+
+        if not os.access(self.config['bin'], os.X_OK):
+            self.log.error("Path %s does not exist or is not executable"
+                           % self.config['bin'])
+            return
+
+        for target, (sent, received, stats) in self.ping_subprocess(
+                targets).iteritems():
+            self.publish_target(target, sent, received, stats)
+
+    def publish_target(self, target, sent, received, stats):
+        metric_name = target.replace('.', '_')
+
+        if stats is None:
+            self.publish(metric_name, 10000)
+        else:
+            self.publish(metric_name, int(round(stats[1])))
+            for name, value in zip(('min', 'avg', 'max', 'stddev'), stats):
+                self.publish('%s.%s' % (metric_name, name), value,
+                             precision=3)
 
-                ping = subprocess.Popen(
-                    command, stdout=subprocess.PIPE).communicate()[0].strip(
-                    ).split("\n")[-1]
-
-                # Linux
-                if ping.startswith('rtt'):
-                    ping = ping.split()[3].split('/')[0]
-                    metric_value = int(round(float(ping)))
-                # OS X
-                elif ping.startswith('round-trip '):
-                    ping = ping.split()[3].split('/')[0]
-                    metric_value = int(round(float(ping)))
-                # Unknown
-                else:
-                    metric_value = 10000
-
-                self.publish(metric_name, metric_value)
+        if sent:
+            self.publish('%s.loss' % metric_name,
+                         100.0 * (sent - received) / sent, precision=1)
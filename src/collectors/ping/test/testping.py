@@ -10,6 +10,9 @@ from mock import patch
 
 from diamond.collector import Collector
 from ping import PingCollector
+from ping import icmp_checksum
+from ping import icmp_echo_request
+from ping import parse_icmp_echo_reply
 
 ################################################################################
 
@@ -19,7 +22,8 @@ class TestPingCollector(CollectorTestCase):
         config = get_collector_config('PingCollector', {
             'interval': 10,
             'target_a': 'localhost',
-            'bin': 'true'
+            'bin': 'true',
+            'method': 'subprocess',
         })
 
         self.collector = PingCollector(config, None)
@@ -178,6 +182,39 @@ class TestPingCollector(CollectorTestCase):
             'localhost': 10000
         })
 
+    @patch('os.access', Mock(return_value=True))
+    @patch.object(Collector, 'publish')
+    def test_should_publish_loss_and_jitter(self, publish_mock):
+        patch_communicate = patch('subprocess.Popen.communicate',
+                                  Mock(return_value=(
+                                    self.getFixture('loss_gentoo').getvalue(),
+                                    '')))
+
+        patch_communicate.start()
+        self.collector.collect()
+        patch_communicate.stop()
+
+        self.assertPublishedMany(publish_mock, {
+            'localhost': 13,
+            'localhost.min': (10.112, 3),
+            'localhost.avg': (12.5, 3),
+            'localhost.max': (15.87, 3),
+            'localhost.stddev': (2.447, 3),
+            'localhost.loss': 40,
+        })
+
+    def test_should_build_and_parse_icmp_echo(self):
+        request = icmp_echo_request(1234, 'diamond')
+        self.assertEqual(icmp_checksum(request), 0)
+
+        # An echo reply as an ICMP socket receives it, with or without the
+        # IP header
+        reply = '\0' + request[1:]
+        self.assertEqual(parse_icmp_echo_reply(reply), 1234)
+        ip_header = '\x45' + '\0' * 19
+        self.assertEqual(parse_icmp_echo_reply(ip_header + reply), 1234)
+        self.assertEqual(parse_icmp_echo_reply(request), None)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
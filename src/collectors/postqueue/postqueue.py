@@ -5,11 +5,10 @@ Collect the emails in the postfix queue
 
 #### Dependencies
 
- * subprocess
+ * postqueue
 
 """
 
-import subprocess
 import diamond.collector
 
 
@@ -39,14 +38,9 @@ class PostqueueCollector(diamond.collector.Collector):
 
     def get_postqueue_output(self):
         try:
-            command = [self.config['bin'], '-p']
-
-            if self.config['use_sudo']:
-                command.insert(0, self.config['sudo_cmd'])
-
-            return subprocess.Popen(command,
-                                    stdout=subprocess.PIPE).communicate()[0]
-        except OSError:
+            return self.run_command([self.config['bin'], '-p']).stdout
+        except OSError, e:
+            self.log.error("Cannot run %s: %s", self.config['bin'], e)
             return ""
 
     def collect(self):
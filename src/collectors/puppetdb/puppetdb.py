@@ -5,21 +5,15 @@ Collect metrics from Puppet DB Dashboard
 
 #### Dependencies
 
- * urllib2
+ * httplib
  * json
 
 """
 
-import urllib2
 import diamond.collector
+import diamond.httpclient
 from diamond.convertor import time as time_convertor
 
-try:
-    import json
-    json  # workaround for pyflakes issue #13
-except ImportError:
-    import simplejson as json
-
 
 class PuppetDBCollector(diamond.collector.Collector):
 
@@ -53,6 +47,10 @@ class PuppetDBCollector(diamond.collector.Collector):
         + "n:type=default,name=num-resources",
     }
 
+    def __init__(self, config, handlers):
+        super(PuppetDBCollector, self).__init__(config, handlers)
+        self.client = None
+
     def get_default_config_help(self):
         config_help = super(PuppetDBCollector,
                             self).get_default_config_help()
@@ -74,21 +72,33 @@ class PuppetDBCollector(diamond.collector.Collector):
         })
         return config
 
-    def fetch_metrics(self, url):
-        try:
-            url = "http://%s:%s/%s" % (
-                self.config['host'], int(self.config['port']), url)
-            response = urllib2.urlopen(url)
-        except Exception, e:
-            self.log.error('Couldnt connect to puppetdb: %s -> %s', url, e)
-            return {}
-        return json.load(response)
+    def fetch_metrics(self):
+        """
+        Fetch all the metrics in parallel, returning a dict of name to the
+        decoded response
+        """
+        if self.client is None:
+            self.client = diamond.httpclient.get_client(self.config)
+
+        urls = {}
+        for subnode, path in self.PATHS.items():
+            urls["http://%s:%s/%s" % (self.config['host'],
+                                      int(self.config['port']),
+                                      path)] = subnode
 
-    def collect(self):
         rawmetrics = {}
-        for subnode in self.PATHS:
-            path = self.PATHS[subnode]
-            rawmetrics[subnode] = self.fetch_metrics(path)
+        for url, response in self.client.fetch_many(urls.keys()).items():
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                rawmetrics[urls[url]] = response.json()
+            except Exception, e:
+                self.log.error('Couldnt connect to puppetdb: %s -> %s', url, e)
+                rawmetrics[urls[url]] = {}
+        return rawmetrics
+
+    def collect(self):
+        rawmetrics = self.fetch_metrics()
 
         self.publish_gauge('num_resources',
                            rawmetrics['num-resources']['Value'])
@@ -31,11 +31,15 @@ Note: when using the host/port config mode, the port number is used in
 the metric key. When using the multi-instance mode, the nick will be used.
 If not specified the port will be used.
 
+Instances are polled in up to *max_threads* threads, over connections kept
+open between runs. The lengths of all keys of an instance are read in one
+pipelined round trip, using the key types found on earlier runs.
+
 
 """
 
 import diamond.collector
-import time
+from diamond.parallel import run_parallel
 
 try:
     import redis
@@ -92,6 +96,11 @@ class RedisLengthCollector(diamond.collector.Collector):
             self.instances[nickname] = (host, port)
         self.length_functions = {'list': 'llen', 'set': 'scard', 'zset': 'zcard', 'hash': 'hlen', 'string': 'strlen'}
 
+        # Clients per (host, port) and the types of their keys, kept
+        # between runs
+        self.clients = {}
+        self.key_types = {}
+
     def get_default_config_help(self):
         config_help = super(RedisLengthCollector, self).get_default_config_help()
         config_help.update({
@@ -102,7 +111,8 @@ class RedisLengthCollector(diamond.collector.Collector):
             'databases': 'how many database instances to collect',
             'instances': "Redis addresses, comma separated, syntax:"
             + " nick1@host:port, nick2@:port or nick3@host",
-            'keys': 'Keys to collect length of, comma separated'
+            'keys': 'Keys to collect length of, comma separated',
+            'max_threads': 'Number of instances polled at the same time',
         })
         return config_help
 
@@ -122,24 +132,31 @@ class RedisLengthCollector(diamond.collector.Collector):
             'databases': self._DATABASE_COUNT,
             'path': 'redis',
             'instances': [],
-            'keys': ''
+            'keys': '',
+            'max_threads': 8,
         })
         return config
 
     def _client(self, host, port):
-        """Return a redis client for the configuration.
+        """Return a redis client for the configuration, reusing the client
+from earlier runs.
 
 :param str host: redis host
 :param int port: redis port
 :rtype: redis.Redis
 
         """
+        cli = self.clients.get((host, port))
+        if cli is not None:
+            return cli
+
         db = int(self.config['db'])
         timeout = int(self.config['timeout'])
         try:
             cli = redis.Redis(host=host, port=port,
                               db=db, socket_timeout=timeout)
             cli.ping()
+            self.clients[(host, port)] = cli
             return cli
         except Exception, ex:
             self.log.error("RedisLengthCollector: failed to connect to %s:%i. %s.",
@@ -168,20 +185,42 @@ class RedisLengthCollector(diamond.collector.Collector):
         """
         return '%s.%s.%s' % (nick, "length", key)
 
-    def _get_length(self, client, key):
-        """Return length of the key 
+    def _get_types(self, client, keys):
+        """Return the types of keys, looked up in one round trip
 
 :param redis.Redis client: redis client
-:param str key: redis key
-:rtype: int
+:param list keys: redis keys
+:rtype: dict
 
         """
-        key_type = client.type(key)
-        if key_type not in self.length_functions:
-            return None
-        length = getattr(client, self.length_functions[key_type])(key)
-        return length
-        
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.type(key)
+        return dict(zip(keys, pipe.execute()))
+
+    def _get_lengths(self, client, keys, key_types):
+        """Return the lengths of keys, read in one round trip. Keys whose
+type changed since it was looked up are left out, and removed from
+key_types.
+
+:param redis.Redis client: redis client
+:param list keys: redis keys
+:param dict key_types: redis key to type, for at least the keys
+:rtype: dict
+
+        """
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            getattr(pipe, self.length_functions[key_types[key]])(key)
+
+        lengths = {}
+        for key, length in zip(keys, pipe.execute(raise_on_error=False)):
+            if isinstance(length, Exception):
+                del key_types[key]
+            else:
+                lengths[key] = length
+        return lengths
+
     def collect_instance(self, nick, host, port):
         """Collect metrics from a single Redis instance
 
@@ -195,15 +234,30 @@ class RedisLengthCollector(diamond.collector.Collector):
         client = self._client(host, port)
         if client is None:
             return
-        data = dict()
 
-        for key in self.config['keys']:
-            if key is not None and len(key) > 0:
-                length = self._get_length(client, key)
-                if length is not None:
-                    data[key] = length
-        
-        del client
+        keys = self.config['keys']
+        if isinstance(keys, basestring):
+            keys = keys.split(',')
+        keys = [key for key in keys if key]
+
+        key_types = self.key_types.setdefault((host, port), {})
+        try:
+            # Keys that do not exist, or have no length, are looked up again
+            # every run
+            missing = [key for key in keys if key not in key_types]
+            if missing:
+                for key, key_type in self._get_types(
+                        client, missing).iteritems():
+                    if key_type in self.length_functions:
+                        key_types[key] = key_type
+            data = self._get_lengths(
+                client, [key for key in keys if key in key_types], key_types)
+        except Exception, ex:
+            self.clients.pop((host, port), None)
+            self.key_types.pop((host, port), None)
+            self.log.error("RedisLengthCollector: failed to get lengths from"
+                           " %s:%i. %s.", host, port, ex)
+            return
 
         # Publish the data to graphite
         for key in data:
@@ -219,6 +273,13 @@ class RedisLengthCollector(diamond.collector.Collector):
             self.log.error('Unable to import module redis')
             return {}
 
-        for nick in self.instances.keys():
+        def collect_instance(nick):
             (host, port) = self.instances[nick]
             self.collect_instance(nick, host, int(port))
+
+        nicks = self.instances.keys()
+        for nick, result in zip(nicks, run_parallel(
+                collect_instance, nicks, int(self.config['max_threads']))):
+            if isinstance(result, Exception):
+                self.log.error("RedisLengthCollector: failed to collect %s."
+                               " %s.", nick, result)
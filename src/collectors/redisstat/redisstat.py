@@ -33,10 +33,14 @@ Note: when using the host/port config mode, the port number is used in
 the metric key. When using the multi-instance mode, the nick will be used.
 If not specified the port will be used.
 
+Instances are polled in up to *max_threads* threads, over connections kept
+open between runs. Only the INFO fields that are published are parsed.
+
 
 """
 
 import diamond.collector
+from diamond.parallel import run_parallel
 import time
 
 try:
@@ -46,6 +50,39 @@ except ImportError:
     redis = None
 
 
+def parse_info(data, keys):
+    """Return the fields in keys from the response to INFO, with numbers
+converted. Database fields such as db0:keys=1,expires=0 are returned as
+dicts.
+
+:param str data: INFO response
+:param set keys: field names
+:rtype: dict
+
+    """
+    info = {}
+    for line in data.splitlines():
+        name, sep, value = line.partition(':')
+        if not sep or name not in keys:
+            continue
+        if name.startswith('db') and '=' in value:
+            info[name] = dict((k, _convert(v)) for k, v in (
+                pair.split('=', 1) for pair in value.split(',')))
+        else:
+            info[name] = _convert(value)
+    return info
+
+
+def _convert(value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+
+
 class RedisCollector(diamond.collector.Collector):
 
     _DATABASE_COUNT = 16
@@ -120,6 +157,17 @@ class RedisCollector(diamond.collector.Collector):
 
             self.instances[nickname] = (host, port)
 
+        # The INFO fields published
+        self.info_keys = set(self._KEYS.values())
+        self.info_keys.update(self._RENAMED_KEYS.values())
+        self.info_keys.update(['last_save_time', 'rdb_last_save_time'])
+        for dbnum in range(0, int(self.config.get('databases',
+                                  self._DATABASE_COUNT))):
+            self.info_keys.add('db%i' % dbnum)
+
+        # Clients per (host, port), kept between runs
+        self.clients = {}
+
     def get_default_config_help(self):
         config_help = super(RedisCollector, self).get_default_config_help()
         config_help.update({
@@ -129,7 +177,8 @@ class RedisCollector(diamond.collector.Collector):
             'db': '',
             'databases': 'how many database instances to collect',
             'instances': "Redis addresses, comma separated, syntax:"
-            + " nick1@host:port, nick2@:port or nick3@host"
+            + " nick1@host:port, nick2@:port or nick3@host",
+            'max_threads': 'Number of instances polled at the same time',
         })
         return config_help
 
@@ -149,23 +198,30 @@ class RedisCollector(diamond.collector.Collector):
             'databases': self._DATABASE_COUNT,
             'path': 'redis',
             'instances': [],
+            'max_threads': 8,
         })
         return config
 
     def _client(self, host, port):
-        """Return a redis client for the configuration.
+        """Return a redis client for the configuration, reusing the client
+from earlier runs.
 
 :param str host: redis host
 :param int port: redis port
 :rtype: redis.Redis
 
         """
+        cli = self.clients.get((host, port))
+        if cli is not None:
+            return cli
+
         db = int(self.config['db'])
         timeout = int(self.config['timeout'])
         try:
             cli = redis.Redis(host=host, port=port,
                               db=db, socket_timeout=timeout)
             cli.ping()
+            self.clients[(host, port)] = cli
             return cli
         except Exception, ex:
             self.log.error("RedisCollector: failed to connect to %s:%i. %s.",
@@ -207,9 +263,22 @@ class RedisCollector(diamond.collector.Collector):
         if client is None:
             return None
 
-        info = client.info()
-        del client
-        return info
+        # Read the raw response, rather than have redis parse every field
+        pool = client.connection_pool
+        connection = pool.get_connection('INFO')
+        try:
+            connection.send_command('INFO')
+            data = connection.read_response()
+        except Exception, ex:
+            connection.disconnect()
+            self.clients.pop((host, port), None)
+            self.log.error("RedisCollector: failed to get info from %s:%i."
+                           " %s.", host, port, ex)
+            return None
+        finally:
+            pool.release(connection)
+
+        return parse_info(data, self.info_keys)
 
     def collect_instance(self, nick, host, port):
         """Collect metrics from a single Redis instance
@@ -267,6 +336,13 @@ class RedisCollector(diamond.collector.Collector):
             self.log.error('Unable to import module redis')
             return {}
 
-        for nick in self.instances.keys():
+        def collect_instance(nick):
             (host, port) = self.instances[nick]
             self.collect_instance(nick, host, int(port))
+
+        nicks = self.instances.keys()
+        for nick, result in zip(nicks, run_parallel(
+                collect_instance, nicks, int(self.config['max_threads']))):
+            if isinstance(result, Exception):
+                self.log.error("RedisCollector: failed to collect %s. %s.",
+                               nick, result)
@@ -10,7 +10,7 @@ from mock import Mock
 from mock import patch, call
 
 from diamond.collector import Collector
-from redisstat import RedisCollector
+from redisstat import RedisCollector, parse_info
 
 ################################################################################
 
@@ -308,6 +308,23 @@ class TestRedisCollector(CollectorTestCase):
             # because self.instances is a dict (=random order)
             publish_mock.assert_has_calls(exp_call)
 
+    def test_should_parse_configured_info_fields(self):
+        data = '\r\n'.join([
+            '# Server',
+            'redis_version:2.6.16',
+            'uptime_in_seconds:95732',
+            '# CPU',
+            'used_cpu_sys:0.05',
+            'mem_allocator:jemalloc-3.2.0',
+            '# Keyspace',
+            'db0:keys=12,expires=3',
+            'db1:keys=1,expires=0',
+        ])
+        self.assertEqual(parse_info(data, self.collector.info_keys), {
+            'uptime_in_seconds': 95732,
+            'used_cpu_sys': 0.05,
+            'db0': {'keys': 12, 'expires': 3},
+        })
 
 ################################################################################
 if __name__ == "__main__":
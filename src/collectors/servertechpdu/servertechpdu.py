@@ -28,6 +28,8 @@ class ServerTechPDUCollector(parent_SNMPCollector):
     SNMPCollector for ServerTech PDUs
     """
 
+    uses_poller = True
+
     PDU_SYSTEM_GAUGES = {
         "systemTotalWatts": "1.3.6.1.4.1.1718.3.1.6"
     }
@@ -63,22 +65,34 @@ class ServerTechPDUCollector(parent_SNMPCollector):
         })
         return config
 
-    def collect_snmp(self, device, host, port, community):
+    def poll_snmp(self, device, host, port, community):
         """
         Collect stats from device
         """
         # Log
         self.log.info("Collecting ServerTech PDU statistics from: %s" % device)
 
+        systemGaugeNames = self.PDU_SYSTEM_GAUGES.keys()
+        inputFeedGaugeNames = self.PDU_INFEED_GAUGES.keys()
+
+        # Walk all the columns at once
+        results = yield (
+            [('walk', self.PDU_SYSTEM_GAUGES[n]) for n in systemGaugeNames]
+            + [('walk', self.PDU_INFEED_NAMES)]
+            + [('walk', self.PDU_INFEED_GAUGES[n])
+               for n in inputFeedGaugeNames])
+        systemGauges = results[:len(systemGaugeNames)]
+        inputFeedNames = results[len(systemGaugeNames)]
+        inputFeedGauges = results[len(systemGaugeNames) + 1:]
+
         # Set timestamp
         timestamp = time.time()
 
         inputFeeds = {}
 
         # Collect PDU input gauge values
-        for gaugeName, gaugeOid in self.PDU_SYSTEM_GAUGES.items():
-            systemGauges = self.walk(gaugeOid, host, port, community)
-            for o, gaugeValue in systemGauges.items():
+        for gaugeName, gaugeValues in zip(systemGaugeNames, systemGauges):
+            for o, gaugeValue in gaugeValues.items():
                 # Get Metric Name
                 metricName = gaugeName
                 # Get Metric Value
@@ -91,18 +105,19 @@ class ServerTechPDUCollector(parent_SNMPCollector):
                 self.publish_metric(metric)
 
         # Collect PDU input feed names
-        inputFeedNames = self.walk(self.PDU_INFEED_NAMES, host, port, community)
         for o, inputFeedName in inputFeedNames.items():
             # Extract input feed name
             inputFeed = ".".join(o.split(".")[-2:])
             inputFeeds[inputFeed] = inputFeedName
 
         # Collect PDU input gauge values
-        for gaugeName, gaugeOid in self.PDU_INFEED_GAUGES.items():
-            inputFeedGauges = self.walk(gaugeOid, host, port, community)
-            for o, gaugeValue in inputFeedGauges.items():
+        for gaugeName, gaugeValues in zip(inputFeedGaugeNames,
+                                          inputFeedGauges):
+            for o, gaugeValue in gaugeValues.items():
                 # Extract input feed name
                 inputFeed = ".".join(o.split(".")[-2:])
+                if inputFeed not in inputFeeds:
+                    continue
 
                 # Get Metric Name
                 metricName = '.'.join([re.sub(r'\.|\\', '_',
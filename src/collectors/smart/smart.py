@@ -3,20 +3,41 @@
 """
 Collect data from S.M.A.R.T.'s attribute reporting.
 
+Asking a disk for its attributes can stall its I/O, and they change slowly,
+so each disk is only probed every *probe_intervals* intervals, and the values
+read last are published in between. Disks are probed *max_threads* at a time,
+each given *command_timeout* seconds. smartctl's JSON output (smartmontools
+7.0 and later) is used when it is available.
+
 #### Dependencies
 
  * [smartmontools](http://sourceforge.net/apps/trac/smartmontools/wiki)
 
 """
 
+try:
+    import json
+    json  # workaround for pyflakes issue #13
+except ImportError:
+    import simplejson as json
+
 import diamond.collector
-import subprocess
+from diamond.parallel import run_parallel
 import re
 import os
 
 
 class SmartCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(SmartCollector, self).__init__(*args, **kwargs)
+        # Device -> attributes read at the last probe
+        self.attributes = {}
+        # Device -> intervals until the next probe
+        self.countdown = {}
+        # Whether smartctl can output JSON, None until known
+        self.json_output = None
+
     def get_default_config_help(self):
         config_help = super(SmartCollector, self).get_default_config_help()
         config_help.update({
@@ -24,6 +45,9 @@ class SmartCollector(diamond.collector.Collector):
             'bin':         'The path to the smartctl binary',
             'use_sudo':    'Use sudo?',
             'sudo_cmd':    'Path to sudo',
+            'probe_intervals': 'Probe disks every this many intervals,'
+                               ' publishing the last values in between',
+            'max_threads': 'Number of disks probed at the same time',
         })
         return config_help
 
@@ -38,51 +62,115 @@ class SmartCollector(diamond.collector.Collector):
             'use_sudo':         False,
             'sudo_cmd':         '/usr/bin/sudo',
             'devices': '^disk[0-9]$|^sd[a-z]$|^hd[a-z]$',
-            'method': 'Threaded'
+            'method': 'Threaded',
+            'probe_intervals': 10,
+            'max_threads': 4,
         })
         return config
 
+    def add_attribute(self, metrics, metric, value):
+        # New metric? Store it
+        if metric not in metrics:
+            metrics[metric] = value
+        # Duplicate metric? Only store if it has a larger value
+        # This happens semi-often with the Temperature_Celsius
+        # attribute You will have a PASS/FAIL after the real temp,
+        # so only overwrite if The earlier one was a
+        # PASS/FAIL (0/1)
+        elif metrics[metric] == 0 and value > 0:
+            metrics[metric] = value
+
+    def parse_text(self, device, output):
+        """
+        Returns the attributes in the output of smartctl -A
+        """
+        metrics = {}
+        for attr in output.strip().splitlines()[7:]:
+            attribute = attr.split()
+            if attribute[1] != "Unknown_Attribute":
+                metric = "%s.%s" % (device, attribute[1])
+            else:
+                metric = "%s.%s" % (device, attribute[0])
+            self.add_attribute(metrics, metric, attribute[9])
+        return metrics
+
+    def parse_json(self, device, data):
+        """
+        Returns the attributes in the output of smartctl -A -j
+        """
+        metrics = {}
+        table = data.get('ata_smart_attributes', {}).get('table', [])
+        for attribute in table:
+            name = attribute.get('name')
+            if not name or name == "Unknown_Attribute":
+                name = str(attribute['id'])
+            raw = attribute.get('raw', {})
+            # Like the text output, use the first number of the raw value,
+            # as temperatures pack their minimum and maximum into the rest
+            value = raw.get('string', '').split(' ', 1)[0]
+            if not value.isdigit():
+                value = raw.get('value')
+            if value is not None:
+                self.add_attribute(metrics, "%s.%s" % (device, name),
+                                   int(value))
+
+        health = data.get('nvme_smart_health_information_log', {})
+        for name, value in health.iteritems():
+            if isinstance(value, (int, long, float)):
+                metrics["%s.%s" % (device, name)] = value
+        return metrics
+
+    def probe(self, device):
+        """
+        Returns the attributes of a device
+        """
+        path = os.path.join('/dev', device)
+        name = 'smartctl.%s' % device
+        if self.json_output is not False:
+            result = self.run_command([self.config['bin'], "-A", "-j", path],
+                                      name=name)
+            try:
+                data = json.loads(result.stdout)
+            except ValueError:
+                data = None
+            if isinstance(data, dict) and 'json_format_version' in data:
+                self.json_output = True
+                return self.parse_json(device, data)
+            if self.json_output is None:
+                self.log.debug("%s cannot output JSON", self.config['bin'])
+                self.json_output = False
+
+        result = self.run_command([self.config['bin'], "-A", path], name=name)
+        return self.parse_text(device, result.stdout)
+
     def collect(self):
         """
         Collect and publish S.M.A.R.T. attributes
         """
-        devices = re.compile(self.config['devices'])
-
-        for device in os.listdir('/dev'):
-            if devices.match(device):
-
-                command = [self.config['bin'], "-A", os.path.join('/dev',
-                                                                  device)]
-
-                if self.config['use_sudo']:
-                    command.insert(0, self.config['sudo_cmd'])
-
-                attributes = subprocess.Popen(
-                    command,
-                    stdout=subprocess.PIPE
-                ).communicate()[0].strip().splitlines()
-
-                metrics = {}
-
-                for attr in attributes[7:]:
-                    attribute = attr.split()
-                    if attribute[1] != "Unknown_Attribute":
-                        metric = "%s.%s" % (device, attribute[1])
-                    else:
-                        metric = "%s.%s" % (device, attribute[0])
-
-                    # New metric? Store it
-                    if metric not in metrics:
-                        metrics[metric] = attribute[9]
-                    # Duplicate metric? Only store if it has a larger value
-                    # This happens semi-often with the Temperature_Celsius
-                    # attribute You will have a PASS/FAIL after the real temp,
-                    # so only overwrite if The earlier one was a
-                    # PASS/FAIL (0/1)
-                    elif metrics[metric] == 0 and attribute[9] > 0:
-                        metrics[metric] = attribute[9]
-                    else:
-                        continue
-
-                for metric in metrics.keys():
-                    self.publish(metric, metrics[metric])
+        regex = re.compile(self.config['devices'])
+        devices = [d for d in sorted(os.listdir('/dev')) if regex.match(d)]
+        for device in self.attributes.keys():
+            if device not in devices:
+                del self.attributes[device]
+                del self.countdown[device]
+
+        due = [d for d in devices if self.countdown.get(d, 0) <= 0]
+        results = run_parallel(self.probe, due,
+                               int(self.config['max_threads']))
+        for device, result in zip(due, results):
+            if isinstance(result, Exception):
+                # Probed again on the next interval
+                self.log.error("Cannot read S.M.A.R.T. attributes of %s: %s",
+                               device, result)
+                self.attributes.pop(device, None)
+                self.countdown.pop(device, None)
+                continue
+            self.attributes[device] = result
+            self.countdown[device] = int(self.config['probe_intervals'])
+
+        for device in devices:
+            if device not in self.attributes:
+                continue
+            self.countdown[device] -= 1
+            for metric, value in self.attributes[device].iteritems():
+                self.publish(metric, value)
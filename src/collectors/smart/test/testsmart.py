@@ -120,6 +120,53 @@ class TestSmartCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch('os.access', Mock(return_value=True))
+    @patch.object(Collector, 'publish')
+    def test_should_work_with_json_output(self, publish_mock):
+        patch_listdir = patch('os.listdir', Mock(return_value=['sda']))
+        patch_communicate = patch('subprocess.Popen.communicate',
+                                  Mock(return_value=(
+                                    self.getFixture('json_hdd').getvalue(),
+                                    '')))
+
+        patch_listdir.start()
+        patch_communicate.start()
+        self.collector.collect()
+        patch_listdir.stop()
+        patch_communicate.stop()
+
+        self.assertTrue(self.collector.json_output)
+        self.assertPublishedMany(publish_mock, {
+            'sda.Raw_Read_Error_Rate': 0,
+            'sda.Power_On_Hours': 6827,
+            'sda.Temperature_Celsius': 28,
+            'sda.202': 12,
+        })
+
+    @patch('os.access', Mock(return_value=True))
+    @patch.object(Collector, 'publish')
+    def test_should_republish_between_probes(self, publish_mock):
+        config = get_collector_config('SmartCollector', {
+            'interval': 10,
+            'bin': 'true',
+            'probe_intervals': 2,
+        })
+        collector = SmartCollector(config, None)
+        collector.json_output = False
+
+        with patch('os.listdir', Mock(return_value=['sda', 'sdb'])):
+            with patch.object(collector, 'run_command') as run_command:
+                run_command.return_value.stdout = self.getFixture(
+                    'centos5.5_hdd').getvalue()
+                for i in range(3):
+                    collector.collect()
+
+        # Probed on the first and third runs, published on every one
+        self.assertEquals(run_command.call_count, 4)
+        self.assertEquals(
+            [c[0] for c in publish_mock.call_args_list].count(
+                ('sda.Power_On_Hours', '6827')), 3)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
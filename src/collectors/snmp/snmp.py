@@ -3,6 +3,26 @@
 """
 SNMPCollector is a special collector for collecting data from using SNMP
 
+Resolved device addresses and their transport targets are cached between
+requests. get_many() fetches several OIDs in one GET request, and
+bulk_walk() fetches whole table columns with GETBULK requests.
+
+Collectors implement poll_snmp() as a generator that yields requests and
+receives their results, and set uses_poller = True, for example:
+
+    system = yield ('get', [oid1, oid2])
+    names, values = yield [('walk', namesOid), ('bulk_walk', [valuesOid])]
+
+A request is ('get', [oids]), ('walk', oid) or ('bulk_walk', [oids]), and
+its result is a dict of OID to value. Yielding a list of requests returns
+a list of results.
+
+By default every device is a scheduler task of its own, whose requests are
+made one at a time. With *concurrent* enabled, groups of
+*device_group_size* devices (all devices if 0) are polled by a single task,
+multiplexing their requests over one SNMP engine and UDP socket with at
+most *max_in_flight* outstanding requests per device.
+
 #### Dependencies
 
  * pysnmp
@@ -10,10 +30,13 @@ SNMPCollector is a special collector for collecting data from using SNMP
 """
 
 import socket
+import time
+import traceback
 
 try:
     import pysnmp.entity.rfc3413.oneliner.cmdgen as cmdgen
     import pysnmp.debug
+    from pyasn1.type import univ
     pysnmp  # workaround for pyflakes issue #13
 except ImportError:
     pysnmp = None
@@ -21,8 +44,152 @@ except ImportError:
 import diamond.collector
 
 
+class SNMPPoller(object):
+    """
+    Runs the poll_snmp() generators of several devices at once, over the
+    asynchronous dispatcher of a single SNMP engine
+    """
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.cmdGen = cmdgen.AsynCommandGenerator()
+
+    def run(self, devices):
+        """
+        Poll a list of (device, host, port, community) until all their
+        poll_snmp() generators have finished
+        """
+        for device, host, port, community in devices:
+            try:
+                transport = self.collector._get_transport(host, port)
+            except socket.error, e:
+                self.collector.log.error("Cannot resolve %s: %s", host, e)
+                continue
+            state = {
+                'device': device,
+                'host': host,
+                'auth': self.collector._get_auth_data(community),
+                'transport': transport,
+                'poll': self.collector.poll_snmp(device, host, port,
+                                                 community),
+                'queue': [],
+                'in_flight': 0,
+            }
+            self._advance(state, None)
+
+        dispatcher = self.cmdGen.snmpEngine.transportDispatcher
+        if dispatcher is not None:
+            dispatcher.runDispatcher()
+
+    def _advance(self, state, result):
+        """
+        Send a result to the generator of a device and queue its next
+        requests
+        """
+        try:
+            request = state['poll'].send(result)
+        except StopIteration:
+            return
+        except Exception:
+            self.collector.log.error("Failed polling %s: %s",
+                                     state['device'], traceback.format_exc())
+            return
+
+        state['batch'] = isinstance(request, list)
+        if not state['batch']:
+            request = [request]
+        state['results'] = [None] * len(request)
+        state['pending'] = len(request)
+        state['queue'] = list(enumerate(request))
+        if not request:
+            self._advance(state, [])
+        else:
+            self._send(state)
+
+    def _send(self, state):
+        """
+        Send the queued requests of a device, up to max_in_flight at a time
+        """
+        max_in_flight = int(self.collector.config['max_in_flight'])
+        while state['queue'] and state['in_flight'] < max_in_flight:
+            index, (kind, oids) = state['queue'].pop(0)
+            if kind == 'walk':
+                oids = [oids]
+            oids = [self.collector._convert_to_oid(o)
+                    if not isinstance(o, tuple) else o for o in oids]
+            ctx = (state, index, [univ.ObjectIdentifier(o) for o in oids],
+                   {})
+            state['in_flight'] += 1
+            if kind == 'get':
+                self.cmdGen.getCmd(state['auth'], state['transport'], oids,
+                                   (self._on_get, ctx))
+            elif kind == 'walk':
+                self.cmdGen.nextCmd(state['auth'], state['transport'], oids,
+                                    (self._on_walk, ctx))
+            elif kind == 'bulk_walk':
+                self.cmdGen.bulkCmd(
+                    state['auth'], state['transport'], 0,
+                    int(self.collector.config['max_repetitions']), oids,
+                    (self._on_walk, ctx))
+            else:
+                raise ValueError('Unknown SNMP request: %s' % kind)
+
+    def _done(self, ctx):
+        state, index, heads, ret = ctx
+        state['in_flight'] -= 1
+        state['results'][index] = ret
+        state['pending'] -= 1
+        if state['pending'] > 0:
+            self._send(state)
+            return
+        results = state['results']
+        if not state['batch']:
+            results = results[0]
+        self._advance(state, results)
+
+    def _check_errors(self, ctx, errorIndication, errorStatus, errorIndex):
+        if errorIndication or errorStatus:
+            self.collector._check_errors(
+                (errorIndication, errorStatus, errorIndex), ctx[0]['host'])
+            return False
+        return True
+
+    def _on_get(self, sendRequestHandle, errorIndication, errorStatus,
+                errorIndex, varBinds, ctx):
+        if self._check_errors(ctx, errorIndication, errorStatus, errorIndex):
+            for o, v in varBinds:
+                ctx[3][o.prettyPrint()] = v.prettyPrint()
+        self._done(ctx)
+
+    def _on_walk(self, sendRequestHandle, errorIndication, errorStatus,
+                 errorIndex, varBindTable, ctx):
+        heads, ret = ctx[2], ctx[3]
+        if self._check_errors(ctx, errorIndication, errorStatus, errorIndex):
+            more = False
+            for varBindTableRow in varBindTable:
+                more = False
+                for i, (o, v) in enumerate(varBindTableRow):
+                    # Rows can run past the end of the requested columns
+                    if (heads[i % len(heads)].isPrefixOf(o)
+                            and not isinstance(v, univ.Null)):
+                        ret[o.prettyPrint()] = v.prettyPrint()
+                        more = True
+            if more:
+                # Continue walking
+                return True
+        self._done(ctx)
+
+
 class SNMPCollector(diamond.collector.Collector):
 
+    # Seconds before a cached device address is resolved again
+    TRANSPORT_CACHE_TTL = 300
+
+    # Set by collectors implementing poll_snmp(), which can then be polled
+    # concurrently. Others are collected by collect_snmp() one device at a
+    # time.
+    uses_poller = False
+
     def __init__(self, config, handlers):
         """
         Create a new instance of the SNMPCollector class
@@ -34,11 +201,26 @@ class SNMPCollector(diamond.collector.Collector):
         if pysnmp is not None:
             self.snmpCmdGen = cmdgen.CommandGenerator()
 
+        # (host, port) -> (time resolved, UdpTransportTarget)
+        self.transports = {}
+        # community -> CommunityData
+        self.auth_data = {}
+        # device names of a group -> SNMPPoller
+        self.pollers = {}
+
     def get_default_config_help(self):
         config_help = super(SNMPCollector, self).get_default_config_help()
         config_help.update({
             'timeout': 'Seconds before timing out the snmp connection',
             'retries': 'Number of times to retry before bailing',
+            'max_repetitions': 'Number of rows to fetch per column in each'
+                               ' GETBULK request',
+            'concurrent': 'Poll groups of devices concurrently from a single'
+                          ' task',
+            'device_group_size': 'Number of devices per concurrently polled'
+                                 ' group (0 for a single group)',
+            'max_in_flight': 'Maximum outstanding requests per device when'
+                             ' polling concurrently',
         })
         return config_help
 
@@ -49,31 +231,110 @@ class SNMPCollector(diamond.collector.Collector):
         default_config['path_prefix'] = 'systems'
         default_config['timeout'] = 5
         default_config['retries'] = 3
+        default_config['max_repetitions'] = 10
+        default_config['concurrent'] = False
+        default_config['device_group_size'] = 0
+        default_config['max_in_flight'] = 4
         # Return default config
         return default_config
 
-    def get_schedule(self):
+    def get_devices(self):
         """
-        Override SNMPCollector.get_schedule
+        Returns a sorted list of (device, host, port, community) tuples
         """
-        schedule = {}
+        devices = []
         if 'devices' in self.config:
-            for device in self.config['devices']:
+            for device in sorted(self.config['devices']):
                 # Get Device Config
                 c = self.config['devices'][device]
-                # Get Task Name
-                task = "_".join([self.__class__.__name__, device])
-                # Check if task is already in schedule
-                if task in schedule:
-                    raise KeyError("Duplicate device scheduled")
-                schedule[task] = (self.collect_snmp, (device,
-                                                      c['host'],
-                                                      int(c['port']),
-                                                      c['community']),
+                devices.append((device, c['host'], int(c['port']),
+                                c['community']))
+        return devices
+
+    def get_schedule(self):
+        """
+        Override SNMPCollector.get_schedule
+        """
+        schedule = {}
+        devices = self.get_devices()
+
+        if diamond.collector.str_to_bool(self.config['concurrent']):
+            size = int(self.config['device_group_size']) or len(devices)
+            for i in range(0, len(devices), size or 1):
+                task = "_".join([self.__class__.__name__,
+                                 'group%d' % (i / size)])
+                schedule[task] = (self.collect_devices,
+                                  (devices[i:i + size],),
                                   int(self.config['splay']),
                                   int(self.config['interval']))
+            return schedule
+
+        for device, host, port, community in devices:
+            # Get Task Name
+            task = "_".join([self.__class__.__name__, device])
+            # Check if task is already in schedule
+            if task in schedule:
+                raise KeyError("Duplicate device scheduled")
+            schedule[task] = (self.collect_snmp, (device,
+                                                  host,
+                                                  port,
+                                                  community),
+                              int(self.config['splay']),
+                              int(self.config['interval']))
         return schedule
 
+    def poll_snmp(self, device, host, port, community):
+        """
+        Generator yielding the SNMP requests to collect a device, see the
+        module documentation
+        """
+        return
+        yield
+
+    def collect_snmp(self, device, host, port, community):
+        """
+        Collect a device, making the requests of poll_snmp() one at a time
+        """
+        poll = self.poll_snmp(device, host, port, community)
+        result = None
+        while True:
+            try:
+                request = poll.send(result)
+            except StopIteration:
+                break
+            if isinstance(request, list):
+                result = [self.request(r, host, port, community)
+                          for r in request]
+            else:
+                result = self.request(request, host, port, community)
+
+    def collect_devices(self, devices):
+        """
+        Collect a group of devices concurrently
+        """
+        if not self.uses_poller:
+            # Only collect_snmp() is implemented
+            for device in devices:
+                self.collect_snmp(*device)
+            return
+        group = tuple(device[0] for device in devices)
+        if group not in self.pollers:
+            self.pollers[group] = SNMPPoller(self)
+        self.pollers[group].run(devices)
+
+    def request(self, request, host, port, community):
+        """
+        Make a single request yielded by poll_snmp()
+        """
+        kind, oids = request
+        if kind == 'get':
+            return self.get_many(oids, host, port, community)
+        elif kind == 'walk':
+            return self.walk(oids, host, port, community)
+        elif kind == 'bulk_walk':
+            return self.bulk_walk(oids, host, port, community)
+        raise ValueError('Unknown SNMP request: %s' % kind)
+
     def _convert_to_oid(self, s):
         d = s.split(".")
         return tuple([int(x) for x in d])
@@ -81,36 +342,76 @@ class SNMPCollector(diamond.collector.Collector):
     def _convert_from_oid(self, oid):
         return ".".join([str(x) for x in oid])
 
-    def get(self, oid, host, port, community):
+    def _get_auth_data(self, community):
         """
-        Perform SNMP get for a given OID
+        Returns the cached SNMP auth data for a community
         """
-        # Initialize return value
-        ret = {}
+        if community not in self.auth_data:
+            self.auth_data[community] = cmdgen.CommunityData('agent',
+                                                             community)
+        return self.auth_data[community]
 
-        # Convert OID to tuple if necessary
-        if not isinstance(oid, tuple):
-            oid = self._convert_to_oid(oid)
+    def _get_transport(self, host, port):
+        """
+        Returns the cached SNMP transport target for a device, resolving its
+        address again every TRANSPORT_CACHE_TTL seconds
+        """
+        key = (host, port)
+        now = time.time()
+        if key in self.transports:
+            resolved, transport = self.transports[key]
+            if now - resolved < self.TRANSPORT_CACHE_TTL:
+                return transport
 
         # Convert Host to IP if necessary
-        host = socket.gethostbyname(host)
-
-        # Assemble SNMP Auth Data
-        snmpAuthData = cmdgen.CommunityData('agent', community)
+        address = socket.gethostbyname(host)
 
-        # Assemble SNMP Transport Data
-        snmpTransportData = cmdgen.UdpTransportTarget(
-            (host, port),
+        transport = cmdgen.UdpTransportTarget(
+            (address, port),
             int(self.config['timeout']),
             int(self.config['retries']))
+        self.transports[key] = (now, transport)
+        return transport
 
-        # Assemble SNMP Next Command
-        result = self.snmpCmdGen.getCmd(snmpAuthData, snmpTransportData, oid)
-        varBind = result[3]
+    def _check_errors(self, result, host):
+        """
+        Log errors in the result of a command. Returns True on success.
+        """
+        errorIndication, errorStatus, errorIndex = result[:3]
+        if errorIndication:
+            self.log.error("SNMP request to %s failed: %s", host,
+                           errorIndication)
+            return False
+        if errorStatus:
+            self.log.error("SNMP request to %s failed: %s at %s", host,
+                           errorStatus.prettyPrint(), errorIndex)
+            return False
+        return True
+
+    def get(self, oid, host, port, community):
+        """
+        Perform SNMP get for a given OID
+        """
+        return self.get_many([oid], host, port, community)
+
+    def get_many(self, oids, host, port, community):
+        """
+        Perform a single SNMP get for a list of OIDs
+        """
+        # Initialize return value
+        ret = {}
+
+        # Convert OIDs to tuples if necessary
+        oids = [oid if isinstance(oid, tuple) else self._convert_to_oid(oid)
+                for oid in oids]
 
-        # TODO: Error check
+        result = self.snmpCmdGen.getCmd(self._get_auth_data(community),
+                                        self._get_transport(host, port),
+                                        *oids)
+        if not self._check_errors(result, host):
+            return ret
 
-        for o, v in varBind:
+        for o, v in result[3]:
             ret[o.prettyPrint()] = v.prettyPrint()
 
         return ret
@@ -126,28 +427,46 @@ class SNMPCollector(diamond.collector.Collector):
         if not isinstance(oid, tuple):
             oid = self._convert_to_oid(oid)
 
-        # Convert Host to IP if necessary
-        host = socket.gethostbyname(host)
+        # Assemble SNMP Next Command
+        resultTable = self.snmpCmdGen.nextCmd(self._get_auth_data(community),
+                                              self._get_transport(host, port),
+                                              oid)
+        if not self._check_errors(resultTable, host):
+            return ret
 
-        # Assemble SNMP Auth Data
-        snmpAuthData = cmdgen.CommunityData('agent', community)
+        for varBindTableRow in resultTable[3]:
+            for o, v in varBindTableRow:
+                ret[o.prettyPrint()] = v.prettyPrint()
 
-        # Assemble SNMP Transport Data
-        snmpTransportData = cmdgen.UdpTransportTarget(
-            (host, port),
-            int(self.config['timeout']),
-            int(self.config['retries']))
+        return ret
 
-        # Assemble SNMP Next Command
-        resultTable = self.snmpCmdGen.nextCmd(snmpAuthData,
-                                              snmpTransportData,
-                                              oid)
-        varBindTable = resultTable[3]
+    def bulk_walk(self, oids, host, port, community):
+        """
+        Walk several table columns at once with GETBULK requests
+        """
+        # Initialize return value
+        ret = {}
 
-        # TODO: Error Check
+        # Convert OIDs to tuples if necessary
+        oids = [oid if isinstance(oid, tuple) else self._convert_to_oid(oid)
+                for oid in oids]
 
-        for varBindTableRow in varBindTable:
+        resultTable = self.snmpCmdGen.bulkCmd(
+            self._get_auth_data(community),
+            self._get_transport(host, port),
+            0, int(self.config['max_repetitions']),
+            *oids)
+        if not self._check_errors(resultTable, host):
+            return ret
+
+        prefixes = [self._convert_from_oid(oid) + '.' for oid in oids]
+        for varBindTableRow in resultTable[3]:
             for o, v in varBindTableRow:
-                ret[o.prettyPrint()] = v.prettyPrint()
+                name = o.prettyPrint()
+                # The last GETBULK response can run past the end of a column
+                for prefix in prefixes:
+                    if name.startswith(prefix):
+                        ret[name] = v.prettyPrint()
+                        break
 
         return ret
@@ -4,8 +4,13 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from test import unittest
+from mock import Mock
+from mock import patch
 
-from snmp import SNMPCollector
+from pyasn1.type import univ
+
+from snmp import SNMPCollector, SNMPPoller
 
 
 class TestSNMPCollector(CollectorTestCase):
@@ -20,3 +25,134 @@ class TestSNMPCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPCollector)
+
+    def test_should_group_devices_when_concurrent(self):
+        config = get_collector_config('SNMPCollector', {
+            'concurrent': True,
+            'device_group_size': 2,
+            'devices': {
+                'a': {'host': 'a', 'port': 161, 'community': 'public'},
+                'b': {'host': 'b', 'port': 161, 'community': 'public'},
+                'c': {'host': 'c', 'port': 161, 'community': 'public'},
+            },
+        })
+        collector = SNMPCollector(config, None)
+        schedule = collector.get_schedule()
+
+        self.assertEqual(sorted(schedule.keys()),
+                         ['SNMPCollector_group0', 'SNMPCollector_group1'])
+        self.assertEqual(
+            [d[0] for d in schedule['SNMPCollector_group0'][1][0]],
+            ['a', 'b'])
+        self.assertEqual(
+            [d[0] for d in schedule['SNMPCollector_group1'][1][0]],
+            ['c'])
+
+    def test_should_drive_poll_snmp_sequentially(self):
+        requests = []
+
+        def request(r, host, port, community):
+            requests.append(r)
+            return {r[0]: host}
+
+        def poll_snmp(device, host, port, community):
+            first = yield ('get', ['1.2.3'])
+            second, third = yield [('walk', '1.2.4'),
+                                   ('bulk_walk', ['1.2.5'])]
+            results.extend([first, second, third])
+
+        results = []
+        self.collector.request = request
+        self.collector.poll_snmp = poll_snmp
+        self.collector.collect_snmp('dev', 'host', 161, 'public')
+
+        self.assertEqual(requests, [('get', ['1.2.3']), ('walk', '1.2.4'),
+                                    ('bulk_walk', ['1.2.5'])])
+        self.assertEqual(results, [{'get': 'host'}, {'walk': 'host'},
+                                   {'bulk_walk': 'host'}])
+
+    def test_should_only_poll_collectors_using_the_poller(self):
+        devices = [('dev', '127.0.0.1', 161, 'public')]
+        with patch.object(SNMPPoller, 'run') as run:
+            with patch.object(self.collector, 'collect_snmp') as collect:
+                self.collector.collect_devices(devices)
+                self.assertFalse(run.called)
+                collect.assert_called_once_with(*devices[0])
+
+                self.collector.uses_poller = True
+                self.collector.collect_devices(devices)
+                run.assert_called_once_with(devices)
+
+        # The default poll_snmp() makes no requests
+        with patch.object(self.collector, 'request') as request:
+            self.collector.collect_snmp(*devices[0])
+        self.assertFalse(request.called)
+
+
+class TestSNMPPoller(CollectorTestCase):
+    def setUp(self):
+        config = get_collector_config('SNMPCollector', {
+            'interval': 1,
+            'max_in_flight': 2,
+        })
+        self.collector = SNMPCollector(config, None)
+        self.poller = SNMPPoller(self.collector)
+        self.poller.cmdGen = Mock()
+        self.results = []
+
+    def poll(self, *requests):
+        def poll_snmp(device, host, port, community):
+            for request in requests:
+                self.results.append((yield request))
+        self.collector.poll_snmp = poll_snmp
+        self.poller.run([('dev', '127.0.0.1', 161, 'public')])
+
+    def reply(self, call, *varBinds):
+        callback, ctx = call[0][-1]
+        return callback(None, None, 0, 0, [(univ.ObjectIdentifier(o), v)
+                                           for o, v in varBinds], ctx)
+
+    def test_should_batch_requests_up_to_max_in_flight(self):
+        self.poll([('get', ['1.2.1']), ('get', ['1.2.2']),
+                   ('get', ['1.2.3'])])
+
+        getCmd = self.poller.cmdGen.getCmd
+        self.assertEqual(getCmd.call_count, 2)
+        self.assertEqual(getCmd.call_args_list[0][0][2], [(1, 2, 1)])
+
+        self.reply(getCmd.call_args_list[1], ('1.2.2', univ.Integer(2)))
+        self.assertEqual(getCmd.call_count, 3)
+        self.reply(getCmd.call_args_list[2], ('1.2.3', univ.Integer(3)))
+        self.assertEqual(self.results, [])
+
+        self.reply(getCmd.call_args_list[0], ('1.2.1', univ.Integer(1)))
+        self.assertEqual(self.results, [[{'1.2.1': '1'}, {'1.2.2': '2'},
+                                         {'1.2.3': '3'}]])
+
+    def test_should_continue_walks_within_the_column(self):
+        self.poll(('walk', '1.3.1'), ('get', ['1.2.1']))
+
+        nextCmd = self.poller.cmdGen.nextCmd
+        self.assertEqual(nextCmd.call_count, 1)
+        callback, ctx = nextCmd.call_args[0][-1]
+        table = [[(univ.ObjectIdentifier('1.3.1.1'), univ.Integer(1))],
+                 [(univ.ObjectIdentifier('1.3.1.2'), univ.Integer(2))]]
+        self.assertTrue(callback(None, None, 0, 0, table, ctx))
+        self.assertEqual(self.results, [])
+
+        table = [[(univ.ObjectIdentifier('1.3.2.1'), univ.Integer(3))]]
+        self.assertFalse(callback(None, None, 0, 0, table, ctx))
+        self.assertEqual(self.results, [{'1.3.1.1': '1', '1.3.1.2': '2'}])
+        # The next request is only sent once the walk has finished
+        self.assertEqual(self.poller.cmdGen.getCmd.call_count, 1)
+
+    def test_should_finish_requests_that_failed(self):
+        self.poll(('bulk_walk', ['1.3.1']))
+
+        callback, ctx = self.poller.cmdGen.bulkCmd.call_args[0][-1]
+        callback(None, 'requestTimedOut', 0, 0, [], ctx)
+        self.assertEqual(self.results, [{}])
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
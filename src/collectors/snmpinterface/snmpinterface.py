@@ -49,6 +49,10 @@ you need modify your graphite data retentions to handle this properly.
 Note: If you modify the SNMPInterfaceCollector configuration, you will need to
 restart diamond.
 
+The counters of all interfaces are fetched with GETBULK requests over the
+IF-MIB columns. Interface names and types change rarely, so they are only
+fetched again every *interface_cache_interval* seconds.
+
 #### Dependencies
 
  * pysmnp
@@ -69,6 +73,8 @@ import diamond.convertor
 
 class SNMPInterfaceCollector(parent_SNMPCollector):
 
+    uses_poller = True
+
     # IF-MIB OID
     IF_MIB_INDEX_OID = "1.3.6.1.2.1.2.2.1.1"
     IF_MIB_NAME_OID = "1.3.6.1.2.1.31.1.1.1.1"
@@ -93,10 +99,17 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
     # A list of interface types we care about
     IF_TYPES = ["6"]
 
+    def __init__(self, config, handlers):
+        super(SNMPInterfaceCollector, self).__init__(config, handlers)
+        # device -> (time fetched, {ifIndex: ifName})
+        self.interfaces = {}
+
     def get_default_config_help(self):
         config_help = super(SNMPInterfaceCollector,
                             self).get_default_config_help()
         config_help.update({
+            'interface_cache_interval': 'Seconds between fetches of the'
+                                        ' interface names and types',
         })
         return config_help
 
@@ -109,45 +122,60 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
                                self).get_default_config()
         default_config['path'] = 'interface'
         default_config['byte_unit'] = ['bit', 'byte']
+        default_config['interface_cache_interval'] = 3600
         return default_config
 
-    def collect_snmp(self, device, host, port, community):
+    def parse_interfaces(self, data):
+        """
+        Returns a dict of ifIndex to ifName for the interfaces of the types
+        we care about, from the walked ifType and ifName columns
+        """
+        typePrefix = self.IF_MIB_TYPE_OID + '.'
+        interfaces = {}
+        for oid, ifType in data.items():
+            if not oid.startswith(typePrefix) or ifType not in self.IF_TYPES:
+                continue
+            ifIndex = oid[len(typePrefix):]
+            ifName = data.get('.'.join([self.IF_MIB_NAME_OID, ifIndex]))
+            if ifName is None:
+                continue
+            # Remove quotes from string
+            interfaces[ifIndex] = re.sub(r'(\"|\')', '', ifName)
+        return interfaces
+
+    def poll_snmp(self, device, host, port, community):
         """
         Collect SNMP interface data from device
         """
         # Log
         self.log.info("Collecting SNMP interface statistics from: %s", device)
 
-        timestamp = time.time()
-
-        # Define a list of interface indexes
-        ifIndexes = []
-
-        # Get Interface Indexes
-        ifIndexOid = '.'.join([self.IF_MIB_INDEX_OID])
-        ifIndexData = self.walk(ifIndexOid, host, port, community)
-        ifIndexes = [v for v in ifIndexData.values()]
+        # Get the interfaces, unless the cached ones are recent enough
+        interfaces = None
+        if device in self.interfaces:
+            fetched, interfaces = self.interfaces[device]
+            if (time.time() - fetched
+                    >= int(self.config['interface_cache_interval'])):
+                interfaces = None
+        if interfaces is None:
+            data = yield ('bulk_walk', [self.IF_MIB_TYPE_OID,
+                                        self.IF_MIB_NAME_OID])
+            interfaces = self.parse_interfaces(data)
+            if not interfaces:
+                return
+            self.interfaces[device] = (time.time(), interfaces)
+
+        # Get all gauge and counter columns for all interfaces
+        data = yield ('bulk_walk', self.IF_MIB_GAUGE_OID_TABLE.values()
+                      + self.IF_MIB_COUNTER_OID_TABLE.values())
 
-        for ifIndex in ifIndexes:
-            # Get Interface Type
-            ifTypeOid = '.'.join([self.IF_MIB_TYPE_OID, ifIndex])
-            ifTypeData = self.get(ifTypeOid, host, port, community)
-            if ifTypeData[ifTypeOid] not in self.IF_TYPES:
-                # Skip Interface
-                continue
-            # Get Interface Name
-            ifNameOid = '.'.join([self.IF_MIB_NAME_OID, ifIndex])
-            ifNameData = self.get(ifNameOid, host, port, community)
-            ifName = ifNameData[ifNameOid]
-            # Remove quotes from string
-            ifName = re.sub(r'(\"|\')', '', ifName)
+        timestamp = time.time()
 
+        for ifIndex, ifName in interfaces.items():
             # Get Gauges
             for gaugeName, gaugeOid in self.IF_MIB_GAUGE_OID_TABLE.items():
-                ifGaugeOid = '.'.join([self.IF_MIB_GAUGE_OID_TABLE[gaugeName],
-                                       ifIndex])
-                ifGaugeData = self.get(ifGaugeOid, host, port, community)
-                ifGaugeValue = ifGaugeData[ifGaugeOid]
+                ifGaugeOid = '.'.join([gaugeOid, ifIndex])
+                ifGaugeValue = data.get(ifGaugeOid)
                 if not ifGaugeValue:
                     continue
 
@@ -168,10 +196,8 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
             # Get counters (64bit)
             counterItems = self.IF_MIB_COUNTER_OID_TABLE.items()
             for counterName, counterOid in counterItems:
-                ifCounterOid = '.'.join(
-                    [self.IF_MIB_COUNTER_OID_TABLE[counterName], ifIndex])
-                ifCounterData = self.get(ifCounterOid, host, port, community)
-                ifCounterValue = ifCounterData[ifCounterOid]
+                ifCounterOid = '.'.join([counterOid, ifIndex])
+                ifCounterValue = data.get(ifCounterOid)
                 if not ifCounterValue:
                     continue
 
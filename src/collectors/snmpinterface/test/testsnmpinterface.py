@@ -4,7 +4,10 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from mock import Mock
+from mock import patch
 
+from diamond.collector import Collector
 from snmpinterface import SNMPInterfaceCollector
 
 
@@ -18,3 +21,34 @@ class TestSNMPInterfaceCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPInterfaceCollector)
+
+    @patch.object(Collector, 'publish_metric')
+    def test_should_bulk_walk_columns(self, publish_mock):
+        c = SNMPInterfaceCollector
+        interfaces = {
+            c.IF_MIB_TYPE_OID + '.1': '6',
+            c.IF_MIB_TYPE_OID + '.2': '24',
+            c.IF_MIB_NAME_OID + '.1': 'eth0',
+            c.IF_MIB_NAME_OID + '.2': 'lo',
+        }
+        counters = {
+            c.IF_MIB_GAUGE_OID_TABLE['ifInErrors'] + '.1': '3',
+            c.IF_MIB_GAUGE_OID_TABLE['ifInErrors'] + '.2': '5',
+            c.IF_MIB_COUNTER_OID_TABLE['ifInUcastPkts'] + '.1': '100',
+        }
+        bulk_walk = Mock(side_effect=lambda oids, *args: (
+            interfaces if c.IF_MIB_TYPE_OID in oids else counters))
+
+        with patch.object(self.collector, 'bulk_walk', bulk_walk):
+            self.collector.collect_snmp('router1', 'localhost', 161, 'public')
+            self.collector.collect_snmp('router1', 'localhost', 161, 'public')
+
+        # Interface names and types are only fetched once
+        self.assertEqual(bulk_walk.call_count, 3)
+
+        paths = [x[0][0].path for x in publish_mock.call_args_list]
+        self.assertEqual(
+            paths.count('devices.router1.interface.eth0.ifInErrors'), 2)
+        self.assertEqual(
+            paths.count('devices.router1.interface.eth0.ifInUcastPkts'), 2)
+        self.assertFalse('devices.router1.interface.lo.ifInErrors' in paths)
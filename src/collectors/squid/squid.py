@@ -10,6 +10,7 @@ Collects data from squid servers
 import re
 import socket
 import diamond.collector
+from diamond.socketclient import SocketClient
 
 
 class SquidCollector(diamond.collector.Collector):
@@ -44,6 +45,7 @@ class SquidCollector(diamond.collector.Collector):
         config_help.update({
             'hosts': 'List of hosts to collect from. Format is '
             + '[nickname@]host[:port], [nickname@]host[:port], etc',
+            'timeout': 'Seconds to wait for squid to answer',
         })
         return config_help
 
@@ -55,40 +57,35 @@ class SquidCollector(diamond.collector.Collector):
         config.update({
             'hosts': ['localhost:3128'],
             'path': 'squid',
+            'timeout': 5,
         })
         return config
 
     def _getData(self, host, port):
+        # Squid closes the connection after each response
+        client = SocketClient(host, port, self.config['timeout'])
         try:
-            squid_sock = socket.socket()
-            squid_sock.connect((host, int(port)))
-            squid_sock.settimeout(0.25)
-            squid_sock.sendall("GET cache_object://localhost/counters HTTP/1.0"
-                               + "\r\nHost: localhost\r\nAccept: */*\r\nConnec"
-                               + "tion: close\r\n\r\n")
-
-            fulldata = ''
-
-            while True:
-                data = squid_sock.recv(1024)
-                if not data:
-                    break
-                fulldata = fulldata + data
-        except Exception, e:
+            return client.request(
+                "GET cache_object://localhost/counters HTTP/1.0\r\n"
+                + "Host: localhost\r\nAccept: */*\r\n"
+                + "Connection: close\r\n\r\n",
+                SocketClient.read_all)
+        except socket.error, e:
             self.log.error('Couldnt connect to squid: %s', e)
             return None
-        squid_sock.close()
-
-        return fulldata
+        finally:
+            client.close()
 
     def collect(self):
         for nickname in self.squid_hosts.keys():
             squid_host = self.squid_hosts[nickname]
 
             fulldata = self._getData(squid_host['host'],
-                                     squid_host['port']).splitlines()
+                                     squid_host['port'])
+            if fulldata is None:
+                continue
 
-            for data in fulldata:
+            for data in fulldata.splitlines():
                 matches = self.stat_pattern.match(data)
                 if matches:
                     self.publish_counter("%s.%s" % (nickname,
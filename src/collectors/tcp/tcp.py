@@ -3,6 +3,20 @@
 """
 The TCPCollector class collects metrics on TCP stats
 
+With *connection_stats* enabled it also counts the current connections, and
+publishes
+
+ * connections.<STATE> - the number of sockets in each TCP state
+ * listen.<port>.queue - connections waiting to be accepted on a port
+ * listen.<port>.backlog - the most connections that can wait there
+ * listen.<port>.saturation - queue as a percentage of backlog
+ * listen.<port>.established - established connections to the port
+
+Sockets are read from the kernel over netlink (NETLINK_SOCK_DIAG), or from
+/proc/net/tcp and /proc/net/tcp6 where that is not available, in which case
+the backlog is unknown. Either way they are counted as they are read, never
+held in memory all at once.
+
 #### Dependencies
 
  * /proc/net/netstat
@@ -177,7 +191,131 @@ flag.</td></tr>
 """
 
 import diamond.collector
+from diamond.collector import str_to_bool
 import os
+import socket
+import struct
+
+# TCP states, numbered as in the kernel's include/net/tcp_states.h
+TCP_STATES = (None, 'ESTABLISHED', 'SYN_SENT', 'SYN_RECV', 'FIN_WAIT1',
+              'FIN_WAIT2', 'TIME_WAIT', 'CLOSE', 'CLOSE_WAIT', 'LAST_ACK',
+              'LISTEN', 'CLOSING')
+TCP_ESTABLISHED = 1
+TCP_LISTEN = 10
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLMSGHDR = struct.Struct('=IHHII')
+# struct inet_diag_req_v2, asking for sockets in any state
+INET_DIAG_REQ = struct.Struct('=BBBxI48x')
+# The start of struct inet_diag_msg: family, state, timer, retransmits,
+# source port (big endian) and the rest of inet_diag_sockid, expires and the
+# receive and send queues
+INET_DIAG_MSG = struct.Struct('=BBBB2s46xIII')
+PORT = struct.Struct('!H')
+
+PROC_NET_TCP = ['/proc/net/tcp', '/proc/net/tcp6']
+
+
+class ConnectionStats(object):
+    """
+    Counts of sockets by state, and queues of listening sockets by port
+    """
+
+    def __init__(self):
+        self.states = [0] * len(TCP_STATES)
+        # Local port -> established connections
+        self.established = {}
+        # Listening port -> [accept queue, backlog or None]
+        self.listening = {}
+
+    def add(self, state, port, rqueue, wqueue):
+        """
+        Count a socket. For a listening socket rqueue is the accept queue
+        and wqueue the backlog.
+        """
+        if state >= len(TCP_STATES):
+            return
+        self.states[state] += 1
+        if state == TCP_ESTABLISHED:
+            self.established[port] = self.established.get(port, 0) + 1
+        elif state == TCP_LISTEN:
+            queues = self.listening.get(port)
+            if queues is None:
+                self.listening[port] = [rqueue, wqueue]
+            else:
+                queues[0] += rqueue
+                if wqueue is not None and queues[1] is not None:
+                    queues[1] += wqueue
+
+
+def parse_sock_diag(data, stats):
+    """
+    Count the sockets in a netlink response. Returns False once the
+    response is done.
+    """
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type = NLMSGHDR.unpack_from(data, offset)[:2]
+        if msg_type == NLMSG_DONE:
+            return False
+        if msg_type == NLMSG_ERROR:
+            errno, = struct.unpack_from('=i', data, offset + NLMSGHDR.size)
+            if errno:
+                raise socket.error(-errno, os.strerror(-errno))
+            return False
+        if msg_type == SOCK_DIAG_BY_FAMILY:
+            (family, state, timer, retrans, sport, expires, rqueue,
+             wqueue) = INET_DIAG_MSG.unpack_from(data,
+                                                 offset + NLMSGHDR.size)
+            stats.add(state, PORT.unpack(sport)[0], rqueue, wqueue)
+        # Messages are aligned to 4 bytes
+        offset += (length + 3) & ~3
+        if length < NLMSGHDR.size:
+            break
+    return True
+
+
+def read_sock_diag(stats, families=(socket.AF_INET, socket.AF_INET6)):
+    """
+    Count the TCP sockets of each family, as reported over netlink
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                         NETLINK_SOCK_DIAG)
+    try:
+        sock.settimeout(5)
+        for seq, family in enumerate(families):
+            request = INET_DIAG_REQ.pack(family, socket.IPPROTO_TCP, 0,
+                                         0xffffffff)
+            sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(request),
+                                    SOCK_DIAG_BY_FAMILY,
+                                    NLM_F_REQUEST | NLM_F_DUMP, seq + 1, 0)
+                      + request)
+            while parse_sock_diag(sock.recv(65536), stats):
+                pass
+    finally:
+        sock.close()
+
+
+def parse_proc_net_tcp(lines, stats):
+    """
+    Count the sockets listed in /proc/net/tcp or /proc/net/tcp6
+    """
+    for line in lines:
+        fields = line.split(None, 5)
+        try:
+            port = int(fields[1].rsplit(':', 1)[1], 16)
+            state = int(fields[3], 16)
+            rqueue = int(fields[4].split(':', 1)[1], 16)
+        except (IndexError, ValueError):
+            # The header
+            continue
+        stats.add(state, port, rqueue, None)
 
 
 class TCPCollector(diamond.collector.Collector):
@@ -196,11 +334,19 @@ class TCPCollector(diamond.collector.Collector):
         super(TCPCollector, self).__init__(config, handlers)
         if self.config['allowed_names'] is None:
             self.config['allowed_names'] = []
+        allowed_names = self.config['allowed_names']
+        if isinstance(allowed_names, basestring):
+            allowed_names = allowed_names.split(',')
+        self.allowed_names = frozenset(n.strip() for n in allowed_names
+                                       if n.strip())
+        self.sock_diag = True
 
     def get_default_config_help(self):
         config_help = super(TCPCollector, self).get_default_config_help()
         config_help.update({
             'allowed_names': 'list of entries to collect, empty to collect all',
+            'connection_stats': 'Count connections by state and the queues'
+                                ' of listening ports',
         })
         return config_help
 
@@ -216,10 +362,50 @@ class TCPCollector(diamond.collector.Collector):
             + 'TCPForwardRetrans, TCPSlowStartRetrans, CurrEstab, '
             + 'TCPAbortOnMemory, TCPBacklogDrop, AttemptFails, '
             + 'EstabResets, InErrs, ActiveOpens, PassiveOpens',
+            'connection_stats': False,
         })
         return config
 
+    def get_connection_stats(self):
+        stats = ConnectionStats()
+        if self.sock_diag:
+            try:
+                read_sock_diag(stats)
+                return stats
+            except (AttributeError, socket.error, struct.error), e:
+                self.log.info('Cannot read sockets over netlink, reading'
+                              ' /proc/net/tcp instead: %s', e)
+                self.sock_diag = False
+                stats = ConnectionStats()
+
+        for filepath in PROC_NET_TCP:
+            if not os.access(filepath, os.R_OK):
+                continue
+            file = open(filepath)
+            try:
+                parse_proc_net_tcp(file, stats)
+            finally:
+                file.close()
+        return stats
+
+    def publish_connection_stats(self, stats):
+        for state, count in enumerate(stats.states):
+            if TCP_STATES[state] is not None:
+                self.publish_gauge('connections.%s' % TCP_STATES[state],
+                                   count)
+        for port, (queue, backlog) in stats.listening.iteritems():
+            self.publish_gauge('listen.%d.queue' % port, queue)
+            self.publish_gauge('listen.%d.established' % port,
+                               stats.established.get(port, 0))
+            if backlog:
+                self.publish_gauge('listen.%d.backlog' % port, backlog)
+                self.publish_gauge('listen.%d.saturation' % port,
+                                   100.0 * queue / backlog, 2)
+
     def collect(self):
+        if str_to_bool(self.config['connection_stats']):
+            self.publish_connection_stats(self.get_connection_stats())
+
         metrics = {}
 
         for filepath in self.PROC:
@@ -237,17 +423,11 @@ class TCPCollector(diamond.collector.Collector):
                 self.log.error('Failed to open %s', filepath)
                 continue
 
-            while True:
-                line = file.readline()
-
-                # Reached EOF?
-                if len(line) == 0:
-                    break
-
+            for line in file:
                 # Line has metrics?
                 if line.startswith("Tcp"):
                     header = line
-                    data = file.readline()
+                    data = next(file, '')
                     break
             file.close()
 
@@ -263,8 +443,7 @@ class TCPCollector(diamond.collector.Collector):
                 metrics[header[i]] = data[i]
 
         for metric_name in metrics.keys():
-            if (len(self.config['allowed_names']) > 0
-                and metric_name not in self.config['allowed_names']):
+            if self.allowed_names and metric_name not in self.allowed_names:
                 continue
 
             value = long(metrics[metric_name])
@@ -14,7 +14,12 @@ try:
 except ImportError:
     from StringIO import StringIO
 
+import socket
+import struct
+
 from tcp import TCPCollector
+from tcp import ConnectionStats
+from tcp import parse_sock_diag
 
 ################################################################################
 
@@ -209,6 +214,48 @@ TcpExt: 0 1 2
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch('diamond.collector.Collector.publish')
+    def test_should_count_connections_from_proc(self, publish_mock):
+        config = get_collector_config('TCPCollector', {
+            'connection_stats': True,
+        })
+        collector = TCPCollector(config, None)
+        collector.sock_diag = False
+
+        with patch.object(TCPCollector, 'PROC', []):
+            with patch('tcp.PROC_NET_TCP',
+                       [self.getFixturePath('proc_net_tcp')]):
+                collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'connections.ESTABLISHED': 3,
+            'connections.LISTEN': 2,
+            'connections.TIME_WAIT': 1,
+            'connections.SYN_RECV': 0,
+            'listen.8080.queue': 3,
+            'listen.8080.established': 2,
+            'listen.3306.queue': 0,
+        })
+
+    def test_should_parse_sock_diag(self):
+        def message(state, port, rqueue, wqueue):
+            payload = struct.pack('=BBBB', socket.AF_INET, state, 0, 0)
+            payload += struct.pack('!H', port) + '\0' * 46
+            payload += struct.pack('=IIIII', 0, rqueue, wqueue, 0, 0)
+            return struct.pack('=IHHII', 16 + len(payload), 20, 2, 1,
+                               0) + payload
+
+        stats = ConnectionStats()
+        self.assertTrue(parse_sock_diag(
+            message(10, 80, 5, 128) + message(10, 80, 1, 128)
+            + message(1, 80, 0, 0) + message(6, 40000, 0, 0), stats))
+        self.assertFalse(parse_sock_diag(
+            struct.pack('=IHHIIi', 20, 3, 2, 1, 0, 0), stats))
+
+        self.assertEquals(stats.listening, {80: [6, 256]})
+        self.assertEquals(stats.established, {80: 1})
+        self.assertEquals(stats.states[6], 1)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
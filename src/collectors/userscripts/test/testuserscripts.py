@@ -3,12 +3,12 @@
 ################################################################################
 
 import os
-import sys
+import shutil
+import tempfile
 
 from test import CollectorTestCase
 from test import get_collector_config
 from test import unittest
-from test import run_only
 from mock import patch
 
 from diamond.collector import Collector
@@ -17,19 +17,6 @@ from userscripts import UserScriptsCollector
 ################################################################################
 
 
-def run_only_if_kitchen_is_available(func):
-    if sys.version_info < (2, 7):
-        try:
-            from kitchen.pycompat27 import subprocess
-            subprocess  # workaround for pyflakes issue #13
-        except ImportError:
-            subprocess = None
-    else:
-        import subprocess
-    pred = lambda: subprocess is not None
-    return run_only(func, pred)
-
-
 class TestUserScriptsCollector(CollectorTestCase):
     def setUp(self):
         config = get_collector_config('UserScriptsCollector', {
@@ -42,7 +29,23 @@ class TestUserScriptsCollector(CollectorTestCase):
     def test_import(self):
         self.assertTrue(UserScriptsCollector)
 
-    @run_only_if_kitchen_is_available
+    def write_scripts(self, scripts):
+        """
+        Returns a config for a scripts_path holding the scripts
+        """
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        for name, body in scripts.items():
+            filename = os.path.join(path, name)
+            f = open(filename, 'w')
+            f.write('#!/bin/sh\n' + body)
+            f.close()
+            os.chmod(filename, 0755)
+        return get_collector_config('UserScriptsCollector', {
+            'scripts_path': path,
+            'timeout': 0.5,
+        })
+
     @patch.object(Collector, 'publish')
     def test_should_work_with_example(self, publish_mock):
         self.collector.collect()
@@ -57,6 +60,50 @@ class TestUserScriptsCollector(CollectorTestCase):
                            metrics=metrics)
         self.assertPublishedMany(publish_mock, metrics)
 
+    @patch.object(Collector, 'publish')
+    def test_should_parse_timestamps_and_types(self, publish_mock):
+        collector = UserScriptsCollector(self.write_scripts({
+            'typed.sh': 'echo "a.b 1 1351718385 GAUGE"\n'
+                        'echo "a.c 2.5 COUNTER"\n'
+                        'echo "# a comment"\n',
+        }), None)
+        collector.collect()
+
+        calls = dict((c[0][0], c) for c in publish_mock.call_args_list)
+        self.assertEqual(calls['a.b'][0][:4], ('a.b', '1', 0, 'GAUGE'))
+        self.assertEqual(calls['a.b'][1], {'timestamp': 1351718385})
+        self.assertEqual(calls['a.c'][0][:4], ('a.c', '2.5', 4, 'COUNTER'))
+        self.assertEqual(calls['a.c'][1], {'timestamp': None})
+        self.assertEqual(calls['userscripts.typed_sh.failed'][0][1], 0)
+        self.assertTrue('userscripts.typed_sh.runtime' in calls)
+
+    @patch.object(Collector, 'publish')
+    def test_should_kill_scripts_after_timeout(self, publish_mock):
+        collector = UserScriptsCollector(self.write_scripts({
+            'hang.sh': 'echo "a.hung 1"\nsleep 30\n',
+            'fast.sh': 'echo "a.fast 1"\n',
+        }), None)
+        collector.collect()
+
+        self.assertPublishedMany(publish_mock, {
+            'a.fast': 1,
+            'userscripts.fast_sh.failed': 0,
+            'userscripts.hang_sh.failed': 1,
+        })
+
+    @patch.object(Collector, 'publish')
+    def test_should_honour_script_intervals(self, publish_mock):
+        collector = UserScriptsCollector(self.write_scripts({
+            'slow.sh': 'echo "# interval 3600"\necho "a.slow 1"\n',
+            'fast.sh': 'echo "a.fast 1"\n',
+        }), None)
+        collector.collect()
+        collector.collect()
+
+        names = [c[0][0] for c in publish_mock.call_args_list]
+        self.assertEqual(names.count('a.slow'), 1)
+        self.assertEqual(names.count('a.fast'), 2)
+
 ################################################################################
 if __name__ == "__main__":
     unittest.main()
@@ -7,42 +7,59 @@ Scripts need to be +x and should output metrics in the form of
 
 ```
 metric.path.a 1
-metric.path.b 2
-metric.path.c 3
+metric.path.b 2 1351718385
+metric.path.c 3.5 1351718385 GAUGE
 ```
 
-They are not passed any arguments and if they return an error code,
-no metrics are collected.
+that is the metric name and value, optionally followed by a timestamp in
+seconds since the epoch and the metric type, GAUGE or COUNTER. Lines starting
+with # are comments, except for
 
-#### Dependencies
+```
+# interval 600
+```
+
+which asks for the script to be run at most every 600 seconds from then on,
+for scripts too slow to run on every collection.
 
- * [subprocess](http://docs.python.org/library/subprocess.html)
- * [kitchen](http://packages.python.org/kitchen/index.html)
+They are not passed any arguments and if they return an error code, no
+metrics are collected.
+
+Up to *max_processes* scripts are run at the same time, within the limit
+shared by all collectors (see diamond.executor). A script still running
+after *timeout* seconds is killed, along with any processes it started.
+Unless *self_metrics* is disabled, the runtime in seconds of each
+script and whether it failed (1) or not (0) are published as
+userscripts.<script>.runtime and userscripts.<script>.failed.
 
 """
 
 import diamond.collector
-import diamond.convertor
+from diamond import executor
+from diamond.collector import str_to_bool
+from diamond.parallel import run_parallel
 import os
-import sys
-# Get a subprocess capable of check_output
-if sys.version_info < (2, 7):
-    try:
-        from kitchen.pycompat27 import subprocess
-        subprocess  # workaround for pyflakes issue #13
-    except ImportError:
-        subprocess = None
-else:
-    import subprocess
+import time
+
+METRIC_TYPES = ('COUNTER', 'GAUGE')
 
 
 class UserScriptsCollector(diamond.collector.Collector):
 
+    def __init__(self, *args, **kwargs):
+        super(UserScriptsCollector, self).__init__(*args, **kwargs)
+        # Scripts that declared an interval, and when they next run
+        self.intervals = {}
+        self.next_runs = {}
+
     def get_default_config_help(self):
         config_help = super(UserScriptsCollector,
                             self).get_default_config_help()
         config_help.update({
             'scripts_path': "Path to find the scripts to run",
+            'max_processes': 'Number of scripts run at the same time',
+            'timeout': 'Seconds before a script is killed',
+            'self_metrics': 'Publish the runtime and failures of each script',
         })
         return config_help
 
@@ -56,37 +73,142 @@ class UserScriptsCollector(diamond.collector.Collector):
             'scripts_path': '/etc/diamond/user_scripts/',
             'method':       'Threaded',
             'floatprecision': 4,
+            'max_processes': 4,
+            'timeout':      60,
+            'self_metrics': True,
         })
         return config
 
-    def collect(self):
-        if subprocess is None:
-            self.log.error('Unable to import kitchen')
-            return {}
+    def run_script(self, path):
+        """
+        Run a script, killing it after the timeout. Returns (exit code or
+        None if it was killed, stdout, stderr, runtime).
+        """
+        timeout = float(self.config['timeout'])
+        try:
+            result = executor.EXECUTOR.run([path], timeout=timeout)
+        except executor.CommandTimeout:
+            return None, '', '', timeout
+        return result.returncode, result.stdout, result.stderr, result.runtime
 
+    def parse_output(self, path, out):
+        """
+        Returns ([(name, value, precision, metric type, timestamp)],
+        interval or None, number of lines not understood) from the output of
+        a script
+        """
+        metrics = []
+        interval = None
+        errors = 0
+        for line in out.splitlines():
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0].startswith('#'):
+                fields[0] = fields[0][1:]
+                fields = filter(None, fields)
+                if len(fields) == 2 and fields[0] == 'interval':
+                    try:
+                        interval = float(fields[1])
+                    except ValueError:
+                        errors += 1
+                        self.log.error("%s: invalid interval %r", path,
+                                       fields[1])
+                continue
+
+            try:
+                if not 2 <= len(fields) <= 4:
+                    raise ValueError('expected name, value, timestamp and'
+                                     ' type')
+                name, value = fields[:2]
+                float(value)
+                metric_type = 'COUNTER'
+                timestamp = None
+                for field in fields[2:]:
+                    if field.upper() in METRIC_TYPES:
+                        metric_type = field.upper()
+                    else:
+                        timestamp = int(float(field))
+            except ValueError, e:
+                errors += 1
+                self.log.error("%s: cannot parse %r: %s", path, line, e)
+                continue
+
+            precision = 0
+            if "." in value:
+                precision = int(self.config['floatprecision'])
+            metrics.append((name, value, precision, metric_type, timestamp))
+        return metrics, interval, errors
+
+    def get_scripts(self, now):
+        """
+        Returns the paths of the scripts due to run
+        """
         scripts_path = self.config['scripts_path']
-        if not os.access(scripts_path, os.R_OK):
-            return None
-        for script in os.listdir(scripts_path):
+        scripts = []
+        for script in sorted(os.listdir(scripts_path)):
             absolutescriptpath = os.path.join(scripts_path, script)
             if not os.access(absolutescriptpath, os.X_OK):
                 self.log.info("%s is not executable" % absolutescriptpath)
                 continue
-            out = None
-            self.log.debug("Executing %s" % absolutescriptpath)
-            try:
-                out = subprocess.check_output([absolutescriptpath])
-            except subprocess.CalledProcessError, e:
-                self.log.error("%s return exit value %s; skipping" %
-                        (absolutescriptpath, e.returncode))
-                continue
-            if not out:
-                self.log.info("%s return no output" % absolutescriptpath)
+            if self.next_runs.get(absolutescriptpath, 0) > now:
                 continue
-            # Use filter to remove empty lines of output
-            for line in filter(None, out.split('\n')):
-                name, value = line.split()
-                floatprecision = 0
-                if "." in value:
-                    floatprecision = self.config['floatprecision']
-                self.publish(name, value, floatprecision)
+            scripts.append(absolutescriptpath)
+        return scripts
+
+    def collect(self):
+        scripts_path = self.config['scripts_path']
+        if not os.access(scripts_path, os.R_OK):
+            return None
+
+        now = time.time()
+        scripts = self.get_scripts(now)
+
+        def run(path):
+            self.log.debug("Executing %s" % path)
+            return self.run_script(path)
+
+        results = run_parallel(run, scripts,
+                               int(self.config['max_processes']))
+
+        for path, result in zip(scripts, results):
+            failed = True
+            runtime = None
+            if isinstance(result, Exception):
+                self.log.error("Cannot run %s: %s", path, result)
+            else:
+                returncode, out, err, runtime = result
+                if returncode is None:
+                    self.log.error("%s timed out after %s seconds; killed",
+                                   path, self.config['timeout'])
+                elif returncode != 0:
+                    self.log.error("%s return exit value %s; skipping: %s",
+                                   path, returncode, err.strip())
+                elif not out:
+                    self.log.info("%s return no output" % path)
+                    failed = False
+                else:
+                    failed = self.publish_output(path, out)
+
+            if str_to_bool(self.config['self_metrics']):
+                name = 'userscripts.%s' % os.path.basename(path).replace(
+                    '.', '_')
+                if runtime is not None:
+                    self.publish(name + '.runtime', runtime, 3, 'GAUGE')
+                self.publish(name + '.failed', int(failed), 0, 'GAUGE')
+
+            if path in self.intervals:
+                self.next_runs[path] = now + self.intervals[path]
+
+    def publish_output(self, path, out):
+        """
+        Publish the output of a script. Returns True if any of it could
+        not be parsed.
+        """
+        metrics, interval, errors = self.parse_output(path, out)
+        if interval is not None:
+            self.intervals[path] = interval
+        for name, value, precision, metric_type, timestamp in metrics:
+            self.publish(name, value, precision, metric_type,
+                         timestamp=timestamp)
+        return errors > 0
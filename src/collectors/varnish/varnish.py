@@ -11,7 +11,6 @@ VarnishCollector grabs stats from Varnish and submits them the Graphite
 
 import diamond.collector
 import re
-import subprocess
 
 
 class VarnishCollector(diamond.collector.Collector):
@@ -76,14 +75,9 @@ class VarnishCollector(diamond.collector.Collector):
 
     def poll(self):
         try:
-            command = [self.config['bin'], '-1']
-
-            if self.config['use_sudo']:
-                command.insert(0, self.config['sudo_cmd'])
-
-            output = subprocess.Popen(command,
-                                      stdout=subprocess.PIPE).communicate()[0]
-        except OSError:
+            output = self.run_command([self.config['bin'], '-1']).stdout
+        except OSError, e:
+            self.log.error("Cannot run %s: %s", self.config['bin'], e)
             output = ""
 
         return output
@@ -0,0 +1,197 @@
+# coding=utf-8
+
+"""
+Cached discovery of cgroup hierarchies for the cgroup collectors.
+
+Walking a hierarchy with thousands of cgroups costs far more than reading
+their stat files, so the tree is only walked again every refresh_interval
+seconds. Stat files are kept open between runs and re-read from offset 0,
+which makes the kernel regenerate their contents. At most max_handles files
+are kept open, closing the least recently read ones, so hosts with thousands
+of cgroups do not run the process out of file descriptors.
+"""
+
+import errno
+import heapq
+import logging
+import os
+import time
+import fnmatch
+
+CGROUP2_PATH = '/sys/fs/cgroup/'
+
+# Stat files kept open by default
+MAX_HANDLES = 256
+
+# Errors reading a stat file of a cgroup that was removed
+GONE_ERRNOS = (errno.ENOENT, errno.ENODEV)
+
+
+def is_cgroup2(path=CGROUP2_PATH):
+    """
+    Returns True if path is the root of a unified (v2) cgroup hierarchy
+    """
+    return os.path.exists(os.path.join(path, 'cgroup.controllers'))
+
+
+def read_file(path):
+    fp = open(path)
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+
+class CgroupTree(object):
+    """
+    A cached view of the cgroups below root that contain a given stat file.
+
+    Each cgroup is named the way the cgroup collectors publish it: the path
+    relative to root with slashes replaced by dots, and 'system' for root.
+    """
+
+    def __init__(self, root, filenames, refresh_interval=300, include=None,
+                 exclude=None, max_handles=MAX_HANDLES):
+        """
+        filenames is a list of files to track per cgroup. Only directories
+        containing the first one are considered cgroups. A max_handles of 0
+        opens and closes the files on every read.
+        """
+        self.log = logging.getLogger('diamond')
+        self.root = root
+        self.filenames = list(filenames)
+        self.refresh_interval = float(refresh_interval)
+        self.include = include or []
+        self.exclude = exclude or []
+        self.cgroups = {}
+        self.max_handles = int(max_handles)
+        self.handles = {}
+        # path -> read count when its handle was last read
+        self.last_used = {}
+        self.reads = 0
+        self.last_refresh = None
+
+    def wanted(self, name):
+        """
+        Apply the include/exclude globs to a cgroup name
+        """
+        if self.include:
+            for pattern in self.include:
+                if fnmatch.fnmatchcase(name, pattern):
+                    break
+            else:
+                return False
+        for pattern in self.exclude:
+            if fnmatch.fnmatchcase(name, pattern):
+                return False
+        return True
+
+    def refresh(self):
+        """
+        Walk the hierarchy and rebuild the list of cgroups
+        """
+        cgroups = {}
+        for root, dirnames, filenames in os.walk(self.root):
+            if self.filenames[0] not in filenames:
+                continue
+            name = root.replace(self.root, "").replace("/", ".")
+            if name == '':
+                name = 'system'
+            if not self.wanted(name):
+                continue
+            files = {}
+            for filename in self.filenames:
+                if filename in filenames:
+                    files[filename] = os.path.join(root, filename)
+            cgroups[name] = files
+
+        for name in self.cgroups.keys():
+            if name not in cgroups:
+                self.forget(name)
+        self.cgroups = cgroups
+        self.last_refresh = time.time()
+
+    def get_cgroups(self):
+        """
+        Returns a dict of cgroup name to a dict of tracked file paths,
+        walking the hierarchy again if the cached view has expired
+        """
+        if (self.last_refresh is None
+                or time.time() - self.last_refresh >= self.refresh_interval):
+            self.refresh()
+        return self.cgroups
+
+    def read(self, name, filename):
+        """
+        Read a tracked file of a cgroup. Returns None if the cgroup does not
+        have the file, has gone away since the last refresh, or the file
+        cannot be read.
+        """
+        path = self.cgroups.get(name, {}).get(filename)
+        if path is None:
+            return None
+        try:
+            try:
+                return self.read_handle(path)
+            except (IOError, OSError), e:
+                if e.errno in GONE_ERRNOS:
+                    raise
+                self.log.warning('Cannot keep %s open: %s', path, e)
+                self.close_handle(path)
+                return read_file(path)
+        except (IOError, OSError), e:
+            if e.errno in GONE_ERRNOS:
+                self.forget(name)
+                self.cgroups.pop(name, None)
+            else:
+                self.log.error('Cannot read %s: %s', path, e)
+            return None
+
+    def read_handle(self, path):
+        """
+        Read a file from offset 0 of its kept handle, opening it if needed
+        """
+        handle = self.handles.get(path)
+        if handle is None:
+            if self.max_handles <= 0:
+                return read_file(path)
+            if len(self.handles) >= self.max_handles:
+                self.close_least_recently_used()
+            handle = open(path)
+            self.handles[path] = handle
+        self.reads += 1
+        self.last_used[path] = self.reads
+        handle.seek(0)
+        return handle.read()
+
+    def close_least_recently_used(self):
+        """
+        Close the least recently read tenth of the kept handles, so the cost
+        of finding them is paid once per many opens
+        """
+        count = max(1, self.max_handles / 10)
+        for last_used, path in heapq.nsmallest(
+                count, ((v, k) for k, v in self.last_used.iteritems())):
+            self.close_handle(path)
+
+    def close_handle(self, path):
+        self.last_used.pop(path, None)
+        handle = self.handles.pop(path, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except (IOError, OSError):
+                pass
+
+    def forget(self, name):
+        """
+        Close the file handles of a cgroup that went away
+        """
+        for path in self.cgroups.get(name, {}).itervalues():
+            self.close_handle(path)
+
+    def close(self):
+        for name in self.cgroups.keys():
+            self.forget(name)
+        self.cgroups = {}
+        self.last_refresh = None
@@ -13,6 +13,9 @@ import traceback
 import time
 
 from diamond.metric import Metric
+from diamond.counterstore import CounterStore
+from diamond.metricfilter import MetricFilter, MAX_CACHE_SIZE
+from diamond import executor
 
 # Detect the architecture of the system and set the counters for MAX_VALUES
 # appropriately. Otherwise, rolling over counters will cause incorrect or
@@ -134,7 +137,8 @@ class Collector(object):
         # Initialize Members
         self.name = self.__class__.__name__
         self.handlers = handlers
-        self.last_values = {}
+        # Handlers to send each metric path to
+        self.routes = {}
 
         # Get Collector class
         cls = self.__class__
@@ -171,6 +175,28 @@ class Collector(object):
         self.config['measure_collector_time'] = str_to_bool(
             self.config['measure_collector_time'])
 
+        self.config['publish_counter_evictions'] = str_to_bool(
+            self.config['publish_counter_evictions'])
+
+        # Never expire a counter between two consecutive runs
+        counter_ttl = float(self.config['counter_ttl'])
+        if counter_ttl > 0:
+            counter_ttl = max(counter_ttl, 2 * float(self.config['interval']))
+        self.last_values = CounterStore(
+            ttl=counter_ttl, max_size=int(self.config['counter_max_size']))
+
+        # Default blacklist patterns apply even where a collector has its own
+        blacklist = self._as_list(self.config.get('metrics_blacklist'))
+        default_blacklist = self._as_list(
+            config['collectors']['default'].get('metrics_blacklist'))
+        for pattern in default_blacklist:
+            if pattern not in blacklist:
+                blacklist.append(pattern)
+        self.metric_filter = MetricFilter(
+            self.config.get('metrics_whitelist'), blacklist)
+        if not self.metric_filter:
+            self.metric_filter = None
+
         self.collect_running = False
 
     def get_default_config_help(self):
@@ -181,6 +207,16 @@ class Collector(object):
             'enabled': 'Enable collecting these metrics',
             'byte_unit': 'Default numeric output(s)',
             'measure_collector_time': 'Collect the collector run time in ms',
+            'counter_ttl': 'Seconds after which the last value of a counter'
+                           ' that is no longer updated is forgotten'
+                           ' (0 to keep forever)',
+            'counter_max_size': 'Maximum number of counter values kept for'
+                                ' derivatives (0 for no limit)',
+            'publish_counter_evictions': 'Publish the number of counter'
+                                         ' values forgotten per run',
+            'metrics_whitelist': 'Regexes of the metric names to publish,'
+                                 ' all if empty',
+            'metrics_blacklist': 'Regexes of metric names not to publish',
         }
 
     def get_default_config(self):
@@ -227,8 +263,28 @@ class Collector(object):
 
             # Collect the collector run time in ms
             'measure_collector_time': False,
+
+            # Forget the last value of counters not updated for an hour
+            'counter_ttl': 3600,
+
+            # Maximum number of counter values kept for derivatives
+            'counter_max_size': 100000,
+
+            # Publish the number of counter values forgotten per run
+            'publish_counter_evictions': False,
+
+            # Regexes of the metric names to publish, and not to publish
+            'metrics_whitelist': [],
+            'metrics_blacklist': [],
         }
 
+    def _as_list(self, patterns):
+        if not patterns:
+            return []
+        if isinstance(patterns, basestring):
+            return [patterns]
+        return list(patterns)
+
     def get_stats_for_upload(self, config=None):
         if config is None:
             config = self.config
@@ -300,16 +356,23 @@ class Collector(object):
         """
         raise NotImplementedError()
 
-    def publish(self, name, value, precision=0, metric_type='COUNTER'):
+    def publish(self, name, value, precision=0, metric_type='COUNTER',
+                timestamp=None):
         """
-        Publish a metric with the given name
+        Publish a metric with the given name, timestamped now unless a
+        timestamp is given. Names rejected by metrics_whitelist or
+        metrics_blacklist are dropped.
         """
+        if (self.metric_filter is not None
+                and not self.metric_filter.allowed(name)):
+            return
+
         # Get metric Path
         path = self.get_metric_path(name)
 
         # Create Metric
-        metric = Metric(path, value, None, precision, host=self.get_hostname(),
-                        metric_type=metric_type)
+        metric = Metric(path, value, timestamp, precision,
+                        host=self.get_hostname(), metric_type=metric_type)
 
         # Publish Metric
         self.publish_metric(metric)
@@ -318,10 +381,31 @@ class Collector(object):
         """
         Publish a Metric object
         """
+        try:
+            handlers = self.routes[metric.path]
+        except KeyError:
+            handlers = self.route(metric.path)
+
         # Process Metric
-        for handler in self.handlers:
+        for handler in handlers:
             handler._process(metric)
 
+    def route(self, path):
+        """
+        Returns the handlers that accept metrics with this path from this
+        collector, and remembers them
+        """
+        handlers = self.handlers
+        if any(getattr(handler, 'routed', False) for handler in handlers):
+            handlers = [handler for handler in handlers
+                        if not handler.routed
+                        or handler.accepts(self.name, path)]
+
+        if len(self.routes) >= MAX_CACHE_SIZE:
+            self.routes.clear()
+        self.routes[path] = handlers
+        return handlers
+
     def publish_gauge(self, name, value, precision=0):
         return self.publish(name, value, precision=precision,
                             metric_type='GAUGE')
@@ -373,6 +457,37 @@ class Collector(object):
         # Return result
         return result
 
+    def run_command(self, command, name=None, cache_ttl=None, timeout=None):
+        """
+        Run a command with the shared executor, returning its
+        executor.CommandResult. See diamond.executor for the settings used.
+        The runtime is published as commands.<name>.runtime, name defaulting
+        to the name of the program run.
+        """
+        config = self.config
+        if 'command_max_processes' in config:
+            executor.EXECUTOR.set_max_processes(
+                config['command_max_processes'])
+        if timeout is None:
+            timeout = config.get('command_timeout', executor.DEFAULT_TIMEOUT)
+        if cache_ttl is None:
+            cache_ttl = float(config.get('command_cache_ttl', 0))
+        if name is None:
+            name = os.path.basename(command[0]).replace('.', '_')
+
+        if str_to_bool(config.get('use_sudo', False)):
+            command = executor.EXECUTOR.sudo_command(
+                command, config.get('sudo_cmd', '/usr/bin/sudo'),
+                config.get('sudo_mode', 'plain'))
+
+        result = executor.EXECUTOR.run(command, timeout=timeout,
+                                       cache_ttl=cache_ttl)
+        if (not result.cached
+                and str_to_bool(config.get('command_metrics', True))):
+            self.publish('commands.%s.runtime' % name, result.runtime, 3,
+                         'GAUGE')
+        return result
+
     def _run(self):
         """
         Run the collector unless it's already running
@@ -398,6 +513,11 @@ class Collector(object):
                         metric_value = int((end_time - start_time) * 1000)
                         self.publish(metric_name, metric_value)
 
+                self.last_values.expire()
+                if self.config['publish_counter_evictions']:
+                    self.publish('counter_evictions',
+                                 self.last_values.pop_evictions())
+
             except Exception:
                 # Log Error
                 self.log.error(traceback.format_exc())
@@ -0,0 +1,82 @@
+# coding=utf-8
+
+"""
+Bounded storage for the last seen value of each counter a collector derives.
+
+Collectors whose metric names churn (cgroups, processes, interfaces, queues)
+would otherwise keep the value of every name they ever saw. Entries not
+updated within ttl seconds are expired, and the least recently updated
+entries are evicted once the store grows past max_size.
+"""
+
+import time
+import heapq
+
+
+class CounterStore(object):
+
+    def __init__(self, ttl=0, max_size=0):
+        """
+        A ttl or max_size of 0 disables that bound
+        """
+        self.ttl = float(ttl)
+        self.max_size = int(max_size)
+        self.values = {}
+        self.last_seen = {}
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        if key not in self.values and self.max_size > 0:
+            if len(self.values) >= self.max_size:
+                self.evict_oldest()
+        self.values[key] = value
+        self.last_seen[key] = time.time()
+
+    def __delitem__(self, key):
+        del self.values[key]
+        del self.last_seen[key]
+
+    def __len__(self):
+        return len(self.values)
+
+    def keys(self):
+        return self.values.keys()
+
+    def evict_oldest(self):
+        """
+        Drop the least recently updated tenth of the store, so the cost of
+        finding them is paid once per many inserts
+        """
+        count = max(1, self.max_size / 10)
+        for last_seen, key in heapq.nsmallest(
+                count, ((v, k) for k, v in self.last_seen.iteritems())):
+            del self[key]
+            self.evictions += 1
+
+    def expire(self, now=None):
+        """
+        Drop all entries not updated within the ttl
+        """
+        if self.ttl <= 0:
+            return
+        if now is None:
+            now = time.time()
+        cutoff = now - self.ttl
+        expired = [k for k, v in self.last_seen.iteritems() if v < cutoff]
+        for key in expired:
+            del self[key]
+        self.evictions += len(expired)
+
+    def pop_evictions(self):
+        """
+        Return the number of evictions since the last call
+        """
+        evictions = self.evictions
+        self.evictions = 0
+        return evictions
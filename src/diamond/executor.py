@@ -0,0 +1,189 @@
+# coding=utf-8
+
+"""
+Running the command line tools collectors read their metrics from.
+
+All collectors share one Executor, which runs at most *max_processes*
+commands at a time, so expensive tools scheduled on the same tick wait for
+each other instead of all forking at once. Each command runs in a session of
+its own and is killed, with everything it started, when it times out. Results
+may be cached for slow changing outputs.
+
+Collectors run commands with Collector.run_command(), which reads these
+settings from the collector config:
+
+ * command_timeout - seconds before a command is killed (default 30)
+ * command_max_processes - commands run at the same time by all collectors.
+   Set it under [collectors][default].
+ * command_cache_ttl - seconds to reuse the output of a command (default 0)
+ * command_metrics - publish the runtime of each command run (default True)
+ * use_sudo, sudo_cmd - run commands with sudo
+ * sudo_mode - plain, or warm to refresh sudo's cached credentials before
+   they expire so commands never wait on authentication
+
+sudo is always run non-interactively, so a command needing a password fails
+instead of hanging, and is skipped when diamond already runs as root.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_PROCESSES = 4
+
+# Seconds between asking a timed out command to stop and killing it
+KILL_GRACE = 1
+
+# Seconds between refreshing sudo credentials in warm mode, well within
+# sudo's default timestamp_timeout of 5 minutes
+SUDO_REFRESH = 60
+
+
+class CommandTimeout(OSError):
+    """
+    Raised when a command is killed for running too long
+    """
+
+
+class CommandResult(object):
+
+    def __init__(self, command, returncode, stdout, stderr, runtime,
+                 cached=False):
+        self.command = command
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.runtime = runtime
+        self.cached = cached
+
+
+class Executor(object):
+
+    def __init__(self, max_processes=DEFAULT_MAX_PROCESSES):
+        self.max_processes = max_processes
+        self.running = 0
+        self.condition = threading.Condition()
+        # Command tuple -> (expiry time, CommandResult)
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        # sudo command -> time its credentials were refreshed
+        self.sudo_refreshed = {}
+
+    def set_max_processes(self, max_processes):
+        self.condition.acquire()
+        try:
+            self.max_processes = max(int(max_processes), 1)
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+    def _acquire(self):
+        self.condition.acquire()
+        try:
+            while self.running >= self.max_processes:
+                self.condition.wait()
+            self.running += 1
+        finally:
+            self.condition.release()
+
+    def _release(self):
+        self.condition.acquire()
+        try:
+            self.running -= 1
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def sudo_command(self, command, sudo_cmd, mode='plain'):
+        """
+        Returns command run through sudo, unless already running as root
+        """
+        if os.geteuid() == 0:
+            return list(command)
+        if mode == 'warm':
+            now = time.time()
+            if now - self.sudo_refreshed.get(sudo_cmd, 0) > SUDO_REFRESH:
+                self.sudo_refreshed[sudo_cmd] = now
+                try:
+                    self.run([sudo_cmd, '-n', '-v'], timeout=KILL_GRACE * 5)
+                except OSError:
+                    pass
+        return [sudo_cmd, '-n'] + list(command)
+
+    def run(self, command, timeout=DEFAULT_TIMEOUT, cache_ttl=0):
+        """
+        Run a command, waiting for a free process slot first. Returns a
+        CommandResult, whatever the exit code. Raises OSError if the command
+        cannot be run and CommandTimeout if it had to be killed.
+        """
+        key = tuple(command)
+        if cache_ttl:
+            self.cache_lock.acquire()
+            try:
+                cached = self.cache.get(key)
+                if cached is not None and cached[0] > time.time():
+                    result = cached[1]
+                    return CommandResult(result.command, result.returncode,
+                                         result.stdout, result.stderr,
+                                         result.runtime, cached=True)
+            finally:
+                self.cache_lock.release()
+
+        self._acquire()
+        try:
+            result = self._run(command, timeout)
+        finally:
+            self._release()
+
+        if cache_ttl:
+            self.cache_lock.acquire()
+            try:
+                now = time.time()
+                for cached_key, (expiry, cached) in self.cache.items():
+                    if expiry <= now:
+                        del self.cache[cached_key]
+                self.cache[key] = (now + float(cache_ttl), result)
+            finally:
+                self.cache_lock.release()
+        return result
+
+    def _run(self, command, timeout):
+        start = time.time()
+        # In a session of its own, so anything it starts is killed with it
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, close_fds=True,
+                                   preexec_fn=os.setsid)
+        killed = []
+
+        def kill():
+            killed.append(True)
+            for sig in (signal.SIGTERM, signal.SIGKILL):
+                try:
+                    os.killpg(process.pid, sig)
+                except OSError:
+                    return
+                time.sleep(KILL_GRACE)
+                if process.poll() is not None:
+                    return
+
+        timer = threading.Timer(float(timeout), kill)
+        timer.daemon = True
+        timer.start()
+        try:
+            stdout, stderr = process.communicate()
+            process.wait()
+        finally:
+            timer.cancel()
+
+        runtime = time.time() - start
+        if killed:
+            raise CommandTimeout('%s killed after %s seconds'
+                                 % (command[0], timeout))
+        return CommandResult(command, process.returncode, stdout, stderr,
+                             runtime)
+
+# Shared by all collectors
+EXECUTOR = Executor()
@@ -0,0 +1,184 @@
+# coding=utf-8
+
+"""
+Flattening of nested stats documents into (path, number) pairs.
+
+flatten() walks a parsed JSON (or BSON) document once, yielding the dotted
+path and value of each numeric leaf. A PathFilter restricts the walk to the
+paths matching include globs and not matching exclude globs. Globs are
+matched a path segment at a time, so a subtree that cannot match is skipped
+before any of the names below it are built:
+
+    jvm.mem.*          - the direct children of jvm.mem
+    thread_pool.*.queue
+    **.count           - count at any depth
+    indices            - indices and everything below it
+
+An include or exclude glob matching a path also applies to everything below
+it.
+"""
+
+import re
+import fnmatch
+
+# The matching state of a subtree that is entirely included
+INCLUDED = (True, frozenset(), frozenset())
+
+# Steps cached per filter before the cache is cleared
+MAX_CACHE_SIZE = 100000
+
+
+def compile_glob(pattern, sep='.'):
+    """
+    Returns a glob as a tuple of segments. Each segment is '**', a literal
+    name, or the match function of a compiled regex.
+    """
+    segments = []
+    for segment in pattern.split(sep):
+        if segment == '**':
+            segments.append(segment)
+        elif re.search(r'[*?[]', segment):
+            segments.append(re.compile(fnmatch.translate(segment)).match)
+        else:
+            segments.append(segment)
+    return tuple(segments)
+
+
+def split_globs(value):
+    """
+    Returns a list of globs from a config value
+    """
+    if not value:
+        return []
+    if isinstance(value, basestring):
+        value = value.replace(',', ' ').split()
+    return list(value)
+
+
+class PathFilter(object):
+
+    def __init__(self, include=None, exclude=None, sep='.'):
+        self.include = [compile_glob(p, sep) for p in split_globs(include)]
+        self.exclude = [compile_glob(p, sep) for p in split_globs(exclude)]
+        self.cache = {}
+
+    def _closure(self, globs, states):
+        """
+        Add the states reached by letting '**' match no segments
+        """
+        states = set(states)
+        pending = list(states)
+        while pending:
+            i, pos = pending.pop()
+            if pos < len(globs[i]) and globs[i][pos] == '**':
+                if (i, pos + 1) not in states:
+                    states.add((i, pos + 1))
+                    pending.append((i, pos + 1))
+        return frozenset(states)
+
+    def _advance(self, globs, states, name):
+        """
+        Returns the states after matching a segment, and whether a glob
+        matched the whole path
+        """
+        advanced = set()
+        for i, pos in states:
+            glob = globs[i]
+            if pos >= len(glob):
+                continue
+            segment = glob[pos]
+            if segment == '**':
+                advanced.add((i, pos))
+            elif segment == name or (not isinstance(segment, basestring)
+                                     and segment(name)):
+                advanced.add((i, pos + 1))
+        advanced = self._closure(globs, advanced)
+        matched = False
+        for i, pos in advanced:
+            if pos == len(globs[i]):
+                matched = True
+                break
+        return advanced, matched
+
+    def start(self):
+        """
+        Returns the matching state of the root of a document
+        """
+        if not self.include and not self.exclude:
+            return INCLUDED
+        return (not self.include,
+                self._closure(self.include,
+                              [(i, 0) for i in range(len(self.include))]),
+                self._closure(self.exclude,
+                              [(i, 0) for i in range(len(self.exclude))]))
+
+    def step(self, state, name):
+        """
+        Returns the matching state of the child name of a node, or None if
+        nothing below it can be included
+        """
+        if state is INCLUDED:
+            return state
+        key = (state, name)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+
+        included, include, exclude = state
+        result = None
+        if exclude:
+            exclude, matched = self._advance(self.exclude, exclude, name)
+            if matched:
+                exclude = None
+        if exclude is not None:
+            if not included:
+                include, included = self._advance(self.include, include,
+                                                  name)
+                if included:
+                    include = frozenset()
+            if included or include:
+                if included and not exclude:
+                    result = INCLUDED
+                else:
+                    result = (included, include, exclude)
+
+        if len(self.cache) >= MAX_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[key] = result
+        return result
+
+
+def flatten(data, path_filter=None, prefix=None, sep='.'):
+    """
+    Yields (path, value) for each number in a nested dict, with the path
+    joined by sep and starting with prefix
+    """
+    if path_filter is None:
+        state = INCLUDED
+    else:
+        state = path_filter.start()
+    if prefix:
+        prefix += sep
+    else:
+        prefix = ''
+    # Walked with a stack of the dicts being iterated, rather than recursive
+    # generators passing every value up through each level
+    stack = [(data.iteritems(), state, prefix)]
+    while stack:
+        items, state, prefix = stack[-1]
+        for name, value in items:
+            if state is INCLUDED:
+                child = state
+            else:
+                child = path_filter.step(state, name)
+                if child is None:
+                    continue
+
+            if isinstance(value, dict):
+                stack.append((value.iteritems(), child, prefix + name + sep))
+                break
+            elif isinstance(value, (int, long, float)) and child[0]:
+                yield prefix + name, value
+        else:
+            stack.pop()
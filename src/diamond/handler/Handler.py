@@ -1,9 +1,27 @@
 # coding=utf-8
 
+"""
+The Handler class is a base class for all metric handlers.
+
+Every handler accepts these settings, under [handlers][default] for all
+handlers or in the section of one handler, to only receive some metrics:
+
+ * collectors_whitelist - only metrics from collectors matching one of these
+   patterns, e.g. ^CPUCollector$
+ * collectors_blacklist - no metrics from collectors matching one of these
+ * metrics_whitelist - only metrics whose path matches one of these patterns
+ * metrics_blacklist - no metrics whose path matches one of these patterns
+
+They are regexes as in diamond.metricfilter, and metric paths are matched in
+full, with the path prefix and hostname, e.g. servers.host1.cpu.total.user.
+"""
+
 import logging
 import threading
 import traceback
 
+from diamond.metricfilter import MetricFilter
+
 
 class Handler(object):
     """
@@ -19,6 +37,22 @@ class Handler(object):
         self.config = config
         # Initialize Lock
         self.lock = threading.Lock()
+        # Initialize Routing Rules
+        config = config or {}
+        self.collector_filter = MetricFilter(
+            config.get('collectors_whitelist'),
+            config.get('collectors_blacklist'))
+        self.path_filter = MetricFilter(config.get('metrics_whitelist'),
+                                        config.get('metrics_blacklist'))
+        self.routed = bool(self.collector_filter) or bool(self.path_filter)
+
+    def accepts(self, collector, path):
+        """
+        Returns whether metrics from the named collector with this path
+        should be sent to this handler
+        """
+        return (self.collector_filter.allowed(collector)
+                and self.path_filter.allowed(path))
 
     def _process(self, metric):
         """
@@ -26,6 +26,10 @@ max = 8.5
 name = Free Memory
 path = memory.MemFree
 min = 66020000
+
+Rules are indexed by the literal text their path ends with (15 and MemFree
+above), so a metric is only matched against the rules whose ending it has,
+and the rules matching each metric path are remembered.
 """
 
 __author__ = 'Bruno Clermont'
@@ -39,6 +43,54 @@ from Handler import Handler
 from diamond.collector import get_hostname
 from configobj import Section
 
+# Characters with a meaning in regular expressions
+REGEX_SPECIAL = frozenset('.^$*+?{}[]|()')
+
+# Metric paths whose matching rules are remembered
+MAX_CACHE_SIZE = 100000
+
+
+def is_escaped(pattern, i):
+    """
+    Returns whether the character at i follows an unescaped backslash
+    """
+    escapes = 0
+    while i - escapes > 0 and pattern[i - escapes - 1] == '\\':
+        escapes += 1
+    return escapes % 2 == 1
+
+
+def literal_tail(pattern):
+    """
+    Returns the literal text any string matched by a regular expression
+    ends with, '' if it is not known
+    """
+    if '|' in pattern or re.compile(pattern).flags & (re.I | re.X):
+        return ''
+    tail = []
+    i = len(pattern) - 1
+    while i >= 0:
+        char = pattern[i]
+        if char.isalnum():
+            # Letters and digits are taken a run at a time, as the run may
+            # end an escape such as \d, \x41 or \101
+            start = i
+            while start > 0 and pattern[start - 1].isalnum():
+                start -= 1
+            if is_escaped(pattern, start):
+                break
+            tail.extend(reversed(pattern[start:i + 1]))
+            i = start - 1
+        elif is_escaped(pattern, i):
+            tail.append(char)
+            i -= 2
+        elif char in REGEX_SPECIAL or char == '\\':
+            break
+        else:
+            tail.append(char)
+            i -= 1
+    return ''.join(reversed(tail))
+
 
 class InvalidRule(ValueError):
     """
@@ -165,17 +217,30 @@ class Rule(object):
 
         # compile path regular expression
         self.regexp = re.compile(r'(?P<prefix>.*)\.(?P<path>%s)$' % path)
+        self.tail = literal_tail(path)
+
+    def match(self, path):
+        """
+        match a metric path against the rule
+        @type path: string
+        @param path: metric path
+        @rtype re.MatchObject or None
+        """
+        return self.regexp.match(path)
 
-    def process(self, metric, handler):
+    def process(self, metric, handler, match=None):
         """
         process a single diamond metric
         @type metric: diamond.metric.Metric
         @param metric: metric to process
         @type handler: diamond.handler.sentry.SentryHandler
         @param handler: configured Sentry graphite handler
+        @type match: re.MatchObject
+        @param match: match of the metric path, if already known
         @rtype None
         """
-        match = self.regexp.match(metric.path)
+        if match is None:
+            match = self.match(metric.path)
         if match:
             minimum = Minimum(metric.value, self.min)
             maximum = Maximum(metric.value, self.max)
@@ -214,6 +279,64 @@ class Rule(object):
                                          self.regexp.pattern)
 
 
+class RuleIndex(object):
+    """
+    Alert rules in a trie of the reversed literal endings of their paths
+    """
+
+    def __init__(self, rules):
+        """
+        @type rules: list of Rules
+        """
+        self.rules = rules
+        # each node maps characters to child nodes, and None to the
+        # positions of the rules ending there
+        self.root = {}
+        for position, rule in enumerate(rules):
+            node = self.root
+            for char in reversed(rule.tail):
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(position)
+        self.cache = {}
+
+    def candidates(self, path):
+        """
+        rules whose literal ending the path has
+        @rtype list of Rules
+        """
+        positions = []
+        node = self.root
+        for char in reversed(path):
+            positions.extend(node.get(None, ()))
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            positions.extend(node.get(None, ()))
+        return [self.rules[position] for position in sorted(positions)]
+
+    def matches(self, path):
+        """
+        rules matching a metric path, with their matches
+        @rtype list of (Rule, re.MatchObject)
+        """
+        try:
+            return self.cache[path]
+        except KeyError:
+            pass
+
+        matches = []
+        for rule in self.candidates(path):
+            match = rule.match(path)
+            if match:
+                matches.append((rule, match))
+
+        if len(self.cache) >= MAX_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[path] = matches
+        return matches
+
+
 class SentryHandler(Handler):
     """
     Diamond handler that check if a metric goes too low or too high
@@ -234,6 +357,7 @@ class SentryHandler(Handler):
         self.raven_logger.addHandler(self.sentry_log_handler)
         self.configure_sentry_errors()
         self.rules = self.compile_rules()
+        self.index = RuleIndex(self.rules)
         self.hostname = get_hostname(self.config)
         if not len(self.rules):
             self.log.warning("No rules, this graphite handler is unused")
@@ -317,8 +441,8 @@ class SentryHandler(Handler):
         @param metric: metric to process
         @rtype None
         """
-        for rule in self.rules:
-            rule.process(metric, self)
+        for rule, match in self.index.matches(metric.path):
+            rule.process(metric, self, match)
 
     def __repr__(self):
         return "SentryHandler '%s' %d rules" % (
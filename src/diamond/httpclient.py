@@ -0,0 +1,258 @@
+# coding=utf-8
+
+"""
+A small HTTP client for collectors that poll HTTP endpoints.
+
+Connections are kept alive and shared between all clients in a pool keyed
+by (scheme, host, port), so a collector polling the same server every
+interval reuses its connection instead of opening a new one each time.
+Responses are requested gzipped, basic auth headers are built once per
+client, and fetch_many() fetches several URLs in parallel threads.
+
+Collectors get a client configured from their config with get_client(),
+which reads:
+
+ * http_timeout - seconds before a request fails. Set it under
+   [collectors][default] for all collectors, or per collector.
+ * http_user, http_password - credentials for basic auth
+
+"""
+
+import base64
+import socket
+import httplib
+import threading
+import time
+import urlparse
+import zlib
+
+from diamond.parallel import run_parallel
+
+try:
+    import json
+    json  # workaround for pyflakes issue #13
+except ImportError:
+    import simplejson as json
+
+DEFAULT_TIMEOUT = 10
+
+REDIRECT_CODES = (301, 302, 303, 307)
+
+
+class HTTPError(IOError):
+    """
+    Raised for responses with a status of 400 or more
+    """
+
+    def __init__(self, url, response):
+        IOError.__init__(self, '%s: HTTP %d %s' % (url, response.status,
+                                                   response.reason))
+        self.url = url
+        self.code = response.status
+        self.response = response
+        self.headers = response.headers
+
+
+class HTTPResponse(object):
+
+    def __init__(self, status, reason, headers, body):
+        """
+        headers is a dict with lower case names
+        """
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def readlines(self):
+        return self.body.splitlines(True)
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class ConnectionPool(object):
+    """
+    Idle connections per (scheme, host, port), safe to share between
+    threads
+    """
+
+    def __init__(self, max_idle=4, idle_timeout=60):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, timeout):
+        """
+        Returns (connection, reused) for a key, reusing an idle connection
+        if there is one
+        """
+        now = time.time()
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(key, [])
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    connection.timeout = timeout
+                    try:
+                        if connection.sock is not None:
+                            connection.sock.settimeout(timeout)
+                        return connection, True
+                    except socket.error:
+                        pass
+                connection.close()
+        finally:
+            self.lock.release()
+
+        scheme, host, port = key
+        if scheme == 'https':
+            connection = httplib.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            connection = httplib.HTTPConnection(host, port, timeout=timeout)
+        return connection, False
+
+    def put(self, key, connection):
+        """
+        Return a connection after reading its whole response
+        """
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append((connection, time.time()))
+                return
+        finally:
+            self.lock.release()
+        connection.close()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            for idle in self.idle.itervalues():
+                for connection, last_used in idle:
+                    connection.close()
+            self.idle = {}
+        finally:
+            self.lock.release()
+
+# Shared by all clients unless they are given a pool of their own
+POOL = ConnectionPool()
+
+
+class HTTPClient(object):
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, username=None, password=None,
+                 headers=None, pool=None, max_redirects=5):
+        self.timeout = float(timeout)
+        self.headers = {
+            'Accept-Encoding': 'gzip',
+            'User-Agent': 'Diamond',
+        }
+        if username:
+            self.headers['Authorization'] = 'Basic %s' % base64.b64encode(
+                '%s:%s' % (username, password or ''))
+        if headers:
+            self.headers.update(headers)
+        self.pool = pool or POOL
+        self.max_redirects = max_redirects
+
+    def get(self, url, headers=None, timeout=None):
+        return self.request('GET', url, headers=headers, timeout=timeout)
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Make a request, following redirects. Returns an HTTPResponse, and
+        raises HTTPError for error responses, or IOError (including
+        socket.error) if the server cannot be reached.
+        """
+        if timeout is None:
+            timeout = self.timeout
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+
+        for i in range(self.max_redirects + 1):
+            response = self._request(method, url, body, request_headers,
+                                     timeout)
+            location = response.headers.get('location')
+            if response.status not in REDIRECT_CODES or not location:
+                break
+            url = urlparse.urljoin(url, location)
+            if response.status == 303:
+                method, body = 'GET', None
+
+        if response.status >= 400:
+            raise HTTPError(url, response)
+        return response
+
+    def _request(self, method, url, body, headers, timeout):
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port
+        if port is None:
+            port = 443 if scheme == 'https' else 80
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '%s?%s' % (path, parts.query)
+
+        while True:
+            connection, reused = self.pool.get(key, timeout)
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except socket.timeout:
+                connection.close()
+                raise
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                # The server may have closed an idle connection, so try
+                # once more with a new one
+                if not reused:
+                    raise
+
+        response_headers = dict((k.lower(), v)
+                                for k, v in response.getheaders())
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.put(key, connection)
+
+        if response_headers.get('content-encoding') == 'gzip':
+            try:
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            except zlib.error, e:
+                raise IOError('%s: Cannot decompress response: %s' % (url, e))
+        return HTTPResponse(response.status, response.reason,
+                            response_headers, data)
+
+    def fetch_many(self, urls, max_threads=8, timeout=None):
+        """
+        GET several urls in parallel. Returns a dict of url to an
+        HTTPResponse, or to the exception raised fetching it.
+        """
+        urls = list(urls)
+        responses = run_parallel(lambda url: self.get(url, timeout=timeout),
+                                 urls, max_threads)
+        return dict(zip(urls, responses))
+
+
+def get_client(config, **kwargs):
+    """
+    Returns an HTTPClient configured from the http_* settings of a collector
+    config. kwargs override the config.
+    """
+    options = {
+        'timeout': config.get('http_timeout', DEFAULT_TIMEOUT),
+        'username': config.get('http_user'),
+        'password': config.get('http_password'),
+    }
+    options.update(kwargs)
+    return HTTPClient(**options)
@@ -0,0 +1,67 @@
+# coding=utf-8
+
+"""
+Deciding which metrics to publish by their names.
+
+A MetricFilter compiles lists of regular expressions into one regex each,
+and remembers its decision for every name it has seen, so checking a name a
+collector publishes on every run costs a dictionary lookup. Patterns match
+anywhere in a name unless anchored with ^ and $.
+
+Collectors read them from these settings, under [collectors][default] for
+all collectors or in the section of one collector:
+
+ * metrics_whitelist - only publish metrics matching one of these patterns
+ * metrics_blacklist - never publish metrics matching one of these patterns
+
+The blacklists of both places apply, while a collector's whitelist replaces
+the default one. Names are matched without the path prefix, hostname and
+collector path, e.g. cpu0.user or eth0.rx_bytes.
+"""
+
+import re
+
+# Decisions cached before the cache is cleared
+MAX_CACHE_SIZE = 100000
+
+
+def compile_patterns(patterns):
+    """
+    Returns one regex matching any of a list of patterns (or a single
+    pattern), or None if there are none
+    """
+    if not patterns:
+        return None
+    if isinstance(patterns, basestring):
+        patterns = [patterns]
+    patterns = [p.strip() for p in patterns if p.strip()]
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:%s)' % p for p in patterns))
+
+
+class MetricFilter(object):
+
+    def __init__(self, whitelist=None, blacklist=None):
+        self.whitelist = compile_patterns(whitelist)
+        self.blacklist = compile_patterns(blacklist)
+        self.cache = {}
+
+    def __nonzero__(self):
+        return self.whitelist is not None or self.blacklist is not None
+
+    def allowed(self, name):
+        try:
+            return self.cache[name]
+        except KeyError:
+            pass
+
+        allowed = ((self.whitelist is None
+                    or self.whitelist.search(name) is not None)
+                   and (self.blacklist is None
+                        or self.blacklist.search(name) is None))
+
+        if len(self.cache) >= MAX_CACHE_SIZE:
+            self.cache.clear()
+        self.cache[name] = allowed
+        return allowed
@@ -0,0 +1,172 @@
+# coding=utf-8
+
+"""
+Running a function over many items in a bounded number of threads, for
+collectors that poll several servers and spend most of their time waiting on
+the network.
+
+run_parallel() waits for every call to return. A WorkerPool is for calls
+that may never return, such as statvfs() on a hung NFS mount: callers wait
+for a job only up to a timeout, and a worker left stuck in a call is
+replaced, so the pool keeps its size.
+"""
+
+import Queue
+import threading
+
+
+def run_parallel(func, items, max_threads=8):
+    """
+    Call func(item) for each item from at most max_threads threads. Returns a
+    list with the result for each item, in the order of items, or the
+    exception raised for it.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    if max_threads <= 1 or len(items) <= 1:
+        for i, item in enumerate(items):
+            try:
+                results[i] = func(item)
+            except Exception, e:
+                results[i] = e
+        return results
+
+    pending = range(len(items))
+    pending.reverse()
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            lock.acquire()
+            try:
+                if not pending:
+                    return
+                i = pending.pop()
+            finally:
+                lock.release()
+            try:
+                results[i] = func(items[i])
+            except Exception, e:
+                results[i] = e
+
+    threads = [threading.Thread(target=worker)
+               for i in range(min(max_threads, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class Job(object):
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.event = threading.Event()
+        self.started = False
+        # Set when its caller stopped waiting for it
+        self.abandoned = False
+
+    def done(self):
+        return self.event.isSet()
+
+    def wait(self, timeout):
+        """
+        Returns the result of the job, raising what it raised, or raises
+        JobTimeout if it is not done within timeout seconds
+        """
+        self.event.wait(timeout)
+        if not self.event.isSet():
+            raise JobTimeout('%s did not finish in %s seconds'
+                             % (getattr(self.func, '__name__', self.func),
+                                timeout))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class WorkerPool(object):
+
+    def __init__(self, size=4):
+        self.size = size
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.workers = 0
+
+    def _start_workers(self):
+        self.lock.acquire()
+        try:
+            while self.workers < self.size:
+                self.workers += 1
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.lock.release()
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            self.lock.acquire()
+            try:
+                if job.abandoned:
+                    continue
+                job.started = True
+            finally:
+                self.lock.release()
+
+            try:
+                job.result = job.func(*job.args)
+            except Exception, e:
+                job.error = e
+
+            self.lock.acquire()
+            try:
+                job.event.set()
+                if job.abandoned:
+                    # This worker was replaced when the job was abandoned
+                    return
+            finally:
+                self.lock.release()
+
+    def submit(self, func, *args):
+        """
+        Returns a Job calling func(*args) in a worker
+        """
+        self._start_workers()
+        job = Job(func, args)
+        self.queue.put(job)
+        return job
+
+    def abandon(self, job):
+        """
+        Stop waiting for a job that has not finished, starting a worker in
+        place of the one stuck running it. A job still queued is never run,
+        and is done at once, raising JobTimeout. Returns False if it
+        finished after all.
+        """
+        self.lock.acquire()
+        try:
+            if job.done():
+                return False
+            job.abandoned = True
+            if not job.started:
+                # Left in the queue, and skipped
+                job.error = JobTimeout('%s was abandoned before it started'
+                                       % getattr(job.func, '__name__',
+                                                 job.func))
+                job.event.set()
+                return True
+            self.workers -= 1
+        finally:
+            self.lock.release()
+        self._start_workers()
+        return True
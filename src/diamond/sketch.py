@@ -0,0 +1,125 @@
+# coding=utf-8
+
+"""
+Fixed size, mergeable summaries of streams of values.
+
+HyperLogLog estimates the number of distinct values seen without keeping
+the values themselves, and QuantileSketch estimates quantiles from a
+histogram of logarithmically sized buckets. Both can be merged, so a
+sketch per interval can be combined into sketches over several intervals.
+"""
+
+import math
+import struct
+import hashlib
+
+
+class HyperLogLog(object):
+    """
+    Distinct value counter with a standard error of about
+    1.04 / sqrt(2 ** precision)
+    """
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        if self.size >= 128:
+            alpha = 0.7213 / (1 + 1.079 / self.size)
+        elif self.size == 64:
+            alpha = 0.709
+        elif self.size == 32:
+            alpha = 0.697
+        else:
+            alpha = 0.673
+        self.alpha = alpha * self.size * self.size
+
+    def add(self, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        x = struct.unpack('<Q', hashlib.md5(value).digest()[:8])[0]
+        index = x & (self.size - 1)
+        w = x >> self.precision
+        # Position of the lowest set bit of the remaining hash bits
+        rank = 1
+        max_rank = 64 - self.precision + 1
+        while not w & 1 and rank < max_rank:
+            w >>= 1
+            rank += 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Add the values counted by another sketch of the same precision
+        """
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision')
+        registers = self.registers
+        for i, rank in enumerate(other.registers):
+            if rank > registers[i]:
+                registers[i] = rank
+
+    def count(self):
+        total = 0.0
+        zeros = 0
+        for rank in self.registers:
+            total += 1.0 / (1 << rank)
+            if rank == 0:
+                zeros += 1
+        estimate = self.alpha / total
+        if estimate <= 2.5 * self.size and zeros > 0:
+            # Small range correction (linear counting)
+            estimate = self.size * math.log(float(self.size) / zeros)
+        return int(round(estimate))
+
+
+class QuantileSketch(object):
+    """
+    Quantile estimator for positive values with a relative error of at most
+    relative_accuracy, using buckets whose bounds grow geometrically.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = int(math.ceil(math.log(value) / self.log_gamma))
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge sketches of different accuracy')
+        for key, count in other.buckets.iteritems():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q):
+        """
+        Returns the estimated value at quantile q (0 <= q <= 1), or None if
+        no values were added
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * math.pow(self.gamma, key) / (self.gamma + 1)
+        return 2 * math.pow(self.gamma, max(self.buckets)) / (self.gamma + 1)
@@ -0,0 +1,145 @@
+# coding=utf-8
+
+"""
+A client for the line based text protocols spoken by memcached, beanstalkd
+and similar servers.
+
+A SocketClient keeps its connection open between requests, so a collector
+holding one per server connects once instead of every interval. Responses
+are buffered and read whole, by line, by size, or until the server closes
+the connection, so large responses are never cut off at one recv().
+"""
+
+import socket
+
+DEFAULT_TIMEOUT = 5
+
+# Bytes read from the socket at a time
+READ_SIZE = 65536
+
+
+class SocketClient(object):
+
+    def __init__(self, host, port=None, timeout=DEFAULT_TIMEOUT):
+        """
+        With no port, host is the path of a unix socket
+        """
+        self.host = host
+        self.port = port
+        self.timeout = float(timeout)
+        self.sock = None
+        # Data received, and the position up to which it has been read
+        self.buffer = ''
+        self.pos = 0
+
+    def __str__(self):
+        if self.port is None:
+            return self.host
+        return '%s:%s' % (self.host, self.port)
+
+    def connect(self):
+        self.close()
+        if self.port is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.host
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = (self.host, int(self.port))
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except socket.error:
+            sock.close()
+            raise
+        self.sock = sock
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+        self.sock = None
+        self.buffer = ''
+        self.pos = 0
+
+    def request(self, data, read):
+        """
+        Send data and return read(self), the response read from the client.
+        A connection kept open from an earlier request may have been closed
+        by the server, so the request is tried once more on a new one. The
+        connection is closed if the request fails, as any unread response
+        would be taken for the response to the next request.
+        """
+        while True:
+            reused = self.sock is not None
+            if not reused:
+                self.connect()
+            try:
+                self.send(data)
+                return read(self)
+            except socket.timeout:
+                self.close()
+                raise
+            except socket.error:
+                self.close()
+                if not reused:
+                    raise
+            except:
+                self.close()
+                raise
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def _recv(self):
+        """
+        Read into the buffer. Returns False if the server closed the
+        connection.
+        """
+        data = self.sock.recv(READ_SIZE)
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        self.buffer += data
+        return bool(data)
+
+    def _fill(self):
+        if not self._recv():
+            raise socket.error('Connection closed by %s' % self)
+
+    def read_line(self, terminator='\r\n'):
+        """
+        Returns the next line, without its terminator
+        """
+        start = self.pos
+        while True:
+            end = self.buffer.find(terminator, start)
+            if end != -1:
+                break
+            # Search the new data, and any terminator split between reads
+            searched = max(len(self.buffer) - len(terminator) + 1,
+                           self.pos) - self.pos
+            self._fill()
+            start = self.pos + searched
+        line = self.buffer[self.pos:end]
+        self.pos = end + len(terminator)
+        return line
+
+    def read_exactly(self, size):
+        while len(self.buffer) - self.pos < size:
+            self._fill()
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def read_all(self):
+        """
+        Returns everything up to the server closing the connection, which
+        is then closed
+        """
+        while self._recv():
+            pass
+        data = self.buffer[self.pos:]
+        self.close()
+        return data
@@ -0,0 +1,214 @@
+# coding=utf-8
+
+"""
+Incremental reading of growing log files.
+
+A LogTailer remembers the inode of a file and the offset after the last
+complete line it returned. Each call to read_lines() returns the lines
+appended since the previous call, finishing a rotated file first when it
+can still be found under previous_suffix, and starting again from the top
+of a truncated file. Positions can be saved to a checkpoint file, so a
+restarted collector carries on where it stopped instead of reprocessing or
+skipping lines.
+
+The parsers turn a line into a dict of fields:
+
+    RegexParser  - named (or numbered) groups of a regular expression
+    SplitParser  - fields separated by a fixed string, named by position
+    JsonParser   - the top level keys of a JSON object per line
+"""
+
+import os
+import re
+
+try:
+    import json
+    json  # workaround for pyflakes issue #13
+except ImportError:
+    import simplejson as json
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def load_checkpoints(path):
+    """
+    Returns the positions saved in a checkpoint file, as a dict of
+    log path -> (inode, offset)
+    """
+    try:
+        fp = open(path)
+        try:
+            data = json.load(fp)
+        finally:
+            fp.close()
+    except (IOError, ValueError):
+        return {}
+    positions = {}
+    for log_path, position in data.iteritems():
+        positions[log_path] = (int(position[0]), int(position[1]))
+    return positions
+
+
+def save_checkpoints(path, positions):
+    """
+    Atomically write positions to a checkpoint file
+    """
+    tmp_path = path + '.tmp'
+    fp = open(tmp_path, 'w')
+    try:
+        json.dump(dict((k, list(v)) for k, v in positions.iteritems()), fp)
+    finally:
+        fp.close()
+    os.rename(tmp_path, path)
+
+
+class LogTailer(object):
+
+    def __init__(self, path, previous_suffix='.1', position=None,
+                 from_start=False, block_size=BLOCK_SIZE, log=None):
+        """
+        position is an (inode, offset) tuple to resume from. Without one the
+        first call to read_lines() only notes the end of the file, unless
+        from_start is set.
+        """
+        self.path = path
+        self.previous_suffix = previous_suffix
+        self.position = position
+        self.from_start = from_start
+        self.block_size = block_size
+        self.log = log
+
+    def read_from(self, path, offset):
+        """
+        Yield the complete lines of path from offset, reading large blocks.
+        Returns the offset after the last complete line in self.offset.
+        """
+        self.offset = offset
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            remainder = ''
+            while True:
+                block = os.read(fd, self.block_size)
+                if not block:
+                    break
+                lines = (remainder + block).split('\n')
+                # The last element is a partially written line, or ''
+                remainder = lines.pop()
+                for line in lines:
+                    self.offset += len(line) + 1
+                    yield line
+        finally:
+            os.close(fd)
+
+    def read_lines(self):
+        """
+        Yield the lines (without line endings) added since the last call
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError, e:
+            if self.log:
+                self.log.error("Cannot find log %s: %s", self.path, e)
+            return
+
+        if self.position is None:
+            if not self.from_start:
+                self.position = (st.st_ino, st.st_size)
+                return
+            self.position = (st.st_ino, 0)
+
+        inode, offset = self.position
+        if inode != st.st_ino:
+            # The file rolled over. Finish the previous file if it is the
+            # one we were reading.
+            if self.previous_suffix:
+                previous = self.path + self.previous_suffix
+                try:
+                    if os.stat(previous).st_ino == inode:
+                        for line in self.read_from(previous, offset):
+                            yield line
+                except OSError, e:
+                    if self.log:
+                        self.log.info("Cannot read previous log %s: %s",
+                                      previous, e)
+            offset = 0
+        elif offset > st.st_size:
+            if self.log:
+                self.log.info("Log %s was truncated", self.path)
+            offset = 0
+
+        self.position = (st.st_ino, offset)
+        for line in self.read_from(self.path, offset):
+            yield line
+            self.position = (st.st_ino, self.offset)
+
+
+class RegexParser(object):
+    """
+    Fields are the named groups of the regex, or the numbered groups
+    (as strings starting at '0') if it has no named groups
+    """
+
+    def __init__(self, regex):
+        self.regex = re.compile(regex)
+        self.names = None
+        if not self.regex.groupindex:
+            self.names = [str(i) for i in range(self.regex.groups)]
+
+    def parse(self, line):
+        m = self.regex.match(line)
+        if m is None:
+            return None
+        if self.names is None:
+            return m.groupdict()
+        return dict(zip(self.names, m.groups()))
+
+
+class SplitParser(object):
+    """
+    Fields are named by the names list, or by their position (as strings
+    starting at '0') if no names are given
+    """
+
+    def __init__(self, separator=None, names=None):
+        self.separator = separator or None
+        self.names = names
+
+    def parse(self, line):
+        values = line.split(self.separator)
+        if self.names is None:
+            return dict((str(i), v) for i, v in enumerate(values))
+        if len(values) < len(self.names):
+            return None
+        return dict(zip(self.names, values))
+
+
+class JsonParser(object):
+
+    def parse(self, line):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        return data
+
+
+def get_parser(config):
+    """
+    Create a parser from a config section with a 'parser' key of regex,
+    split or json
+    """
+    parser = config.get('parser', 'regex')
+    if parser == 'regex':
+        return RegexParser(config['regex'])
+    if parser == 'split':
+        names = config.get('fields') or None
+        if isinstance(names, basestring):
+            names = names.split()
+        return SplitParser(config.get('separator'), names)
+    if parser == 'json':
+        return JsonParser()
+    raise ValueError('Unknown log parser: %s' % parser)
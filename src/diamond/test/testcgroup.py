@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import errno
+import os
+import shutil
+import tempfile
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+from diamond.cgroup import CgroupTree
+
+
+class CgroupTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp() + '/'
+        for i in range(30):
+            path = os.path.join(self.root, 'group%d' % i)
+            os.mkdir(path)
+            self.write(path, 'memory.stat', 'cache %d\n' % i)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, filename, data):
+        fp = open(os.path.join(path, filename), 'w')
+        fp.write(data)
+        fp.close()
+
+    def test_should_keep_at_most_max_handles_open(self):
+        tree = CgroupTree(self.root, ['memory.stat'], max_handles=10)
+        cgroups = tree.get_cgroups()
+        self.assertEquals(len(cgroups), 30)
+        for run in range(2):
+            for i in range(30):
+                self.assertEquals(tree.read('group%d' % i, 'memory.stat'),
+                                  'cache %d\n' % i)
+                self.assertTrue(len(tree.handles) <= 10)
+
+        # The most recently read files are still open
+        self.assertTrue(os.path.join(self.root, 'group29', 'memory.stat')
+                        in tree.handles)
+        self.write(os.path.join(self.root, 'group29'), 'memory.stat',
+                   'cache 42\n')
+        self.assertEquals(tree.read('group29', 'memory.stat'), 'cache 42\n')
+
+    def test_should_forget_removed_cgroups(self):
+        tree = CgroupTree(self.root, ['memory.stat'], max_handles=0)
+        tree.get_cgroups()
+        self.assertEquals(tree.read('group1', 'memory.stat'), 'cache 1\n')
+        self.assertEquals(tree.handles, {})
+
+        shutil.rmtree(os.path.join(self.root, 'group1'))
+        self.assertEquals(tree.read('group1', 'memory.stat'), None)
+        self.assertFalse('group1' in tree.cgroups)
+
+    def test_should_keep_cgroups_on_other_errors(self):
+        tree = CgroupTree(self.root, ['memory.stat'])
+        tree.get_cgroups()
+        with patch('__builtin__.open', Mock(
+                side_effect=IOError(errno.EMFILE, 'Too many open files'))):
+            self.assertEquals(tree.read('group1', 'memory.stat'), None)
+        self.assertTrue('group1' in tree.cgroups)
+        self.assertEquals(tree.read('group1', 'memory.stat'), 'cache 1\n')
+
+    def test_should_fall_back_to_reopening_files(self):
+        tree = CgroupTree(self.root, ['memory.stat'])
+        tree.get_cgroups()
+        path = os.path.join(self.root, 'group1', 'memory.stat')
+        handle = Mock()
+        handle.seek.side_effect = IOError(errno.EIO, 'I/O error')
+        tree.handles[path] = handle
+
+        self.assertEquals(tree.read('group1', 'memory.stat'), 'cache 1\n')
+        self.assertTrue(handle.close.called)
+        self.assertFalse(path in tree.handles)
+        self.assertTrue('group1' in tree.cgroups)
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
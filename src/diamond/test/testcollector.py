@@ -3,9 +3,22 @@
 ################################################################################
 
 from test import unittest
+from mock import Mock
+from mock import patch
 import configobj
 
 from diamond.collector import Collector
+from diamond.counterstore import CounterStore
+from diamond.handler.Handler import Handler
+
+
+def get_config(default):
+    config = configobj.ConfigObj()
+    config['server'] = {}
+    config['server']['collectors_config_path'] = ''
+    config['collectors'] = {}
+    config['collectors']['default'] = default
+    return config
 
 
 class BaseCollectorTest(unittest.TestCase):
@@ -20,3 +33,109 @@ class BaseCollectorTest(unittest.TestCase):
         }
         c = Collector(config, [])
         self.assertEquals('custom.localhost', c.get_hostname())
+
+    def test_counter_ttl_is_at_least_two_intervals(self):
+        c = Collector(get_config({'interval': 600, 'counter_ttl': 60}), [])
+        self.assertEquals(1200, c.last_values.ttl)
+
+    def test_derivative_forgets_expired_counters(self):
+        c = Collector(get_config({'interval': 10, 'counter_ttl': 60}), [])
+        c.derivative('foo', 10)
+        self.assertEquals(1, c.derivative('foo', 20))
+
+        with patch('time.time', lambda: 10 ** 12):
+            c.last_values.expire()
+        self.assertEquals(0, len(c.last_values))
+        self.assertEquals(1, c.last_values.pop_evictions())
+        self.assertEquals(0, c.derivative('foo', 30))
+
+    @patch.object(Collector, 'publish_metric')
+    def test_should_filter_metric_names(self, publish_metric):
+        config = get_config({
+            'hostname': 'host',
+            'metrics_blacklist': '^cpu[0-9]+\\.',
+        })
+        config['collectors']['Collector'] = {
+            'metrics_whitelist': ['^cpu', '^total$'],
+            'metrics_blacklist': 'idle$',
+        }
+        c = Collector(config, [])
+        for name in ('cpu.user', 'cpu.idle', 'cpu0.user', 'total',
+                     'total.user', 'cpu.user'):
+            c.publish(name, 1)
+        self.assertEquals([call[0][0].path
+                           for call in publish_metric.call_args_list],
+                          ['servers.host.Collector.cpu.user',
+                           'servers.host.Collector.total',
+                           'servers.host.Collector.cpu.user'])
+        self.assertEquals(c.metric_filter.cache['cpu0.user'], False)
+
+    def test_no_metric_filter_by_default(self):
+        c = Collector(get_config({}), [])
+        self.assertEquals(c.metric_filter, None)
+
+    def test_should_route_metrics_to_matching_handlers(self):
+        config = get_config({'hostname': 'host'})
+        everything = Handler()
+        cpu_only = Handler({'metrics_whitelist': '\\.cpu\\.'})
+        not_idle = Handler({'collectors_blacklist': '^OtherCollector$',
+                            'metrics_blacklist': 'idle$'})
+        other_only = Handler({'collectors_whitelist': '^OtherCollector$'})
+        handlers = [everything, cpu_only, not_idle, other_only]
+        for handler in handlers:
+            handler.process = Mock()
+
+        c = Collector(config, handlers)
+        for name in ('cpu.user', 'cpu.idle', 'memory.free', 'cpu.user'):
+            c.publish(name, 1)
+
+        def published(handler):
+            return [call[0][0].path for call in handler.process.call_args_list]
+
+        self.assertEquals(published(everything),
+                          ['servers.host.Collector.cpu.user',
+                           'servers.host.Collector.cpu.idle',
+                           'servers.host.Collector.memory.free',
+                           'servers.host.Collector.cpu.user'])
+        self.assertEquals(published(cpu_only),
+                          ['servers.host.Collector.cpu.user',
+                           'servers.host.Collector.cpu.idle',
+                           'servers.host.Collector.cpu.user'])
+        self.assertEquals(published(not_idle),
+                          ['servers.host.Collector.cpu.user',
+                           'servers.host.Collector.memory.free',
+                           'servers.host.Collector.cpu.user'])
+        self.assertEquals(published(other_only), [])
+        self.assertEquals(c.routes['servers.host.Collector.cpu.idle'],
+                          [everything, cpu_only])
+
+    def test_should_not_copy_handlers_without_routing_rules(self):
+        handler = Handler()
+        handler.process = Mock()
+        c = Collector(get_config({}), [handler])
+        c.publish('cpu.user', 1)
+        self.assertEquals(handler.process.call_count, 1)
+        self.assertTrue(c.routes.values()[0] is c.handlers)
+
+
+class CounterStoreTest(unittest.TestCase):
+
+    def test_evicts_least_recently_updated_when_full(self):
+        store = CounterStore(max_size=20)
+        for i in range(20):
+            with patch('time.time', lambda: i):
+                store['key%d' % i] = i
+        store['key20'] = 20
+
+        self.assertEquals(19, len(store))
+        self.assertFalse('key0' in store)
+        self.assertFalse('key1' in store)
+        self.assertTrue('key2' in store)
+        self.assertEquals(2, store.pop_evictions())
+        self.assertEquals(0, store.pop_evictions())
+
+    def test_no_ttl_never_expires(self):
+        store = CounterStore()
+        store['foo'] = 1
+        store.expire(now=10 ** 12)
+        self.assertEquals(1, store['foo'])
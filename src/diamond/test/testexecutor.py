@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import threading
+import time
+
+from test import unittest
+from mock import patch
+
+from diamond.executor import CommandTimeout, Executor
+
+
+class ExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = Executor(max_processes=2)
+
+    def test_should_run_commands(self):
+        result = self.executor.run(['sh', '-c', 'echo out; echo err >&2;'
+                                    ' exit 3'])
+        self.assertEquals(result.returncode, 3)
+        self.assertEquals(result.stdout, 'out\n')
+        self.assertEquals(result.stderr, 'err\n')
+        self.assertFalse(result.cached)
+
+    def test_should_raise_for_missing_commands(self):
+        self.assertRaises(OSError, self.executor.run,
+                          ['/nonexistent/command'])
+
+    def test_should_kill_process_group_on_timeout(self):
+        start = time.time()
+        # The background sleep keeps stdout open after sh is killed
+        self.assertRaises(CommandTimeout, self.executor.run,
+                          ['sh', '-c', 'sleep 30 & sleep 30'], timeout=0.2)
+        self.assertTrue(time.time() - start < 5)
+
+    def test_should_cache_results(self):
+        command = ['sh', '-c', 'echo $$']
+        first = self.executor.run(command, cache_ttl=60)
+        second = self.executor.run(command, cache_ttl=60)
+        self.assertTrue(second.cached)
+        self.assertEquals(first.stdout, second.stdout)
+        self.assertNotEquals(self.executor.run(command).stdout, first.stdout)
+
+    def test_should_limit_concurrent_commands(self):
+        lock = threading.Lock()
+        running = [0, 0]
+        run = self.executor._run
+
+        def counting_run(command, timeout):
+            lock.acquire()
+            running[0] += 1
+            running[1] = max(running)
+            lock.release()
+            try:
+                return run(command, timeout)
+            finally:
+                lock.acquire()
+                running[0] -= 1
+                lock.release()
+
+        threads = []
+        with patch.object(self.executor, '_run', counting_run):
+            for i in range(6):
+                thread = threading.Thread(target=self.executor.run,
+                                          args=(['sleep', '0.05'],))
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+        self.assertEquals(running[1], 2)
+
+    @patch('os.geteuid')
+    def test_should_only_use_sudo_when_not_root(self, geteuid):
+        geteuid.return_value = 0
+        self.assertEquals(self.executor.sudo_command(['ls'], 'sudo'),
+                          ['ls'])
+        geteuid.return_value = 1000
+        self.assertEquals(self.executor.sudo_command(['ls'], 'sudo'),
+                          ['sudo', '-n', 'ls'])
+        with patch.object(self.executor, 'run') as run:
+            self.executor.sudo_command(['ls'], 'sudo', 'warm')
+            self.executor.sudo_command(['ls'], 'sudo', 'warm')
+        self.assertEquals(run.call_count, 1)
+        self.assertEquals(run.call_args[0][0], ['sudo', '-n', '-v'])
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+from test import unittest
+
+from diamond.flatten import PathFilter, flatten
+
+DOCUMENT = {
+    'jvm': {
+        'mem': {'heap_used': 10, 'heap_max': 20, 'pools': {'young': 1}},
+        'threads': {'count': 5},
+        'version': '1.7',
+    },
+    'thread_pool': {
+        'search': {'queue': 1, 'active': 2},
+        'index': {'queue': 3, 'active': 4},
+    },
+    'indices': {'docs': {'count': 6, 'deleted': 7}},
+    'list': [1, 2],
+}
+
+
+class FlattenTest(unittest.TestCase):
+
+    def flatten(self, include=None, exclude=None, **kwargs):
+        return dict(flatten(DOCUMENT, PathFilter(include, exclude),
+                            **kwargs))
+
+    def test_should_flatten_numbers(self):
+        result = dict(flatten(DOCUMENT))
+        self.assertEquals(len(result), 10)
+        self.assertEquals(result['jvm.mem.pools.young'], 1)
+        self.assertEquals(result['indices.docs.count'], 6)
+        self.assertFalse('jvm.version' in result)
+
+    def test_should_prefix(self):
+        result = dict(flatten({'a': {'b': 1}}, prefix='x', sep=':'))
+        self.assertEquals(result, {'x:a:b': 1})
+
+    def test_should_include_subtrees(self):
+        self.assertEquals(self.flatten(include=['indices']),
+                          {'indices.docs.count': 6,
+                           'indices.docs.deleted': 7})
+
+    def test_should_match_globs_per_segment(self):
+        self.assertEquals(self.flatten(include=['jvm.mem.*']),
+                          {'jvm.mem.heap_used': 10,
+                           'jvm.mem.heap_max': 20,
+                           'jvm.mem.pools.young': 1})
+        self.assertEquals(self.flatten(include='thread_pool.*.queue'),
+                          {'thread_pool.search.queue': 1,
+                           'thread_pool.index.queue': 3})
+
+    def test_should_match_any_depth(self):
+        self.assertEquals(self.flatten(include=['**.count']),
+                          {'jvm.threads.count': 5,
+                           'indices.docs.count': 6})
+
+    def test_should_exclude_subtrees(self):
+        result = self.flatten(exclude=['jvm', 'thread_pool.*.active'])
+        self.assertEquals(result, {'thread_pool.search.queue': 1,
+                                   'thread_pool.index.queue': 3,
+                                   'indices.docs.count': 6,
+                                   'indices.docs.deleted': 7})
+
+    def test_should_exclude_from_includes(self):
+        result = self.flatten(include=['jvm'], exclude=['**.pools'])
+        self.assertEquals(result, {'jvm.mem.heap_used': 10,
+                                   'jvm.mem.heap_max': 20,
+                                   'jvm.threads.count': 5})
+
+    def test_should_not_visit_pruned_subtrees(self):
+        path_filter = PathFilter(include=['jvm.threads'])
+        list(flatten(DOCUMENT, path_filter))
+        names = set(name for state, name in path_filter.cache)
+        self.assertFalse('heap_used' in names)
+        self.assertFalse('search' in names)
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
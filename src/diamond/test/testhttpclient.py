@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import gzip
+import threading
+import SocketServer
+import BaseHTTPServer
+from StringIO import StringIO
+
+from test import unittest
+
+from diamond.httpclient import ConnectionPool, HTTPClient, HTTPError
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers),
+                                     self.client_address))
+        headers = {}
+        status = 200
+        body = 'hello %s' % self.path
+        if self.path == '/redirect':
+            status = 302
+            headers['Location'] = '/target'
+        elif self.path == '/missing':
+            status = 404
+        elif self.path == '/gzip':
+            data = StringIO()
+            f = gzip.GzipFile(fileobj=data, mode='w')
+            f.write(body)
+            f.close()
+            body = data.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+
+        self.send_response(status)
+        headers['Content-Length'] = str(len(body))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class HTTPClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.pool = ConnectionPool()
+        self.client = HTTPClient(timeout=5, pool=self.pool)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_should_reuse_connections(self):
+        for i in range(3):
+            self.assertEquals(self.client.get(self.url + '/a').read(),
+                              'hello /a')
+        ports = set(r[2] for r in self.server.requests)
+        self.assertEquals(len(self.server.requests), 3)
+        self.assertEquals(len(ports), 1)
+
+    def test_should_retry_closed_idle_connections(self):
+        self.client.get(self.url + '/a')
+        for connection, last_used in self.pool.idle.values()[0]:
+            connection.sock.close()
+        self.assertEquals(self.client.get(self.url + '/b').read(), 'hello /b')
+
+    def test_should_decompress_gzip(self):
+        self.assertEquals(self.client.get(self.url + '/gzip').read(),
+                          'hello /gzip')
+        self.assertEquals(self.server.requests[0][1]['accept-encoding'],
+                          'gzip')
+
+    def test_should_send_basic_auth(self):
+        client = HTTPClient(username='admin', password='secret',
+                            pool=self.pool)
+        client.get(self.url + '/a')
+        self.assertEquals(self.server.requests[0][1]['authorization'],
+                          'Basic YWRtaW46c2VjcmV0')
+
+    def test_should_follow_redirects(self):
+        response = self.client.get(self.url + '/redirect')
+        self.assertEquals(response.read(), 'hello /target')
+
+    def test_should_raise_for_errors(self):
+        try:
+            self.client.get(self.url + '/missing')
+        except HTTPError, e:
+            self.assertEquals(e.code, 404)
+        else:
+            self.fail('HTTPError not raised')
+
+    def test_should_fetch_many(self):
+        urls = [self.url + '/%d' % i for i in range(10)]
+        urls.append('http://127.0.0.1:1/')
+        results = self.client.fetch_many(urls, max_threads=4)
+        for i in range(10):
+            self.assertEquals(results[urls[i]].read(), 'hello /%d' % i)
+        self.assertTrue(isinstance(results['http://127.0.0.1:1/'], IOError))
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
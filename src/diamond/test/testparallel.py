@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import threading
+import time
+
+from test import unittest
+
+from diamond.parallel import JobTimeout, WorkerPool, run_parallel
+
+
+class ParallelTest(unittest.TestCase):
+
+    def test_should_keep_order_and_return_exceptions(self):
+        def func(item):
+            if item == 3:
+                raise ValueError(item)
+            return item * 2
+
+        for max_threads in (1, 4):
+            results = run_parallel(func, range(6), max_threads)
+            self.assertEquals(results[:3], [0, 2, 4])
+            self.assertTrue(isinstance(results[3], ValueError))
+            self.assertEquals(results[4:], [8, 10])
+
+    def test_should_bound_threads(self):
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def func(item):
+            lock.acquire()
+            running[0] += 1
+            running[1] = max(running)
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+
+        run_parallel(func, range(12), max_threads=3)
+        self.assertTrue(1 < running[1] <= 3)
+
+    def test_should_replace_stuck_workers(self):
+        pool = WorkerPool(size=1)
+        hung = threading.Event()
+        stuck = pool.submit(hung.wait, 5)
+        self.assertRaises(JobTimeout, stuck.wait, 0.05)
+
+        # Queued behind the stuck job until it is abandoned
+        job = pool.submit(lambda x: x * 2, 21)
+        self.assertRaises(JobTimeout, job.wait, 0.05)
+        self.assertTrue(pool.abandon(stuck))
+        self.assertEquals(job.wait(5), 42)
+
+        hung.set()
+        stuck.wait(5)
+        self.assertEquals(pool.workers, 1)
+        self.assertFalse(pool.abandon(stuck))
+
+    def test_should_finish_jobs_abandoned_while_queued(self):
+        pool = WorkerPool(size=1)
+        slow = pool.submit(time.sleep, 0.5)
+        queued = pool.submit(lambda x: x * 2, 21)
+        self.assertRaises(JobTimeout, slow.wait, 0.1)
+        self.assertRaises(JobTimeout, queued.wait, 0)
+        self.assertTrue(pool.abandon(queued))
+        self.assertTrue(queued.done())
+        self.assertFalse(queued.started)
+        self.assertRaises(JobTimeout, queued.wait, 0)
+
+        self.assertTrue(pool.abandon(slow))
+        slow.wait(5)
+        self.assertFalse(queued.started)
+        self.assertFalse(pool.abandon(queued))
+
+    def test_should_raise_job_errors(self):
+        pool = WorkerPool(size=2)
+        job = pool.submit(int, 'x')
+        self.assertRaises(ValueError, job.wait, 5)
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
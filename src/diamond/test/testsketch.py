@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+from test import unittest
+
+from diamond.sketch import HyperLogLog, QuantileSketch
+
+
+class HyperLogLogTest(unittest.TestCase):
+
+    def test_small_counts_are_exact(self):
+        sketch = HyperLogLog()
+        for i in range(100):
+            sketch.add('session%d' % (i % 10))
+        self.assertEquals(10, sketch.count())
+
+    def test_large_counts_are_within_error(self):
+        sketch = HyperLogLog()
+        for i in range(50000):
+            sketch.add('session%d' % i)
+        self.assertTrue(abs(sketch.count() - 50000) < 50000 * 0.05)
+
+    def test_merge_counts_union(self):
+        a = HyperLogLog()
+        b = HyperLogLog()
+        for i in range(1000):
+            a.add('session%d' % i)
+            b.add('session%d' % (i + 500))
+        a.merge(b)
+        self.assertTrue(abs(a.count() - 1500) < 1500 * 0.05)
+
+    def test_merge_requires_same_precision(self):
+        self.assertRaises(ValueError, HyperLogLog(10).merge, HyperLogLog(12))
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_empty_sketch_has_no_quantiles(self):
+        self.assertEquals(None, QuantileSketch().quantile(0.5))
+
+    def test_quantiles_are_within_relative_accuracy(self):
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for i in range(1, 1001):
+            sketch.add(i / 1000.0)
+
+        for q in (0.5, 0.95, 0.99):
+            expected = (q * 999 + 1) / 1000.0
+            self.assertAlmostEqual(expected, sketch.quantile(q),
+                                   delta=expected * 0.01)
+
+    def test_merge(self):
+        a = QuantileSketch()
+        b = QuantileSketch()
+        for i in range(100):
+            a.add(0)
+            b.add(10)
+        a.merge(b)
+        self.assertEquals(200, a.count)
+        self.assertEquals(0, a.quantile(0.25))
+        self.assertAlmostEqual(10, a.quantile(0.75), delta=0.1)
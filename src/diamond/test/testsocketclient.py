@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# coding=utf-8
+################################################################################
+
+import socket
+import threading
+import SocketServer
+
+from test import unittest
+
+from diamond.socketclient import SocketClient
+
+
+class Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        self.server.connections += 1
+        while True:
+            line = self.rfile.readline().strip()
+            if not line:
+                return
+            if line == 'stats':
+                # Sent in pieces, splitting lines and terminators
+                data = 'STAT a 1\r\nSTAT b 2\r\nEND\r\n'
+                for i in range(0, len(data), 3):
+                    self.wfile.write(data[i:i + 3])
+                    self.wfile.flush()
+            elif line == 'big':
+                self.wfile.write('x' * 200000 + '\r\n')
+            elif line == 'close':
+                self.wfile.write('bye')
+                return
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SocketClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.connections = 0
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = SocketClient('127.0.0.1', self.server.server_address[1],
+                                   timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def read_stats(self, client):
+        lines = []
+        while True:
+            line = client.read_line()
+            if line == 'END':
+                return lines
+            lines.append(line)
+
+    def test_should_read_lines_and_reuse_connection(self):
+        for i in range(3):
+            self.assertEquals(self.client.request('stats\r\n',
+                                                  self.read_stats),
+                              ['STAT a 1', 'STAT b 2'])
+        self.assertEquals(self.server.connections, 1)
+
+    def test_should_read_pipelined_responses(self):
+        def read(client):
+            return self.read_stats(client), self.read_stats(client)
+        self.assertEquals(self.client.request('stats\r\nstats\r\n', read),
+                          (['STAT a 1', 'STAT b 2'],
+                           ['STAT a 1', 'STAT b 2']))
+
+    def test_should_read_large_responses(self):
+        self.assertEquals(len(self.client.request('big\r\n',
+                                                  SocketClient.read_line)),
+                          200000)
+
+    def test_should_read_until_closed(self):
+        self.assertEquals(self.client.request('close\r\n',
+                                              SocketClient.read_all), 'bye')
+        self.assertEquals(self.client.sock, None)
+
+    def test_should_retry_closed_connections(self):
+        self.client.request('stats\r\n', self.read_stats)
+        self.client.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEquals(self.client.request('stats\r\n', self.read_stats),
+                          ['STAT a 1', 'STAT b 2'])
+        self.assertEquals(self.server.connections, 2)
+
+    def test_should_raise_when_unreachable(self):
+        client = SocketClient('127.0.0.1', 1)
+        self.assertRaises(socket.error, client.request, 'stats\r\n',
+                          self.read_stats)
+
+################################################################################
+if __name__ == "__main__":
+    unittest.main()
@@ -34,6 +34,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
                                              'src', 'collectors')))
 
+from diamond.httpclient import HTTPResponse
+
 
 def run_only(func, predicate):
     if predicate():
@@ -115,6 +117,13 @@ class CollectorTestCase(unittest.TestCase):
         finally:
             f.close()
 
+    def getResponse(self, fixture_name, status=200, headers=None):
+        """
+        An HTTPResponse for diamond.httpclient with a fixture as its body
+        """
+        return HTTPResponse(status, 'OK', headers or {},
+                            self.getFixture(fixture_name).getvalue())
+
     def getPickledResults(self, results_name):
         try:
             f = open(self.getFixturePath(results_name), 'r')